@@ -0,0 +1,37 @@
+from django.contrib import admin, messages
+from django.db import transaction
+from .models import DeadJob, Job
+from .queue import enqueue
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'queue', 'status', 'run_at', 'attempts', 'max_attempts', 'locked_by')
+    list_filter = ('status', 'queue', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = ('attempts', 'last_error', 'locked_by', 'locked_at', 'created_at')
+    list_per_page = 50
+
+
+@admin.register(DeadJob)
+class DeadJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'queue', 'attempts', 'created_at', 'failed_at')
+    list_filter = ('queue', 'name', 'failed_at')
+    search_fields = ('name', 'error')
+    readonly_fields = (
+        'name', 'queue', 'args', 'kwargs', 'attempts', 'max_attempts', 'error', 'created_at', 'failed_at',
+    )
+    list_per_page = 50
+    actions = ['requeue']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Вернуть в очередь')
+    def requeue(self, request, queryset):
+        with transaction.atomic():
+            dead = list(queryset)
+            for job in dead:
+                enqueue(job.name, job.args, job.kwargs, queue=job.queue, max_attempts=job.max_attempts)
+            queryset.delete()
+        self.message_user(request, f'Заданий возвращено в очередь: {len(dead)}', messages.SUCCESS)
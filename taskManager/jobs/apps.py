@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobs'
+    verbose_name = 'Фоновые задания'
+
+    def ready(self):
+        # Задания регистрируются декоратором @job в модулях <приложение>/jobs.py
+        autodiscover_modules('jobs')
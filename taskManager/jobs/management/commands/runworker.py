@@ -0,0 +1,64 @@
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from jobs.worker import Worker
+
+# Кэши, содержимое которых видно только своему процессу
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задания из очереди в базе данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Сколько заданий выполняется одновременно (потоков)',
+        )
+        parser.add_argument(
+            '--queues', default='',
+            help='Очереди через запятую (по умолчанию - все)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=None,
+            help='Пауза в секундах, когда очередь пуста (по умолчанию JOBS_POLL_INTERVAL)',
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выполнить готовые задания и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        # Задания сбрасывают версии в кэше (доступ к проектам, фрагменты); исполнитель - всегда
+        # отдельный процесс, и с кэшем в его памяти веб-процессы сброса не увидят
+        backend = settings.CACHES['default']['BACKEND']
+        if backend in PROCESS_LOCAL_CACHES:
+            raise CommandError(
+                f'Кэш {backend} не общий для процессов: изменения из заданий не дойдут до сайта. '
+                'Задайте CACHE_BACKEND (например, django.core.cache.backends.db.DatabaseCache)'
+            )
+        queues = [name.strip() for name in options['queues'].split(',') if name.strip()]
+        worker = Worker(
+            queues=queues,
+            concurrency=max(options['concurrency'], 1),
+            poll_interval=options['poll_interval'],
+        )
+
+        # Остановка по SIGTERM (docker stop) и Ctrl+C: текущие задания доделываются
+        def stop(signum, frame):
+            self.stdout.write('Остановка: доделываем текущие задания...')
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(
+            f'Исполнитель {worker.id}: очереди {", ".join(queues) or "все"}, потоков {worker.concurrency}'
+        )
+        worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: выполнено заданий {worker.processed}, с ошибкой {worker.failed}'
+        ))
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Задание')),
+                ('queue', models.CharField(max_length=50, verbose_name='Очередь')),
+                ('args', models.JSONField(default=list)),
+                ('kwargs', models.JSONField(default=dict)),
+                ('attempts', models.PositiveIntegerField(verbose_name='Попыток')),
+                ('max_attempts', models.PositiveIntegerField(verbose_name='Максимум попыток')),
+                ('error', models.TextField(verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(verbose_name='Поставлено')),
+                ('failed_at', models.DateTimeField(auto_now_add=True, verbose_name='Отброшено')),
+            ],
+            options={
+                'verbose_name': 'Отброшенное задание',
+                'verbose_name_plural': 'Отброшенные задания',
+                'ordering': ['-failed_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Задание')),
+                ('queue', models.CharField(default='default', max_length=50, verbose_name='Очередь')),
+                ('args', models.JSONField(default=list)),
+                ('kwargs', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется')], default='queued', max_length=10, verbose_name='Статус')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Запуск')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('max_attempts', models.PositiveIntegerField(default=5, verbose_name='Максимум попыток')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='Исполнитель')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в работу')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Задание',
+                'verbose_name_plural': 'Задания',
+                'ordering': ['run_at', 'id'],
+                'indexes': [models.Index(fields=['status', 'queue', 'run_at'], name='job_claim_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    Задание в очереди (см. jobs/queue.py).
+    Выполненные задания удаляются, исчерпавшие попытки - переносятся в DeadJob.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+    ]
+
+    name = models.CharField('Задание', max_length=200)
+    queue = models.CharField('Очередь', max_length=50, default='default')
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField('Статус', max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    # Не раньше этого времени: отложенные задания и повторы после ошибки
+    run_at = models.DateTimeField('Запуск', default=timezone.now)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Максимум попыток', default=5)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    locked_by = models.CharField('Исполнитель', max_length=100, blank=True)
+    locked_at = models.DateTimeField('Взято в работу', null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Задание'
+        verbose_name_plural = 'Задания'
+        ordering = ['run_at', 'id']
+        indexes = [
+            # Выбор следующего задания: status = queued AND queue IN (...) AND run_at <= now
+            models.Index(fields=['status', 'queue', 'run_at'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+
+class DeadJob(models.Model):
+    """Задания, которые не выполнились за max_attempts попыток (или неизвестные)"""
+    name = models.CharField('Задание', max_length=200)
+    queue = models.CharField('Очередь', max_length=50)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    attempts = models.PositiveIntegerField('Попыток')
+    max_attempts = models.PositiveIntegerField('Максимум попыток')
+    error = models.TextField('Ошибка')
+    created_at = models.DateTimeField('Поставлено')
+    failed_at = models.DateTimeField('Отброшено', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Отброшенное задание'
+        verbose_name_plural = 'Отброшенные задания'
+        ordering = ['-failed_at']
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
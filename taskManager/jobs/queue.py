@@ -0,0 +1,184 @@
+"""
+Очередь фоновых заданий в основной базе данных.
+
+Задание - функция, помеченная @job в модуле <приложение>/jobs.py:
+
+    @job(max_attempts=3)
+    def rebuild_stats(project_ids): ...
+
+    rebuild_stats.delay([1, 2])                           # как можно скорее
+    rebuild_stats.schedule(timedelta(minutes=5), [1, 2])  # отложенно
+
+Аргументы хранятся в JSON, поэтому передаются ID, а не объекты. Строка Job
+создаётся в текущей транзакции: если запрос откатится, задание тоже исчезнет,
+а исполнитель не увидит его раньше коммита данных, которые ему нужны.
+
+Исполнитель (manage.py runworker) берёт задания так, чтобы одно задание не
+досталось двоим: в PostgreSQL - SELECT ... FOR UPDATE SKIP LOCKED, в SQLite
+(блокировки строк нет, запись и так сериализуется блокировкой файла) - условным
+UPDATE ... WHERE status = 'queued': задание получает тот, чей UPDATE его изменил.
+
+Функция задания выполняется в транзакции вместе с удалением строки Job, так что
+при ошибке её изменения откатываются, и повтор начинается с чистого листа.
+Гарантия - «хотя бы один раз»: задания должны быть идемпотентными.
+Повторы идут с экспоненциальной задержкой, после max_attempts задание переносится
+в DeadJob. Задание, «выполняющееся» дольше JOBS_LOCK_TIMEOUT, считается брошенным
+упавшим исполнителем и возвращается в очередь.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import DeadJob, Job
+
+logger = logging.getLogger(__name__)
+
+# Зарегистрированные задания: {имя: JobFunction}
+registry = {}
+
+
+class JobFunction:
+    """Функция задания: вызывается как обычно или ставится в очередь через delay()/schedule()"""
+
+    def __init__(self, func, queue, max_attempts):
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return enqueue(self.name, args, kwargs, queue=self.queue, max_attempts=self.max_attempts)
+
+    def schedule(self, when, *args, **kwargs):
+        """when - datetime или timedelta от текущего момента"""
+        run_at = timezone.now() + when if isinstance(when, timedelta) else when
+        return enqueue(
+            self.name, args, kwargs, queue=self.queue, max_attempts=self.max_attempts, run_at=run_at,
+        )
+
+
+def job(queue='default', max_attempts=None):
+    """Регистрирует функцию как фоновое задание"""
+    def decorator(func):
+        job_function = JobFunction(func, queue, max_attempts or settings.JOBS_MAX_ATTEMPTS)
+        registry[job_function.name] = job_function
+        return job_function
+    return decorator
+
+
+def enqueue(name, args=(), kwargs=None, queue='default', max_attempts=None, run_at=None):
+    return Job.objects.create(
+        name=name,
+        queue=queue,
+        args=list(args),
+        kwargs=kwargs or {},
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+        run_at=run_at or timezone.now(),
+    )
+
+
+def claim(worker_id, queues=None, limit=1):
+    """Берёт в работу до limit готовых заданий; возвращает их (attempts уже увеличен)"""
+    now = timezone.now()
+    ready = Job.objects.filter(status=Job.STATUS_QUEUED, run_at__lte=now)
+    if queues:
+        ready = ready.filter(queue__in=queues)
+    ready = ready.order_by('run_at', 'id')
+    taken = {
+        'status': Job.STATUS_RUNNING,
+        'locked_by': worker_id,
+        'locked_at': now,
+        'attempts': F('attempts') + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            jobs = list(ready.select_for_update(skip_locked=True)[:limit])
+            Job.objects.filter(id__in=[claimed.id for claimed in jobs]).update(**taken)
+    else:
+        jobs = []
+        # Кандидатов с запасом: часть может перехватить другой исполнитель
+        for candidate in ready[:limit * 4]:
+            if Job.objects.filter(id=candidate.id, status=Job.STATUS_QUEUED).update(**taken):
+                jobs.append(candidate)
+                if len(jobs) == limit:
+                    break
+
+    for claimed in jobs:
+        claimed.status = Job.STATUS_RUNNING
+        claimed.locked_by = worker_id
+        claimed.locked_at = now
+        claimed.attempts += 1
+    return jobs
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: база * 2^(попытка-1) с разбросом, не больше максимума"""
+    delay = settings.JOBS_RETRY_BASE_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.JOBS_RETRY_MAX_DELAY) * random.uniform(0.8, 1.2))
+
+
+def _held(claimed):
+    """Строка задания, пока его держит этот исполнитель (а не вернули в очередь как брошенное)"""
+    return Job.objects.filter(id=claimed.id, status=Job.STATUS_RUNNING, locked_at=claimed.locked_at)
+
+
+def fail(claimed, error, retry=True):
+    """Возвращает задание в очередь с задержкой или переносит в DeadJob"""
+    if retry and claimed.attempts < claimed.max_attempts:
+        _held(claimed).update(
+            status=Job.STATUS_QUEUED,
+            run_at=timezone.now() + retry_delay(claimed.attempts),
+            last_error=error,
+            locked_by='',
+            locked_at=None,
+        )
+        return
+    with transaction.atomic():
+        if not _held(claimed).delete()[0]:
+            return
+        DeadJob.objects.create(
+            name=claimed.name,
+            queue=claimed.queue,
+            args=claimed.args,
+            kwargs=claimed.kwargs,
+            attempts=claimed.attempts,
+            max_attempts=claimed.max_attempts,
+            error=error,
+            created_at=claimed.created_at,
+        )
+    logger.error('Задание %s #%s отброшено после %s попыток', claimed.name, claimed.id, claimed.attempts)
+
+
+def execute(claimed):
+    """Выполняет задание; True - успешно"""
+    job_function = registry.get(claimed.name)
+    if job_function is None:
+        fail(claimed, f'Задание {claimed.name} не зарегистрировано', retry=False)
+        return False
+    try:
+        with transaction.atomic():
+            job_function.func(*claimed.args, **claimed.kwargs)
+            _held(claimed).delete()
+    except Exception:
+        logger.exception('Ошибка в задании %s #%s (попытка %s)', claimed.name, claimed.id, claimed.attempts)
+        fail(claimed, traceback.format_exc())
+        return False
+    return True
+
+
+def requeue_stale():
+    """Возвращает в очередь задания упавших исполнителей; исчерпавшие попытки - в DeadJob"""
+    deadline = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    stale = list(Job.objects.filter(status=Job.STATUS_RUNNING, locked_at__lt=deadline))
+    for claimed in stale:
+        fail(claimed, f'Исполнитель {claimed.locked_by} не завершил задание за {settings.JOBS_LOCK_TIMEOUT} с')
+    return len(stale)
@@ -0,0 +1,149 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from . import queue
+from .models import DeadJob, Job
+from .worker import Worker, drain
+
+calls = []
+
+# Общий кэш, с которым runworker соглашается запускаться (задание record его не трогает)
+SHARED_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache_table'}}
+
+
+@queue.job(max_attempts=2)
+def record(value, suffix=''):
+    calls.append(f'{value}{suffix}')
+
+
+@queue.job()
+def explode():
+    Job.objects.create(name='side effect')  # откатывается вместе с заданием
+    raise ValueError('boom')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, JOBS_RETRY_BASE_DELAY=10, JOBS_RETRY_MAX_DELAY=3600, JOBS_LOCK_TIMEOUT=900)
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_delay_runs_and_deletes_job(self):
+        record.delay('a', suffix='!')
+        record.delay('b')
+        worker = drain()
+        self.assertEqual(calls, ['a!', 'b'])
+        self.assertEqual((worker.processed, worker.failed), (2, 0))
+        self.assertFalse(Job.objects.exists())
+
+    def test_claimed_job_is_not_given_twice(self):
+        record.delay('once')
+        first = queue.claim('w1')
+        self.assertEqual(len(first), 1)
+        self.assertEqual(queue.claim('w2'), [])
+        self.assertEqual(first[0].attempts, 1)
+        self.assertEqual(Job.objects.get().locked_by, 'w1')
+
+    def test_scheduled_job_waits_for_run_at(self):
+        record.schedule(timedelta(minutes=5), 'later')
+        drain()
+        self.assertEqual(calls, [])
+        Job.objects.update(run_at=timezone.now())
+        drain()
+        self.assertEqual(calls, ['later'])
+
+    def test_only_selected_queues(self):
+        queue.enqueue(record.name, ['mail'], queue='mail')
+        record.delay('default')
+        drain(queues=['mail'])
+        self.assertEqual(calls, ['mail'])
+        self.assertEqual(Job.objects.get().queue, 'default')
+
+    def test_failure_retries_with_backoff_then_dead_letter(self):
+        explode.delay()
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertEqual(drain().failed, 1)
+        job = Job.objects.get()
+        self.assertEqual(job.name, explode.name)  # побочная запись откатилась
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, 1))
+        self.assertIn('ValueError: boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=7))
+
+        # Повторы идут только после задержки; на последней попытке - в DeadJob
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            for _ in range(job.max_attempts - 1):
+                Job.objects.update(run_at=timezone.now())
+                drain()
+        self.assertFalse(Job.objects.exists())
+        dead = DeadJob.objects.get()
+        self.assertEqual((dead.name, dead.attempts), (explode.name, 5))
+
+    def test_retry_delay_grows_and_is_capped(self):
+        with mock.patch('random.uniform', return_value=1):
+            delays = [queue.retry_delay(attempt).total_seconds() for attempt in (1, 2, 3, 20)]
+        self.assertEqual(delays, [10, 20, 40, 3600])
+
+    def test_unknown_job_goes_to_dead_letter(self):
+        queue.enqueue('removed.job', [1])
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            drain()
+        self.assertIn('не зарегистрировано', DeadJob.objects.get().error)
+
+    def test_stale_job_is_requeued(self):
+        record.delay('stale')
+        [claimed] = queue.claim('crashed')
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        drain()
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, 1))
+        self.assertIn('crashed', job.last_error)
+        Job.objects.update(run_at=timezone.now())
+        drain()
+        self.assertEqual(calls, ['stale'])
+        # Исполнитель «ожил» и пытается завершить задание, которое уже не его
+        queue.fail(claimed, 'late')
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(CACHES=SHARED_CACHE)
+    def test_runworker_burst(self):
+        record.delay('cli')
+        out = StringIO()
+        with mock.patch('signal.signal'):
+            call_command('runworker', burst=True, stdout=out)
+        self.assertEqual(calls, ['cli'])
+        self.assertIn('выполнено заданий 1, с ошибкой 0', out.getvalue())
+
+    def test_runworker_requires_shared_cache(self):
+        # В тестах кэш в памяти процесса
+        with self.assertRaisesRegex(CommandError, 'LocMemCache не общий'):
+            call_command('runworker', burst=True, stdout=StringIO())
+
+    def test_dead_job_admin_requeue(self):
+        from django.contrib.auth import get_user_model
+        queue.enqueue('removed.job', [1])
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            drain()
+        self.client.force_login(get_user_model().objects.create_superuser('root', password='pass'))
+        self.client.post('/admin/jobs/deadjob/', {
+            'action': 'requeue', '_selected_action': [DeadJob.objects.get().pk],
+        })
+        self.assertFalse(DeadJob.objects.exists())
+        self.assertEqual(Job.objects.get().args, [1])
+
+
+class WorkerThreadTests(TransactionTestCase):
+    # Потоки работают на своих подключениях и видят только закоммиченные задания
+
+    def setUp(self):
+        calls.clear()
+
+    def test_threads_share_the_queue(self):
+        for value in range(6):
+            record.delay(value)
+        worker = Worker(concurrency=3, poll_interval=0)
+        worker.run(burst=True)
+        self.assertEqual(sorted(calls), [str(value) for value in range(6)])
+        self.assertEqual(worker.processed, 6)
@@ -0,0 +1,86 @@
+"""Исполнитель очереди заданий: потоки, каждый берёт и выполняет задания по одному"""
+import logging
+import os
+import socket
+import threading
+from contextlib import nullcontext
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from . import queue
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+
+    def __init__(self, queues=None, concurrency=1, poll_interval=None):
+        self.queues = queues or None
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval if poll_interval is not None else settings.JOBS_POLL_INTERVAL
+        self.id = f'{socket.gethostname()}:{os.getpid()}'
+        self.processed = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # SQLite пускает одного писателя на всю базу: потоки, пишущие одновременно,
+        # получают "database table is locked". Там обращения к очереди идут по очереди
+        self._db_lock = threading.Lock() if connection.vendor == 'sqlite' else nullcontext()
+
+    def stop(self):
+        """Новые задания не берутся; выполняющиеся доделываются"""
+        self._stop.set()
+
+    def run(self, burst=False):
+        """
+        Выполняет задания до stop(). burst=True - до опустошения очереди.
+        При concurrency=1 работает в текущем потоке (и на его подключении к БД).
+        """
+        if self.concurrency <= 1:
+            self._loop(burst)
+            return
+        threads = [
+            threading.Thread(target=self._thread_loop, args=(burst,), name=f'job-worker-{i}')
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _thread_loop(self, burst):
+        try:
+            self._loop(burst)
+        finally:
+            # У каждого потока своё подключение
+            connections.close_all()
+
+    def _loop(self, burst):
+        while not self._stop.is_set():
+            # Как между HTTP-запросами: устаревшие и сломанные подключения закрываются
+            if not connection.in_atomic_block:
+                close_old_connections()
+            try:
+                with self._db_lock:
+                    queue.requeue_stale()
+                    claimed = queue.claim(self.id, self.queues)
+            except Exception:
+                logger.exception('Не удалось получить задания из очереди')
+                claimed = []
+            if not claimed:
+                if burst:
+                    return
+                self._stop.wait(self.poll_interval)
+                continue
+            for job in claimed:
+                with self._db_lock:
+                    succeeded = queue.execute(job)
+                with self._lock:
+                    self.processed += 1
+                    self.failed += not succeeded
+
+
+def drain(queues=None):
+    """Выполняет все готовые задания в текущем потоке (тесты, отладка); возвращает Worker"""
+    worker = Worker(queues=queues)
+    worker.run(burst=True)
+    return worker
@@ -0,0 +1,137 @@
+"""
+Индекс доступных пользователю проектов: {project_id: роль}.
+
+Хранится в двух уровнях кэша: LRU в памяти процесса и общий кэш Django.
+Для каждого пользователя в общем кэше лежит номер версии; сигналы Project и
+ProjectMembership меняют версию, поэтому устаревшие записи в памяти других
+процессов перестают находиться без явной рассылки инвалидаций.
+
+Это работает только с кэшем, общим для всех процессов (при нескольких воркерах
+кэш в памяти процесса запрещён проверкой main.E001 в checks.py). Версия читается
+при каждом обращении: LRU экономит запросы к БД и получение самого индекса, но
+не обращение к кэшу - с DatabaseCache это один запрос к cache_table, с LocMem
+(один процесс, тесты) - ноль. Промах LRU стоит ещё одно обращение к кэшу.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .profiling import record_cache
+
+# Роль создателя проекта (в ProjectMembership такой роли нет)
+ROLE_OWNER = 'owner'
+
+
+class LRUCache:
+    """Простой потокобезопасный LRU-кэш для одного процесса"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local_cache = LRUCache(getattr(settings, 'ACCESS_CACHE_LOCAL_SIZE', 1024))
+
+
+def _version_key(user_id):
+    return f'access:v:{user_id}'
+
+
+def _get_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Версия из времени не совпадёт ни с одной из записей, оставшихся в памяти процессов
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def _load_from_db(user_id):
+    from .models import Project, ProjectMembership
+
+    roles = dict(
+        ProjectMembership.objects.filter(user_id=user_id).values_list('project_id', 'role')
+    )
+    for project_id in Project.objects.filter(created_by_id=user_id).values_list('id', flat=True):
+        roles[project_id] = ROLE_OWNER
+    return roles
+
+
+def get_accessible_projects(user):
+    """Возвращает {project_id: роль} для всех проектов, где пользователь создатель или участник"""
+    if not user.is_authenticated:
+        return {}
+    version = _get_version(user.pk)
+    local_key = (user.pk, version)
+    roles = _local_cache.get(local_key)
+    if roles is not None:
+        record_cache(hit=True)
+        return roles
+
+    shared_key = f'access:{user.pk}:{version}'
+    roles = cache.get(shared_key)
+    record_cache(hit=roles is not None)
+    if roles is None:
+        roles = _load_from_db(user.pk)
+        cache.set(shared_key, roles, getattr(settings, 'ACCESS_CACHE_TIMEOUT', 3600))
+    _local_cache.set(local_key, roles)
+    return roles
+
+
+def get_accessible_project_ids(user):
+    """ID доступных пользователю проектов"""
+    return list(get_accessible_projects(user))
+
+
+def get_project_role(user, project_id):
+    """Роль пользователя в проекте или None, если доступа нет"""
+    return get_accessible_projects(user).get(project_id)
+
+
+def get_access_changed_at(user):
+    """Когда в последний раз сбрасывался индекс доступа пользователя (версия - время в нс)"""
+    return datetime.fromtimestamp(_get_version(user.pk) / 1e9, tz=timezone.utc)
+
+
+def _bump_versions(user_ids):
+    for user_id in user_ids:
+        cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def invalidate_user_access(*user_ids):
+    """
+    Сбрасывает индекс доступа пользователей во всех процессах.
+    Повторяем сброс после коммита, чтобы параллельный запрос не закэшировал
+    данные, прочитанные до завершения транзакции.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    _bump_versions(user_ids)
+    transaction.on_commit(lambda: _bump_versions(user_ids))
+
+
+def clear_local_cache():
+    """Очищает LRU текущего процесса (используется в тестах)"""
+    _local_cache.clear()
@@ -1,44 +1,99 @@
 # admin.py
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth import get_user_model
 from django.utils.html import format_html
 from django.urls import path
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.http import HttpResponseRedirect
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .jobs import add_project_members
 from .models import Project, Task, ProjectMembership
+from .pagination import EstimatedCountPaginator
 from django.conf import settings
 
 User = settings.AUTH_USER_MODEL
 User = get_user_model()
 
-# Кастомный фильтр для проектов
-class ProjectCreatorFilter(admin.SimpleListFilter):
-    title = 'Создатель проекта'
-    parameter_name = 'creator'
+# Фильтр по внешнему ключу с поиском: варианты подгружаются по мере ввода
+# через admin:autocomplete, а не выгружаются в боковую панель все сразу.
+# Модель, на которую ссылается поле, должна быть в админке с search_fields
+class AutocompleteFilter(admin.SimpleListFilter):
+    template = 'admin/main/autocomplete_filter.html'
+    field_name = None
+    
+    def __init__(self, request, params, model, model_admin):
+        self.field = model._meta.get_field(self.field_name)
+        self.admin_site = model_admin.admin_site
+        super().__init__(request, params, model, model_admin)
     
     def lookups(self, request, model_admin):
-        creators = User.objects.filter(created_projects__isnull=False).distinct()
-        return [(user.id, user.username) for user in creators]
+        # Только выбранное значение - для подписи в поле
+        if not self.selected_id():
+            return []
+        obj = self.field.remote_field.model._default_manager.filter(pk=self.selected_id()).first()
+        return [(obj.pk, str(obj))] if obj else []
+    
+    def has_output(self):
+        return True
+    
+    def selected_id(self):
+        value = self.value()
+        return int(value) if value and value.isdigit() else None
     
     def queryset(self, request, queryset):
-        if self.value():
-            return queryset.filter(created_by_id=self.value())
+        if self.selected_id():
+            return queryset.filter(**{self.field.attname: self.selected_id()})
         return queryset
+    
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'Все',
+        }
+    
+    def widget(self):
+        autocomplete = AutocompleteSelect(self.field, self.admin_site)
+        attrs = autocomplete.build_attrs(autocomplete.attrs, {'style': 'width: 100%'})
+        choices = [('', '')] + list(self.lookup_choices)
+        return forms.Select(attrs=attrs, choices=choices).render(self.parameter_name, self.selected_id())
+
+# Кастомный фильтр для проектов
+class ProjectCreatorFilter(AutocompleteFilter):
+    title = 'Создатель проекта'
+    parameter_name = 'creator'
+    field_name = 'created_by'
 
 # Кастомный фильтр для задач по проектам
-class TaskProjectFilter(admin.SimpleListFilter):
+class TaskProjectFilter(AutocompleteFilter):
     title = 'Проект'
     parameter_name = 'project'
-    
-    def lookups(self, request, model_admin):
-        projects = Project.objects.all()
-        return [(project.id, project.name) for project in projects]
-    
-    def queryset(self, request, queryset):
-        if self.value():
-            return queryset.filter(project_id=self.value())
-        return queryset
+    field_name = 'project'
+
+class TaskAssigneeFilter(AutocompleteFilter):
+    title = 'Исполнитель'
+    parameter_name = 'assigned_to'
+    field_name = 'assigned_to'
+
+class MembershipProjectFilter(AutocompleteFilter):
+    title = 'Проект'
+    parameter_name = 'project'
+    field_name = 'project'
+
+# Основа для списков больших таблиц: число строк - оценкой планировщика,
+# без второго COUNT(*) по всей таблице ради «Показать все», фильтры - с поиском
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    @property
+    def media(self):
+        autocomplete = AutocompleteSelect(None, self.admin_site).media
+        return super().media + autocomplete + forms.Media(js=['JS/admin_autocomplete_filter.js'])
 
 # Inline для отображения участников проекта в админке
 class ProjectMembershipInline(admin.TabularInline):
@@ -64,7 +119,7 @@ class TaskInline(admin.TabularInline):
 
 # Кастомная админка для ProjectMembership
 @admin.register(ProjectMembership)
-class ProjectMembershipAdmin(admin.ModelAdmin):
+class ProjectMembershipAdmin(LargeTableAdmin):
     list_display = (
         'project_name', 
         'user', 
@@ -73,7 +128,7 @@ class ProjectMembershipAdmin(admin.ModelAdmin):
         'joined_at', 
         'is_active'
     )
-    list_filter = ('role', 'joined_at', 'project', 'can_edit_tasks', 'can_invite_users')
+    list_filter = ('role', 'joined_at', MembershipProjectFilter, 'can_edit_tasks', 'can_invite_users')
     search_fields = ('user__username', 'user__email', 'project__name')
     readonly_fields = ('joined_at',)
     list_select_related = ('project', 'user')
@@ -130,7 +185,7 @@ class ProjectMembershipAdmin(admin.ModelAdmin):
 
 # Кастомная админка для Project
 @admin.register(Project)
-class ProjectAdmin(admin.ModelAdmin):
+class ProjectAdmin(LargeTableAdmin):
     list_display = (
         'name', 
         'created_by', 
@@ -142,7 +197,6 @@ class ProjectAdmin(admin.ModelAdmin):
     list_filter = (ProjectCreatorFilter, 'created_at')
     search_fields = ('name', 'description', 'created_by__username')
     readonly_fields = ('created_at', 'tasks_count_display', 'team_members_list')
-    list_select_related = ('created_by',)
     inlines = [ProjectMembershipInline]
     list_per_page = 25
     
@@ -160,16 +214,29 @@ class ProjectAdmin(admin.ModelAdmin):
         }),
     )
     
+    # Счётчики списка - в том же запросе, без count() на строку. Участники - подзапросом,
+    # а не JOIN с GROUP BY: иначе соединение попало бы и в COUNT(*) для пагинации
+    def get_queryset(self, request):
+        members = (
+            ProjectMembership.objects.filter(project=OuterRef('pk'))
+            .order_by().values('project').annotate(total=Count('id')).values('total')
+        )
+        # Строка ProjectStats создаётся лениво (get_project_stats, reconcile_project_stats) - до неё 0
+        return super().get_queryset(request).select_related('created_by').annotate(
+            members_total=Coalesce(Subquery(members), 0),
+            tasks_total=Coalesce('stats__total', 0),
+        )
+    
     def team_members_count(self, obj):
-        count = obj.team_members.count()
         return format_html(
             '<span class="badge bg-info">{}</span>',
-            count
+            obj.members_total
         )
     team_members_count.short_description = 'Участников'
+    team_members_count.admin_order_field = 'members_total'
     
     def tasks_count(self, obj):
-        count = obj.tasks.count()
+        count = obj.tasks_total
         color = 'success' if count > 0 else 'secondary'
         return format_html(
             '<span class="badge bg-{}">{}</span>',
@@ -177,9 +244,10 @@ class ProjectAdmin(admin.ModelAdmin):
             count
         )
     tasks_count.short_description = 'Задач'
+    tasks_count.admin_order_field = 'tasks_total'
     
     def tasks_count_display(self, obj):
-        return obj.tasks.count()
+        return obj.tasks_total
     tasks_count_display.short_description = 'Всего задач'
     
     def team_members_list(self, obj):
@@ -227,18 +295,13 @@ class ProjectAdmin(admin.ModelAdmin):
         project = Project.objects.get(id=project_id)
         
         if request.method == 'POST':
-            user_ids = request.POST.getlist('users')
+            user_ids = [int(user_id) for user_id in request.POST.getlist('users') if user_id.isdigit()]
             role = request.POST.get('role', 'developer')
             
-            for user_id in user_ids:
-                user = User.objects.get(id=user_id)
-                ProjectMembership.objects.get_or_create(
-                    project=project,
-                    user=user,
-                    defaults={'role': role}
-                )
+            # Участники добавляются фоновым заданием: на каждого срабатывают сигналы членства
+            add_project_members.delay(project.id, user_ids, role)
             
-            self.message_user(request, f"Пользователи добавлены в проект {project.name}", messages.SUCCESS)
+            self.message_user(request, f"Пользователи будут добавлены в проект {project.name}", messages.SUCCESS)
             return redirect('admin:tasks_project_changelist')
         
         # Показываем только пользователей, которых еще нет в проекте
@@ -289,7 +352,7 @@ class TaskDueDateFilter(admin.SimpleListFilter):
 
 # Кастомная админка для Task
 @admin.register(Task)
-class TaskAdmin(admin.ModelAdmin):
+class TaskAdmin(LargeTableAdmin):
     list_display = (
         'title_truncated',
         'project_link',
@@ -308,7 +371,7 @@ class TaskAdmin(admin.ModelAdmin):
         'priority',
         TaskDueDateFilter,
         'created_at',
-        'assigned_to',
+        TaskAssigneeFilter,
     )
     search_fields = ('title', 'description', 'project__name', 'assigned_to__username')
     readonly_fields = ('created_at', 'updated_at', 'created_by_display')
@@ -410,18 +473,22 @@ class TaskAdmin(admin.ModelAdmin):
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
     
     # Кастомные действия для задач
+    # update() не вызывает сигналы: счётчики, версии страниц и события досок обновляет update_with_stats
+    def _bulk_update(self, queryset, **values):
+        return queryset.update_with_stats(**values)
+    
     def mark_as_done(self, request, queryset):
-        updated = queryset.update(status='done')
+        updated = self._bulk_update(queryset, status='done')
         self.message_user(request, f"{updated} задач отмечены как выполненные", messages.SUCCESS)
     mark_as_done.short_description = "Отметить как выполненные"
     
     def set_high_priority(self, request, queryset):
-        updated = queryset.update(priority='high')
+        updated = self._bulk_update(queryset, priority='high')
         self.message_user(request, f"{updated} задач установлен высокий приоритет", messages.SUCCESS)
     set_high_priority.short_description = "Установить высокий приоритет"
     
     def clear_due_dates(self, request, queryset):
-        updated = queryset.update(due_date=None)
+        updated = self._bulk_update(queryset, due_date=None)
         self.message_user(request, f"{updated} задач очищены сроки", messages.SUCCESS)
     clear_due_dates.short_description = "Очистить сроки выполнения"
     
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .profiling import install_template_timer
+
+        install_template_timer()
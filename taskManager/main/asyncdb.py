@@ -0,0 +1,95 @@
+"""
+Параллельные запросы в async-представлениях.
+
+Асинхронный ORM Django (acount(), aget() и т.д.) выполняет все запросы одного
+HTTP-запроса в одном потоке и на одном подключении, поэтому asyncio.gather()
+над ними не ускоряет страницу - запросы всё равно идут к СУБД по очереди.
+
+run_concurrently() запускает независимые группы запросов в отдельном пуле
+потоков. У каждого потока пула своё подключение (постоянное или из пула psycopg),
+так что запросы выполняются в СУБД одновременно. Размер пула - ASYNC_QUERY_THREADS;
+столько же дополнительных подключений может держать каждый воркер.
+
+Параллельно выполняется только вне транзакции и не на SQLite: потоки пула не видят
+незакоммиченных данных запроса, а SQLite всё равно сериализует запись. В остальных
+случаях функции выполняются по очереди через sync_to_async - результат тот же.
+Запросы из пула по-прежнему учитываются в Server-Timing и бюджете запросов.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from . import profiling
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_QUERY_THREADS, thread_name_prefix='async-query',
+            )
+    return _executor
+
+
+def parallel_allowed():
+    """Можно ли выполнять запросы в потоках пула (на своих подключениях)"""
+    if getattr(settings, 'ASYNC_QUERY_THREADS', 0) <= 0:
+        return False
+    return all(
+        connection.vendor != 'sqlite' and not connection.in_atomic_block
+        for connection in connections.all()
+    )
+
+
+def _run_in_pool(func, wrappers, timings):
+    # Как в начале и в конце обычного запроса: устаревшие подключения закрываются,
+    # при CONN_MAX_AGE=0 (ASGI с пулом psycopg) подключение возвращается в пул
+    close_old_connections()
+    token = profiling._current.set(timings)
+    try:
+        with ExitStack() as stack:
+            # Счётчики запроса (Server-Timing, бюджет запросов) видят и запросы пула
+            for alias, alias_wrappers in wrappers.items():
+                for wrapper in alias_wrappers:
+                    stack.enter_context(connections[alias].execute_wrapper(wrapper))
+            return func()
+    finally:
+        profiling._current.reset(token)
+        close_old_connections()
+
+
+def _request_wrappers():
+    # Обёртки execute стоят на подключениях потока sync_to_async, а не цикла событий
+    return {connection.alias: list(connection.execute_wrappers) for connection in connections.all()}
+
+
+async def run_concurrently(*funcs):
+    """Выполняет синхронные функции с запросами к БД, возвращает их результаты по порядку"""
+    if not parallel_allowed():
+        return [await sync_to_async(func)() for func in funcs]
+
+    wrappers = await sync_to_async(_request_wrappers)()
+    timings = profiling._current.get()
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    return await asyncio.gather(*[
+        loop.run_in_executor(executor, _run_in_pool, func, wrappers, timings)
+        for func in funcs
+    ])
+
+
+async def get_request_user(request):
+    """
+    Пользователь запроса в async-представлении. Подставляется и в request.user,
+    чтобы шаблоны и контекстные процессоры не загружали его второй раз.
+    """
+    user = await request.auser()
+    request.user = user
+    return user
@@ -0,0 +1,229 @@
+"""
+Нагрузочные замеры горячих страниц через тестовый клиент Django.
+
+seed(scale) заполняет базу детерминированным набором данных нужного размера,
+run(dataset) прогоняет каждую страницу и возвращает p50/p95 задержки,
+число SQL-запросов и пиковую память (tracemalloc), compare() сравнивает
+два прогона. Обёртка с созданием временной БД - команда benchmark.
+"""
+import gc
+import math
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+import django
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from users.models import ColleagueRequest, Colleagueship, User
+from users.search import index_users
+from .models import Project, ProjectMembership, Task
+from .querybudget import QueryRecorder
+from .stats import rebuild_project_stats
+
+# users / projects / задач на проект / участников на проект / запросов в коллеги на пользователя
+SCALES = {
+    'small': {'users': 20, 'projects': 10, 'tasks': 20, 'members': 4, 'requests': 3},
+    'medium': {'users': 200, 'projects': 100, 'tasks': 50, 'members': 8, 'requests': 5},
+    'large': {'users': 2000, 'projects': 500, 'tasks': 200, 'members': 12, 'requests': 8},
+}
+
+STATUSES = [status for status, _ in Task.STATUS_CHOICES]
+PRIORITIES = [priority for priority, _ in Task.PRIORITY_CHOICES]
+
+# Настройки на время замеров: без HTTPS-редиректа, бюджетов и профилирования
+BENCH_SETTINGS = {
+    'SECURE_SSL_REDIRECT': False,
+    'ALLOWED_HOSTS': ['testserver'],
+    'QUERY_BUDGET_RAISE': False,
+    'QUERY_BUDGET_ENABLED': False,
+    'PROFILE_SAMPLE_RATE': 0,
+}
+
+
+def seed(scale, seed=0, batch_size=1000):
+    """
+    Заполняет базу данными размера scale (ключ SCALES или словарь тех же полей).
+    Пользователь bench0 - участник всех проектов: на нём страницы самые тяжёлые.
+    """
+    sizes = SCALES[scale] if isinstance(scale, str) else scale
+    rng = random.Random(seed)
+    password = make_password('bench')  # хэшируем один раз, а не для каждого пользователя
+
+    users = User.objects.bulk_create([
+        User(
+            username=f'bench{i}', password=password, is_staff=(i == 0), is_superuser=(i == 0),
+            first_name=rng.choice(['Иван', 'Анна', 'Пётр', 'Мария', 'Олег']),
+            last_name=rng.choice(['Иванов', 'Смирнова', 'Кузнецов', 'Попова']),
+        )
+        for i in range(sizes['users'])
+    ], batch_size=batch_size)
+    index_users(users)
+    viewer = users[0]
+
+    projects = Project.objects.bulk_create([
+        Project(name=f'Project {i}', created_by=rng.choice(users))
+        for i in range(sizes['projects'])
+    ], batch_size=batch_size)
+    rebuild_project_stats([project.id for project in projects])
+
+    memberships = []
+    member_ids = {}
+    for project in projects:
+        members = {viewer, *rng.sample(users, min(sizes['members'], len(users)))}
+        members.discard(project.created_by)
+        memberships += [ProjectMembership(project=project, user=user) for user in members]
+        member_ids[project.id] = {user.id for user in members} | {project.created_by_id}
+    ProjectMembership.objects.bulk_create(memberships, batch_size=batch_size)
+
+    today = timezone.now().date()
+    tasks = []
+    for project in projects:
+        assignees = list(member_ids[project.id])
+        for i in range(sizes['tasks']):
+            tasks.append(Task(
+                title=f'Task {project.id}-{i}',
+                project=project,
+                created_by_id=project.created_by_id,
+                assigned_to_id=rng.choice(assignees),
+                status=rng.choice(STATUSES),
+                priority=rng.choice(PRIORITIES),
+                due_date=today + timedelta(days=rng.randint(-10, 30)) if rng.random() < 0.6 else None,
+            ))
+        if len(tasks) >= batch_size:
+            Task.objects.bulk_create(tasks, batch_size=batch_size, member_ids=member_ids)
+            tasks = []
+    Task.objects.bulk_create(tasks, batch_size=batch_size, member_ids=member_ids)
+
+    # Запросы в коллеги; bulk_create не вызывает сигналы, поэтому связи создаём сами
+    pairs = set()
+    for user in users:
+        for other in rng.sample(users, min(sizes['requests'], len(users))):
+            if other != user and (other.id, user.id) not in pairs:
+                pairs.add((user.id, other.id))
+    requests = [
+        ColleagueRequest(from_user_id=a, to_user_id=b, status=rng.choice(['pending', 'accepted', 'accepted']))
+        for a, b in pairs
+    ]
+    ColleagueRequest.objects.bulk_create(requests, batch_size=batch_size)
+    Colleagueship.objects.bulk_create([
+        Colleagueship(user_id=a, colleague_id=b)
+        for req in requests if req.status == 'accepted'
+        for a, b in ((req.from_user_id, req.to_user_id), (req.to_user_id, req.from_user_id))
+    ], batch_size=batch_size, ignore_conflicts=True)
+
+    return {
+        'scale': scale if isinstance(scale, str) else 'custom',
+        'sizes': sizes,
+        'viewer': viewer,
+        'project': projects[0],
+        'task': Task.objects.filter(project=projects[0]).first(),
+        'other_user': users[-1],
+    }
+
+
+def _scenarios(dataset):
+    """[(имя, метод, url, данные, заголовки), ...] - страницы, которые замеряем"""
+    project = dataset['project']
+    task = dataset['task']
+    statuses = iter(STATUSES * 10000)
+    xhr = {'x-requested-with': 'XMLHttpRequest'}
+    return [
+        ('dashboard', 'get', reverse('main:dashboard'), None, {}),
+        ('project_detail', 'get', reverse('main:project_detail', args=[project.id]), None, {}),
+        ('project_list', 'get', reverse('users:project_list'), None, {}),
+        ('my_tasks', 'get', reverse('users:my_tasks'), None, {}),
+        ('profile_view', 'get', reverse('users:profile', args=[dataset['other_user'].username]), None, {}),
+        ('search_users', 'get', reverse('users:search_users') + '?q=bench1', None, {}),
+        ('update_task_status', 'post', reverse('main:update_task_status', args=[task.id]),
+         lambda: {'status': next(statuses)}, xhr),
+        ('admin_project_changelist', 'get', reverse('admin:main_project_changelist'), None, {}),
+        ('admin_task_changelist', 'get', reverse('admin:main_task_changelist'), None, {}),
+        ('admin_membership_changelist', 'get', reverse('admin:main_projectmembership_changelist'), None, {}),
+    ]
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга"""
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def run(dataset, iterations=20, warmup=2, only=None):
+    """Замеряет каждую страницу: {имя: {p50_ms, p95_ms, queries, peak_kb, status}}"""
+    results = {}
+    with override_settings(**BENCH_SETTINGS):
+        client = Client()
+        client.force_login(dataset['viewer'])
+        for name, method, url, data, headers in _scenarios(dataset):
+            if only and name not in only:
+                continue
+
+            def request():
+                return getattr(client, method)(url, data() if data else None, headers=headers)
+
+            for _ in range(warmup):
+                request()
+
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - start) * 1000)
+
+            # Запросы и память - отдельным прогоном, чтобы не искажать время
+            with QueryRecorder() as queries:
+                request()
+            gc.collect()
+            tracemalloc.start()
+            request()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results[name] = {
+                'status': response.status_code,
+                'p50_ms': round(statistics.median(timings), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'queries': len(queries),
+                'peak_kb': round(peak / 1024, 1),
+            }
+    return results
+
+
+def report(dataset, results, iterations):
+    """Результат в виде, который сохраняется в JSON"""
+    return {
+        'meta': {
+            'scale': dataset['scale'],
+            'sizes': dataset['sizes'],
+            'iterations': iterations,
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=20.0):
+    """
+    Сравнивает два отчёта. Регрессия - рост p95 больше чем на threshold процентов
+    или любой рост числа запросов. Возвращает список описаний регрессий.
+    """
+    regressions = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        if new['queries'] > old['queries']:
+            regressions.append(f'{name}: запросов {old["queries"]} -> {new["queries"]}')
+        if old['p95_ms'] and (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 > threshold:
+            regressions.append(f'{name}: p95 {old["p95_ms"]} -> {new["p95_ms"]} мс')
+    return regressions
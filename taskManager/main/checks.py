@@ -0,0 +1,41 @@
+"""Системные проверки конфигурации (manage.py check, migrate, runworker)"""
+from django.conf import settings
+from django.core.checks import Error, register
+
+# Бэкенды, содержимое которых видно только одному процессу
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+PROCESS_LOCAL_BROKERS = ('main.events.InProcessBroker',)
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Версии индекса доступа (access.py) и фрагментов (fragments.py) хранятся в кэше.
+    С кэшем в памяти процесса сброс доходит только до процесса, который его сделал:
+    удалённый участник сохранил бы доступ в остальных воркерах.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.WEB_WORKERS > 1 and backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            f'WEB_WORKERS={settings.WEB_WORKERS}, а кэш {backend} не общий для процессов',
+            hint='Задайте CACHE_BACKEND (например, django.core.cache.backends.db.DatabaseCache) '
+                 'или запустите один процесс (WEB_WORKERS=1)',
+            id='main.E001',
+        )]
+    return []
+
+
+@register()
+def events_broker_check(app_configs, **kwargs):
+    """События, опубликованные в памяти одного процесса, не дошли бы до клиентов других воркеров"""
+    if settings.WEB_WORKERS > 1 and settings.EVENTS_BROKER in PROCESS_LOCAL_BROKERS:
+        return [Error(
+            f'WEB_WORKERS={settings.WEB_WORKERS}, а брокер событий {settings.EVENTS_BROKER} '
+            'работает в памяти процесса',
+            hint='Задайте EVENTS_BROKER=main.events.CacheBroker или запустите один процесс (WEB_WORKERS=1)',
+            id='main.E002',
+        )]
+    return []
@@ -0,0 +1,109 @@
+"""
+Условные GET-запросы (ETag и Last-Modified) для часто открываемых страниц.
+
+Версия страницы собирается из дешёвых данных: ProjectStats.changed_at (меняется
+при любой записи задач, команды или самого проекта - см. stats.py и signals.py),
+индекса доступных пользователю проектов (access.py) и данных пользователя из шапки.
+Если браузер прислал ту же версию, представление не выполняется: ответ 304 стоит
+одного индексного запроса к ProjectStats.
+"""
+import hashlib
+from datetime import datetime, time
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from .access import get_access_changed_at, get_accessible_projects, get_project_role
+from .asyncdb import get_request_user
+from .models import ProjectStats
+
+
+def _version(request, changed_at, *parts):
+    """(ETag, Last-Modified) страницы пользователя по версии данных и частям ключа"""
+    user = request.user
+    today = timezone.localdate()
+    values = [
+        # Миниатюры аватара в шапке; аватары участников меняют версию проекта (users/avatars.py)
+        user.pk, user.username, str(user.avatar), user.avatar_renditions,
+        # Токен CSRF вписан в формы страницы и меняется при входе
+        request.META.get('CSRF_COOKIE', ''),
+        # Подсветка просроченных задач зависит от даты
+        today, changed_at, *parts,
+    ]
+    etag = hashlib.blake2b(repr(values).encode(), digest_size=16).hexdigest()
+
+    # Last-Modified проверяется, только если клиент не прислал ETag, поэтому в него
+    # входит всё, что может изменить страницу без записи в ProjectStats
+    midnight = timezone.make_aware(datetime.combine(today, time.min))
+    moments = [changed_at, get_access_changed_at(user), midnight, user.last_login]
+    return etag, max(moment for moment in moments if moment is not None)
+
+
+def project_page_version(request, project_id):
+    """Страница проекта: версия проекта и роль пользователя в нём"""
+    role = get_project_role(request.user, project_id)
+    if role is None:
+        # Нет доступа или проекта - ответ отдаст само представление
+        return None
+    changed_at = ProjectStats.objects.filter(project_id=project_id).values_list('changed_at', flat=True).first()
+    if changed_at is None:
+        return None
+    return _version(request, changed_at, 'project', project_id, role)
+
+
+def user_pages_version(request):
+    """Панель и «Мои задачи»: самая свежая версия среди доступных проектов и сам их набор"""
+    roles = get_accessible_projects(request.user)
+    changed_at = ProjectStats.objects.filter(project_id__in=list(roles)).aggregate(
+        changed_at=Max('changed_at')
+    )['changed_at']
+    return _version(request, changed_at, 'user', sorted(roles.items()))
+
+
+def conditional_page(version_func):
+    """
+    Как django.views.decorators.http.condition, но ETag и Last-Modified считаются
+    одной функцией version_func(request, *args, **kwargs) -> (etag, last_modified) или None,
+    а для async-представлений - в потоке, вне цикла событий. Ставится под login_required.
+    """
+    def decorator(view):
+
+        def check(request, *args, **kwargs):
+            # Ожидающие сообщения выводятся при рендеринге - с ответом 304 они бы не показались
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return None, None
+            version = version_func(request, *args, **kwargs)
+            if version is None:
+                return None, None
+            etag, last_modified = quote_etag(version[0]), int(version[1].timestamp())
+            return get_conditional_response(request, etag=etag, last_modified=last_modified), (etag, last_modified)
+
+        def finish(response, version):
+            if version is not None and response.status_code in (200, 304):
+                response.headers.setdefault('ETag', version[0])
+                response.headers.setdefault('Last-Modified', http_date(version[1]))
+            # Страница личная, и браузер должен перепроверять её при каждом открытии
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                await get_request_user(request)
+                response, version = await sync_to_async(check)(request, *args, **kwargs)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return finish(response, version)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                response, version = check(request, *args, **kwargs)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return finish(response, version)
+        return wrapper
+
+    return decorator
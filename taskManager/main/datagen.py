@@ -0,0 +1,337 @@
+"""
+Генерация больших синтетических наборов данных (команда generate_data).
+
+Размеры проектов, команд и число коллег у пользователя распределены по
+степенному закону (Парето): несколько огромных проектов и «популярных»
+пользователей, длинный хвост маленьких. Весь план строится из seed, поэтому
+повторный запуск с теми же параметрами даёт те же данные.
+
+Сгенерированные объекты узнаются по имени (<prefix>_<номер> для пользователей,
+«<prefix> #<номер>» для проектов), так что прерванную генерацию можно
+продолжить: создаётся только то, чего ещё нет. Задачи пишутся пачками в
+отдельных транзакциях через COPY (PostgreSQL) или executemany, минуя
+Task.save и сигналы; согласованность (исполнитель - участник проекта,
+ProjectStats) обеспечивается самим генератором.
+"""
+import csv
+import io
+import random
+import re
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from users.models import ColleagueRequest, Colleagueship, User
+from users.search import index_users
+from .access import invalidate_user_access
+from .models import Project, ProjectMembership, Task
+from .stats import rebuild_project_stats
+
+# Пароль всех сгенерированных пользователей
+PASSWORD = 'generated'
+
+# Показатель степени Парето: чем меньше, тем сильнее перекос
+DEFAULT_ALPHA = 1.2
+
+STATUSES = [status for status, _ in Task.STATUS_CHOICES]
+PRIORITIES = [priority for priority, _ in Task.PRIORITY_CHOICES]
+ROLES = [role for role, _ in ProjectMembership.ROLE_CHOICES]
+REQUEST_STATUSES = ['accepted'] * 7 + ['pending'] * 2 + ['rejected']
+
+FIRST_NAMES = ['Иван', 'Анна', 'Пётр', 'Мария', 'Олег', 'Елена', 'Дмитрий', 'Ольга', 'Сергей', 'Наталья']
+LAST_NAMES = ['Иванов', 'Смирнова', 'Кузнецов', 'Попова', 'Соколов', 'Лебедева', 'Козлов', 'Новикова']
+TASK_VERBS = ['Исправить', 'Добавить', 'Проверить', 'Обновить', 'Описать', 'Ускорить', 'Удалить']
+TASK_OBJECTS = ['форму входа', 'отчёт', 'API', 'миграцию', 'документацию', 'тесты', 'поиск', 'экспорт']
+COLORS = ['#007bff', '#28a745', '#dc3545', '#ffc107', '#17a2b8', '#6f42c1']
+
+TASK_FIELDS = (
+    'title', 'description', 'project_id', 'assigned_to_id', 'created_by_id',
+    'status', 'priority', 'due_date', 'created_at', 'updated_at',
+)
+
+
+def power_law(rng, count, total, alpha=DEFAULT_ALPHA, minimum=0, maximum=None):
+    """Раскладывает total на count целых частей с распределением Парето"""
+    if count == 0:
+        return []
+    weights = [rng.paretovariate(alpha) for _ in range(count)]
+    scale = max(0, total - minimum * count) / sum(weights)
+    sizes = [minimum + int(weight * scale) for weight in weights]
+    if maximum is not None:
+        sizes = [min(size, maximum) for size in sizes]
+
+    # Остаток от округления раздаём самым «тяжёлым», пока есть место
+    order = sorted(range(count), key=lambda i: -weights[i])
+    remainder = total - sum(sizes)
+    while remainder > 0:
+        added = 0
+        for i in order:
+            if remainder == 0:
+                break
+            if maximum is None or sizes[i] < maximum:
+                sizes[i] += 1
+                remainder -= 1
+                added += 1
+        if not added:
+            break
+    return sizes
+
+
+class Plan:
+    """Детерминированный план набора данных: размеры, создатели и составы команд"""
+
+    def __init__(self, users, projects, tasks, members=8, colleagues=5,
+                 seed=0, prefix='gen', alpha=DEFAULT_ALPHA):
+        self.users = users
+        self.projects = projects
+        self.tasks = tasks
+        self.seed = seed
+        self.prefix = prefix
+        rng = random.Random(f'{seed}-plan')
+
+        self.task_counts = power_law(rng, projects, tasks, alpha)
+        self.team_sizes = power_law(
+            rng, projects, projects * members, alpha,
+            minimum=min(1, users - 1), maximum=max(0, users - 1),
+        )
+        self.creators = [rng.randrange(users) for _ in range(projects)]
+        self.degrees = power_law(rng, users, users * colleagues, alpha, maximum=max(0, users - 1))
+
+    def username(self, index):
+        return f'{self.prefix}_{index}'
+
+    def project_name(self, index):
+        return f'{self.prefix} #{index}'
+
+    def rng(self, *parts):
+        return random.Random('-'.join(str(part) for part in (self.seed, *parts)))
+
+    def team(self, index):
+        """Номера пользователей-участников проекта (без создателя)"""
+        creator = self.creators[index]
+        candidates = self.rng('team', index).sample(range(self.users), min(self.users, self.team_sizes[index] + 1))
+        return [user for user in candidates if user != creator][:self.team_sizes[index]]
+
+    def colleague_pairs(self):
+        """Пары (от кого, кому): популярных пользователей выбирают чаще"""
+        cum_weights = []
+        running = 0
+        for degree in self.degrees:
+            running += degree + 1
+            cum_weights.append(running)
+        population = range(self.users)
+
+        seen = set()
+        pairs = []
+        for user, degree in enumerate(self.degrees):
+            if not degree:
+                continue
+            for other in self.rng('colleagues', user).choices(population, cum_weights=cum_weights, k=degree):
+                key = (min(user, other), max(user, other))
+                if other != user and key not in seen:
+                    seen.add(key)
+                    pairs.append((user, other))
+        return pairs
+
+
+def _existing(queryset, field, pattern):
+    """{номер: id} уже созданных объектов, чьё поле field совпадает с pattern"""
+    regex = re.compile(pattern)
+    found = {}
+    for pk, value in queryset.values_list('id', field).iterator(chunk_size=10000):
+        match = regex.fullmatch(value)
+        if match:
+            found[int(match.group(1))] = pk
+    return found
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_rows(model, fields, rows):
+    """
+    Вставляет строки (кортежи значений полей fields) без model.save() и сигналов:
+    COPY на PostgreSQL, executemany на остальных СУБД.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            sql = f'COPY {table} ({columns}) FROM STDIN'
+            raw = cursor.cursor
+            if hasattr(raw, 'copy'):  # psycopg 3
+                with raw.copy(sql) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:  # psycopg2
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in rows:
+                    writer.writerow(['\\N' if value is None else value for value in row])
+                buffer.seek(0)
+                raw.copy_expert(f"{sql} WITH (FORMAT csv, NULL '\\N')", buffer)
+        else:
+            placeholders = ', '.join(['%s'] * len(fields))
+            cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+
+
+class Generator:
+    """Создаёт недостающие части плана; log - функция для вывода прогресса"""
+
+    def __init__(self, plan, batch_size=5000, log=print):
+        self.plan = plan
+        self.batch_size = batch_size
+        self.log = log
+        self.user_ids = {}
+        self.project_ids = {}
+
+    def run(self):
+        self.create_users()
+        self.create_projects()
+        self.create_memberships()
+        self.create_tasks()
+        self.create_colleagues()
+        self.finish()
+
+    def create_users(self):
+        plan = self.plan
+        self.user_ids = _existing(
+            User.objects.filter(username__startswith=f'{plan.prefix}_'), 'username', rf'{re.escape(plan.prefix)}_(\d+)'
+        )
+        missing = [i for i in range(plan.users) if i not in self.user_ids]
+        password = make_password(PASSWORD)  # хэшируем один раз на весь набор
+        for chunk in _chunks(missing, self.batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(
+                        username=plan.username(i), password=password,
+                        first_name=plan.rng('name', i).choice(FIRST_NAMES),
+                        last_name=plan.rng('surname', i).choice(LAST_NAMES),
+                    )
+                    for i in chunk
+                ])
+                index_users(users)
+            self.user_ids.update(zip(chunk, (user.pk for user in users)))
+        self.log(f'Пользователи: создано {len(missing)}, всего {plan.users}')
+
+    def create_projects(self):
+        plan = self.plan
+        self.project_ids = _existing(
+            Project.objects.filter(name__startswith=f'{plan.prefix} #'), 'name', rf'{re.escape(plan.prefix)} #(\d+)'
+        )
+        missing = [i for i in range(plan.projects) if i not in self.project_ids]
+        for chunk in _chunks(missing, self.batch_size):
+            projects = Project.objects.bulk_create([
+                Project(
+                    name=plan.project_name(i),
+                    created_by_id=self.user_ids[plan.creators[i]],
+                    color=COLORS[i % len(COLORS)],
+                )
+                for i in chunk
+            ])
+            self.project_ids.update(zip(chunk, (project.pk for project in projects)))
+        self.log(f'Проекты: создано {len(missing)}, всего {plan.projects}')
+
+    def create_memberships(self):
+        # Уже существующие участники пропускаются уникальным ключом (project, user)
+        plan = self.plan
+        memberships = (
+            ProjectMembership(
+                project_id=self.project_ids[i],
+                user_id=self.user_ids[user],
+                role=ROLES[user % len(ROLES)],
+                can_edit_tasks=user % 3 == 0,
+            )
+            for i in range(plan.projects)
+            for user in plan.team(i)
+        )
+        total = 0
+        for chunk in _chunks(memberships, self.batch_size):
+            ProjectMembership.objects.bulk_create(chunk, ignore_conflicts=True)
+            total += len(chunk)
+        self.log(f'Участники проектов: {total}')
+
+    def _task_rows(self, index, start):
+        """Строки задач проекта index, начиная с номера start"""
+        plan = self.plan
+        rng = plan.rng('tasks', index)
+        project_id = self.project_ids[index]
+        people = [self.user_ids[plan.creators[index]]] + [self.user_ids[user] for user in plan.team(index)]
+        now = timezone.now()
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        adapt_date = connection.ops.adapt_datefield_value
+
+        for number in range(plan.task_counts[index]):
+            # Случайные числа тянем для каждой задачи, даже пропускаемой:
+            # тогда продолжение даёт те же задачи, что и генерация с нуля
+            title = f'{rng.choice(TASK_VERBS)} {rng.choice(TASK_OBJECTS)} #{number}'
+            assignee = rng.choice(people) if rng.random() < 0.8 else None
+            author = rng.choice(people)
+            status = rng.choice(STATUSES)
+            priority = rng.choice(PRIORITIES)
+            created_at = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+            updated_at = min(now, created_at + timedelta(seconds=rng.randrange(30 * 24 * 3600)))
+            due_date = created_at.date() + timedelta(days=rng.randint(1, 60)) if rng.random() < 0.6 else None
+            if number < start:
+                continue
+            yield (
+                title, '', project_id, assignee, author, status, priority,
+                adapt_date(due_date), adapt_datetime(created_at), adapt_datetime(updated_at),
+            )
+
+    def create_tasks(self):
+        plan = self.plan
+        project_indexes = {pk: i for i, pk in self.project_ids.items()}
+        existing = {}
+        for chunk in _chunks(list(project_indexes), 1000):
+            rows = Task.objects.filter(project_id__in=chunk).values('project_id').annotate(n=Count('id')).order_by()
+            existing.update((project_indexes[row['project_id']], row['n']) for row in rows)
+
+        rows = (
+            row
+            for i in range(plan.projects)
+            if existing.get(i, 0) < plan.task_counts[i]
+            for row in self._task_rows(i, existing.get(i, 0))
+        )
+        created = 0
+        for chunk in _chunks(rows, self.batch_size):
+            with transaction.atomic():
+                write_rows(Task, TASK_FIELDS, chunk)
+            created += len(chunk)
+            self.log(f'Задачи: создано {created}')
+        self.log(f'Задачи: создано {created}, всего {plan.tasks}')
+
+    def create_colleagues(self):
+        plan = self.plan
+        requests = 0
+        for chunk in _chunks(plan.colleague_pairs(), self.batch_size):
+            statuses = [plan.rng('request', a, b).choice(REQUEST_STATUSES) for a, b in chunk]
+            with transaction.atomic():
+                # bulk_create не вызывает сигналы - связи Colleagueship создаём сами
+                ColleagueRequest.objects.bulk_create([
+                    ColleagueRequest(from_user_id=self.user_ids[a], to_user_id=self.user_ids[b], status=status)
+                    for (a, b), status in zip(chunk, statuses)
+                ], ignore_conflicts=True)
+                Colleagueship.objects.bulk_create([
+                    Colleagueship(user_id=self.user_ids[x], colleague_id=self.user_ids[y])
+                    for (a, b), status in zip(chunk, statuses) if status == 'accepted'
+                    for x, y in ((a, b), (b, a))
+                ], ignore_conflicts=True)
+            requests += len(chunk)
+        self.log(f'Запросы в коллеги: {requests}')
+
+    def finish(self):
+        project_ids = sorted(self.project_ids.values())
+        for start in range(0, len(project_ids), 500):
+            rebuild_project_stats(project_ids[start:start + 500])
+        invalidate_user_access(*self.user_ids.values())
+        self.log(f'Статистика пересчитана для {len(project_ids)} проектов')
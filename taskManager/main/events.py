@@ -0,0 +1,266 @@
+"""
+События досок проектов для живых обновлений (Server-Sent Events).
+
+Сигналы задач и участников после коммита публикуют событие в брокер
+(settings.EVENTS_BROKER). Брокер хранит последние EVENTS_HISTORY событий
+каждого проекта с возрастающими номерами; id события - «<эпоха>.<номер>».
+
+Каждый клиент читает историю со своего курсора, поэтому медленный клиент не
+копит очередь в памяти - он просто отстаёт. Если он отстал больше, чем хранится
+истории (или сервер перезапустился и сменилась эпоха), приходит событие reset
+и доска перезагружается. Переподключение продолжает с заголовка Last-Event-ID.
+
+CacheBroker (по умолчанию) - общий кэш Django (например, DatabaseCache): события
+видят все воркеры, подписчики опрашивают кэш раз в EVENTS_POLL_INTERVAL секунд.
+InProcessBroker - память процесса: один воркер (uvicorn --workers 1, runserver, тесты).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+Event = namedtuple('Event', 'id type data')
+
+# Через сколько миллисекунд EventSource переподключается после закрытия потока
+RETRY_MS = 1000
+
+
+def parse_cursor(value):
+    """(эпоха, номер) из id события или None"""
+    epoch, _, seq = (value or '').partition('.')
+    if not epoch or not seq.isdigit():
+        return None
+    return epoch, int(seq)
+
+
+class InProcessBroker:
+    """События в памяти процесса"""
+
+    def __init__(self):
+        self.epoch = str(time.time_ns())
+        self._lock = threading.Lock()
+        self._history = defaultdict(lambda: deque(maxlen=settings.EVENTS_HISTORY))
+        self._last = defaultdict(int)
+        self._waiters = defaultdict(set)  # project_id -> {(loop, asyncio.Event)}
+
+    def publish(self, project_id, event_type, data):
+        with self._lock:
+            self._last[project_id] += 1
+            event = Event(f'{self.epoch}.{self._last[project_id]}', event_type, data)
+            self._history[project_id].append(event)
+            waiters = list(self._waiters[project_id])
+        # Подписчики ждут в своих циклах событий - будим потокобезопасно
+        for loop, flag in waiters:
+            loop.call_soon_threadsafe(flag.set)
+        return event
+
+    def latest(self, project_id):
+        with self._lock:
+            return f'{self.epoch}.{self._last[project_id]}'
+
+    def events_after(self, project_id, cursor):
+        """События после cursor или None, если с этого места продолжить нельзя"""
+        parsed = parse_cursor(cursor)
+        with self._lock:
+            if parsed is None or parsed[0] != self.epoch or parsed[1] > self._last[project_id]:
+                return None
+            history = list(self._history[project_id])
+        after = parsed[1]
+        if history and parse_cursor(history[0].id)[1] > after + 1:
+            return None  # часть событий уже вытеснена из истории
+        return [event for event in history if parse_cursor(event.id)[1] > after]
+
+    async def wait(self, project_id, cursor, timeout):
+        """Ждёт событие новее cursor не дольше timeout секунд; False - по таймауту"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters[project_id].add(waiter)
+            latest = self._last[project_id]
+        try:
+            parsed = parse_cursor(cursor)
+            if parsed is None or latest > parsed[1]:
+                return True
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters[project_id].discard(waiter)
+
+
+class CacheBroker:
+    """События в общем кэше Django: видны всем воркерам"""
+
+    def _key(self, project_id, name):
+        return f'events:{project_id}:{name}'
+
+    def _epoch(self, project_id):
+        key = self._key(project_id, 'epoch')
+        epoch = cache.get(key)
+        if epoch is None:
+            cache.add(key, str(time.time_ns()), None)
+            epoch = cache.get(key)
+        return epoch
+
+    def publish(self, project_id, event_type, data):
+        epoch = self._epoch(project_id)
+        last_key = self._key(project_id, 'last')
+        cache.add(last_key, 0, None)
+        # incr в DatabaseCache не атомарен: номер, уже занятый параллельной публикацией, пропускаем
+        for _ in range(5):
+            seq = cache.incr(last_key)
+            if cache.add(self._key(project_id, seq), (event_type, data), settings.EVENTS_TTL):
+                return Event(f'{epoch}.{seq}', event_type, data)
+        logger.warning('Не удалось опубликовать событие %s проекта %s', event_type, project_id)
+        return None
+
+    def latest(self, project_id):
+        return f'{self._epoch(project_id)}.{cache.get(self._key(project_id, "last"), 0)}'
+
+    def events_after(self, project_id, cursor):
+        parsed = parse_cursor(cursor)
+        if parsed is None or parsed[0] != self._epoch(project_id):
+            return None
+        after = parsed[1]
+        last = cache.get(self._key(project_id, 'last'), 0)
+        if after > last or last - after > settings.EVENTS_HISTORY:
+            return None
+        seqs = range(after + 1, last + 1)
+        stored = cache.get_many([self._key(project_id, seq) for seq in seqs])
+        events = []
+        for seq in seqs:
+            value = stored.get(self._key(project_id, seq))
+            if value is None:
+                # Дыра в середине - событие истекло; в конце - публикация ещё не завершилась
+                if any(self._key(project_id, later) in stored for later in range(seq + 1, last + 1)):
+                    return None
+                break
+            events.append(Event(f'{parsed[0]}.{seq}', *value))
+        return events
+
+    async def wait(self, project_id, cursor, timeout):
+        parsed = parse_cursor(cursor)
+        deadline = time.monotonic() + timeout
+        while True:
+            last = await sync_to_async(cache.get)(self._key(project_id, 'last'), 0)
+            if parsed is None or last > parsed[1]:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(settings.EVENTS_POLL_INTERVAL, remaining))
+
+
+_broker = None
+_broker_path = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Брокер из settings.EVENTS_BROKER (один на процесс)"""
+    global _broker, _broker_path
+    with _broker_lock:
+        if _broker is None or _broker_path != settings.EVENTS_BROKER:
+            _broker = import_string(settings.EVENTS_BROKER)()
+            _broker_path = settings.EVENTS_BROKER
+        return _broker
+
+
+def publish_on_commit(project_id, event_type, data):
+    """Публикует событие после коммита; ошибка брокера не ломает сам запрос"""
+    if project_id is not None:
+        transaction.on_commit(lambda: get_broker().publish(project_id, event_type, data), robust=True)
+
+
+def task_data(task):
+    """Данные задачи для события доски"""
+    return {
+        'id': task.id,
+        'title': task.title,
+        'status': task.status,
+        'priority': task.priority,
+        'assigned_to_id': task.assigned_to_id,
+        'due_date': task.due_date.isoformat() if task.due_date else None,
+    }
+
+
+def publish_tasks(event_type, tasks):
+    """События массовых операций: один on_commit на пачку, задачи сгруппированы по проектам"""
+    by_project = defaultdict(list)
+    for task in tasks:
+        if task.project_id is not None:
+            by_project[task.project_id].append(task_data(task))
+
+    def publish():
+        broker = get_broker()
+        for project_id, items in by_project.items():
+            for data in items:
+                broker.publish(project_id, event_type, data)
+
+    if by_project:
+        transaction.on_commit(publish, robust=True)
+
+
+def format_event(event):
+    data = json.dumps(event.data, ensure_ascii=False)
+    return f'id: {event.id}\nevent: {event.type}\ndata: {data}\n\n'
+
+
+def _read(broker, project_id, cursor):
+    """(строки для отправки, новый курсор)"""
+    events = broker.events_after(project_id, cursor)
+    if events is None:
+        cursor = broker.latest(project_id)
+        return [format_event(Event(cursor, 'reset', {}))], cursor
+    if events:
+        cursor = events[-1].id
+    return [format_event(event) for event in events], cursor
+
+
+def snapshot(project_id, last_event_id):
+    """
+    Ответ без удержания соединения (под WSGI поток занял бы воркер целиком):
+    накопленные события, и EventSource переподключится через retry.
+    """
+    broker = get_broker()
+    chunks = [f'retry: {settings.EVENTS_POLL_RETRY_MS}\n\n']
+    if not last_event_id:
+        # Пустое сообщение с id только запоминает курсор в EventSource
+        chunks.append(f'id: {broker.latest(project_id)}\n\n')
+        return chunks
+    lines, _ = _read(broker, project_id, last_event_id)
+    return chunks + lines
+
+
+async def stream(project_id, last_event_id):
+    """Поток событий для ASGI: держится EVENTS_STREAM_TIMEOUT секунд, затем переподключение"""
+    broker = get_broker()
+    deadline = time.monotonic() + settings.EVENTS_STREAM_TIMEOUT
+    yield f'retry: {RETRY_MS}\n\n'
+
+    cursor = last_event_id
+    if not cursor:
+        cursor = await sync_to_async(broker.latest)(project_id)
+        yield f'id: {cursor}\n\n'
+    while True:
+        lines, cursor = await sync_to_async(_read)(broker, project_id, cursor)
+        for line in lines:
+            yield line
+        if lines:
+            continue
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if not await broker.wait(project_id, cursor, min(settings.EVENTS_HEARTBEAT, remaining)):
+            # Комментарий не даёт прокси закрыть простаивающее соединение
+            yield ': ping\n\n'
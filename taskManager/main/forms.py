@@ -43,6 +43,29 @@ class ProjectForm(forms.ModelForm):
             raise forms.ValidationError("Название проекта должно содержать минимум 2 символа")
         return name.strip()
 
+class ProjectMemberChoiceField(forms.ModelChoiceField):
+    """
+    Выбор исполнителя среди участников проекта.
+    Принадлежность к проекту проверяется по заранее загруженному множеству ID,
+    без повторного запроса к членству в проекте.
+    """
+    member_ids = None
+    
+    def to_python(self, value):
+        if value in self.empty_values or self.member_ids is None:
+            return super().to_python(value)
+        try:
+            user_id = int(value.pk if isinstance(value, User) else value)
+        except (TypeError, ValueError):
+            user_id = None
+        if user_id not in self.member_ids:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return super().to_python(user_id)
+
 class TaskForm(forms.ModelForm):
     class Meta:
         model = Task
@@ -71,6 +94,9 @@ class TaskForm(forms.ModelForm):
                 'type': 'date'
             }),
         }
+        field_classes = {
+            'assigned_to': ProjectMemberChoiceField,
+        }
         labels = {
             'title': 'Название задачи',
             'description': 'Описание',
@@ -86,11 +112,24 @@ class TaskForm(forms.ModelForm):
         
         # Ограничиваем выбор исполнителей участниками проекта
         if self.project:
-            self.fields['assigned_to'].queryset = self.project.team_members.all()
+            # Участники загружаются один раз и используются и формой, и Task.save()
+            self.member_ids = self.project.get_member_ids()
+            self.fields['assigned_to'].member_ids = self.member_ids
+            self.fields['assigned_to'].queryset = User.objects.filter(id__in=self.member_ids)
             # Добавляем пустое значение
             self.fields['assigned_to'].empty_label = "Не назначено"
         else:
+            self.member_ids = None
             self.fields['assigned_to'].queryset = User.objects.filter(is_active=True)
+    
+    def save(self, commit=True):
+        task = super().save(commit=False)
+        if self.member_ids is not None:
+            task._validated_member_ids = self.member_ids
+        if commit:
+            task.save()
+            self._save_m2m()
+        return task
 
 class ProjectInviteForm(forms.Form):
     user = forms.ModelChoiceField(
@@ -0,0 +1,116 @@
+"""
+Кэш фрагментов шаблонов с точной инвалидацией по версии проекта.
+
+У каждого проекта в общем кэше хранится номер версии. Любая запись Task
+(через хуки счётчиков в stats.py), ProjectMembership или Project (signals.py)
+меняет его, поэтому фрагменты со старой версией в ключе просто перестают
+находиться - без таймаутов и перебора ключей. Фрагменты кэширует тег
+{% projectcache %} из templatetags/fragment_cache.py.
+
+Страница с несколькими фрагментами читает их заранее (FragmentBatch): версии
+всех проектов одним get_many и сами фрагменты вторым, иначе с DatabaseCache
+каждая карточка проекта стоила бы двух запросов к cache_table.
+
+Счётчики попаданий и промахов по каждому фрагменту ведутся в памяти процесса
+(fragment_stats()), общие попадания запроса попадают в Server-Timing.
+"""
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from .profiling import record_cache
+
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_stats_lock = threading.Lock()
+
+
+def _version_key(project_id):
+    return f'fragment:v:{project_id}'
+
+
+def get_project_version(project_id):
+    return get_project_versions([project_id])[project_id]
+
+
+def get_project_versions(project_ids):
+    """{project_id: версия} одним get_many; недостающие версии создаются"""
+    keys = {_version_key(project_id): project_id for project_id in project_ids}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+class FragmentBatch:
+    """
+    Фрагменты страницы, прочитанные двумя get_many: [(имя, project_id, vary_on), ...].
+    Кладётся в контекст шаблона как fragment_batch; тег {% projectcache %} берёт
+    из него версии и содержимое, а фрагменты, которых в пачке нет, читает сам.
+    """
+
+    def __init__(self, fragments):
+        fragments = list(fragments)
+        self.versions = get_project_versions({project_id for _, project_id, _ in fragments})
+        self.keys = {fragment_key(name, project_id, vary_on, self.versions) for name, project_id, vary_on in fragments}
+        self.contents = cache.get_many(self.keys) if self.keys else {}
+
+
+def _bump(project_ids):
+    cache.set_many({_version_key(project_id): time.time_ns() for project_id in project_ids}, None)
+
+
+def bump_project_versions(*project_ids):
+    """
+    Делает устаревшими все закэшированные фрагменты проектов.
+    Как и в access.py, повторяем после коммита: параллельный запрос мог
+    закэшировать фрагмент по данным, прочитанным до конца транзакции.
+    """
+    project_ids = {project_id for project_id in project_ids if project_id is not None}
+    if not project_ids:
+        return
+    _bump(project_ids)
+    transaction.on_commit(lambda: _bump(project_ids))
+
+
+def fragment_key(name, project_id, vary_on=(), versions=None):
+    if versions is not None and project_id in versions:
+        version = versions[project_id]
+    else:
+        version = get_project_version(project_id)
+    return make_template_fragment_key(f'{name}:{project_id}:{version}', vary_on)
+
+
+def get_fragment(name, project_id, vary_on=(), batch=None):
+    """(ключ, HTML фрагмента или None); отмечает попадание или промах"""
+    key = fragment_key(name, project_id, vary_on, batch.versions if batch else None)
+    if batch is not None and key in batch.keys:
+        content = batch.contents.get(key)
+    else:
+        content = cache.get(key)
+    hit = content is not None
+    with _stats_lock:
+        _stats[name]['hits' if hit else 'misses'] += 1
+    record_cache(hit)
+    return key, content
+
+
+def set_fragment(key, content):
+    cache.set(key, content, getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 24 * 3600))
+
+
+def fragment_stats():
+    """{имя фрагмента: {'hits': ..., 'misses': ...}} с запуска процесса"""
+    with _stats_lock:
+        return {name: dict(counts) for name, counts in _stats.items()}
+
+
+def reset_fragment_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,18 @@
+"""Фоновые задания приложения main (выполняет manage.py runworker)"""
+from django.contrib.auth import get_user_model
+from jobs.queue import job
+from .models import Project, ProjectMembership
+
+
+@job()
+def add_project_members(project_id, user_ids, role):
+    """Массовое добавление участников из админки"""
+    project = Project.objects.filter(id=project_id).first()
+    if project is None:
+        return
+    existing = set(project.projectmembership_set.values_list('user_id', flat=True))
+    users = get_user_model().objects.filter(id__in=user_ids).exclude(id__in=existing)
+    # По одной записи: сигналы членства сбрасывают кэш доступа и публикуют события доски
+    for user in users:
+        ProjectMembership.objects.get_or_create(project=project, user=user, defaults={'role': role})
+
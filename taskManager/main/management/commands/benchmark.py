@@ -0,0 +1,61 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from main import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет p50/p95, число запросов и пиковую память горячих страниц '
+        'на временной тестовой БД с данными заданного размера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', default='small', choices=sorted(benchmark.SCALES))
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='*', help='Замерять только эти страницы')
+        parser.add_argument('--output', help='Сохранить отчёт в JSON-файл')
+        parser.add_argument('--compare', help='JSON прошлого прогона: вывести регрессии')
+        parser.add_argument(
+            '--threshold', type=float, default=20.0,
+            help='Допустимый рост p95 в процентах при --compare',
+        )
+        parser.add_argument('--keepdb', action='store_true', help='Не удалять тестовую БД')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            baseline = json.loads(Path(options['compare']).read_text(encoding='utf-8'))
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, keepdb=options['keepdb'])
+        try:
+            self.stdout.write(f'Заполнение данных: {options["scale"]}...')
+            dataset = benchmark.seed(options['scale'], seed=options['seed'])
+            results = benchmark.run(dataset, options['iterations'], only=options['only'])
+            report = benchmark.report(dataset, results, options['iterations'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        self.stdout.write(f'{"Страница":30} {"код":>4} {"p50, мс":>9} {"p95, мс":>9} {"запросов":>9} {"память, КБ":>11}')
+        for name, row in results.items():
+            self.stdout.write(
+                f'{name:30} {row["status"]:>4} {row["p50_ms"]:>9} {row["p95_ms"]:>9} '
+                f'{row["queries"]:>9} {row["peak_kb"]:>11}'
+            )
+
+        if options['output']:
+            Path(options['output']).write_text(
+                json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8'
+            )
+            self.stdout.write(f'Отчёт сохранён в {options["output"]}')
+
+        if baseline is not None:
+            regressions = benchmark.compare(baseline, report, options['threshold'])
+            if regressions:
+                raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from main import datagen
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует синтетический набор данных продакшен-масштаба. '
+        'Повторный запуск с теми же параметрами досоздаёт недостающее'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--projects', type=int, default=2000)
+        parser.add_argument('--tasks', type=int, default=1000000, help='Всего задач')
+        parser.add_argument('--members', type=int, default=8, help='Среднее число участников проекта')
+        parser.add_argument('--colleagues', type=int, default=5, help='Среднее число запросов в коллеги от пользователя')
+        parser.add_argument('--alpha', type=float, default=datagen.DEFAULT_ALPHA, help='Показатель степени Парето')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='gen', help='Префикс имён пользователей и проектов набора')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько строк записывать за одну транзакцию',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['projects'] < 0 or options['tasks'] < 0:
+            raise CommandError('Нужен хотя бы один пользователь, размеры не могут быть отрицательными')
+
+        plan = datagen.Plan(
+            users=options['users'],
+            projects=options['projects'],
+            tasks=options['tasks'],
+            members=options['members'],
+            colleagues=options['colleagues'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            alpha=options['alpha'],
+        )
+        started = time.monotonic()
+        datagen.Generator(plan, options['batch_size'], log=self.stdout.write).run()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.0f} с. Пароль пользователей: {datagen.PASSWORD}'
+        ))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.models import Project
+from main.transfer import FORMATS, detect_format, import_tasks, read_rows
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Импортирует задачи в проект из файла CSV или JSON Lines (потоком, пачками)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int, help='ID проекта')
+        parser.add_argument('path', help='Путь к файлу')
+        parser.add_argument(
+            '--format', choices=FORMATS, default=None,
+            help='Формат файла (по умолчанию - по расширению)',
+        )
+        parser.add_argument(
+            '--user', default=None,
+            help='Логин автора задач (по умолчанию - создатель проекта)',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Строк в одной пачке (по умолчанию TASK_IMPORT_CHUNK_SIZE)',
+        )
+
+    def handle(self, *args, **options):
+        project = Project.objects.select_related('created_by').filter(id=options['project_id']).first()
+        if project is None:
+            raise CommandError(f'Проект {options["project_id"]} не найден')
+        user = project.created_by
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f'Пользователь {options["user"]} не найден')
+
+        file_format = options['format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as file:
+                report = import_tasks(project, user, read_rows(file, file_format), options['chunk_size'])
+        except OSError as error:
+            raise CommandError(str(error))
+
+        for line, message in report.errors:
+            self.stderr.write(f'Строка {line}: {message}')
+        self.stdout.write(self.style.SUCCESS(f'Готово: создано задач {report.created}'))
+        if report.failed:
+            self.stdout.write(self.style.WARNING(f'Отклонено строк: {report.failed}'))
@@ -0,0 +1,141 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection
+from importlib import import_module
+from pathlib import Path
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from main.benchmark import percentile
+
+
+def _fetch(url, headers, timeout):
+    """GET-запрос по новому соединению, возвращает код ответа"""
+    parts = urlsplit(url)
+    connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+    connection = connection_class(parts.netloc, timeout=timeout)
+    try:
+        connection.request('GET', parts.path + (f'?{parts.query}' if parts.query else ''), headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def _worker(urls, headers, warmup_until, deadline, timeout):
+    """Запросы по кругу до deadline: (задержки успешных в мс, число ошибок)"""
+    latencies = []
+    errors = 0
+    i = 0
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            return latencies, errors
+        url = urls[i % len(urls)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            status = _fetch(url, headers, timeout)
+        except OSError:
+            status = None
+        if now < warmup_until:
+            continue
+        if status == 200:
+            latencies.append((time.perf_counter() - start) * 1000)
+        else:
+            errors += 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест работающего сервера: пропускная способность и задержки '
+        'страниц под авторизованным пользователем. Запускайте с тем же числом воркеров '
+        'в режимах SERVER_MODE=wsgi и asgi и сравнивайте через --compare'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='Адреса страниц, запрашиваются по кругу')
+        parser.add_argument('--user', required=True, help='Username, от имени которого идут запросы')
+        parser.add_argument('--concurrency', type=int, default=16, help='Одновременных клиентов')
+        parser.add_argument('--duration', type=float, default=30, help='Длительность замера, с')
+        parser.add_argument('--warmup', type=float, default=3, help='Прогрев перед замером, с')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--label', default='', help='Подпись прогона, например wsgi или asgi')
+        parser.add_argument('--output', help='Сохранить результат в JSON-файл')
+        parser.add_argument('--compare', help='JSON прошлого прогона: вывести изменение пропускной способности')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            baseline = json.loads(Path(options['compare']).read_text(encoding='utf-8'))
+
+        session = self._login(options['user'])
+        headers = {
+            'Cookie': f'{settings.SESSION_COOKIE_NAME}={session.session_key}',
+            # Сервер за nginx: без заголовка прокси SECURE_SSL_REDIRECT отвечал бы редиректом
+            'X-Forwarded-Proto': 'https',
+        }
+        concurrency = options['concurrency']
+        started = time.monotonic()
+        warmup_until = started + options['warmup']
+        deadline = warmup_until + options['duration']
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = [
+                    pool.submit(_worker, options['urls'], headers, warmup_until, deadline, options['timeout'])
+                    for _ in range(concurrency)
+                ]
+                parts = [future.result() for future in futures]
+        finally:
+            session.delete()
+
+        latencies = [latency for part, _ in parts for latency in part]
+        errors = sum(part_errors for _, part_errors in parts)
+        if not latencies:
+            raise CommandError(f'Нет успешных ответов (ошибок: {errors}). Проверьте адрес и --user')
+
+        result = {
+            'label': options['label'],
+            'urls': options['urls'],
+            'concurrency': concurrency,
+            'duration': options['duration'],
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': round(len(latencies) / options['duration'], 1),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+        }
+        self.stdout.write(
+            f'{result["label"] or "прогон"}: {result["rps"]} запросов/с, '
+            f'p50 {result["p50_ms"]} мс, p95 {result["p95_ms"]} мс, p99 {result["p99_ms"]} мс, '
+            f'ошибок {errors} из {len(latencies) + errors}'
+        )
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+            self.stdout.write(f'Результат сохранён в {options["output"]}')
+
+        if baseline is not None:
+            change = (result['rps'] - baseline['rps']) / baseline['rps'] * 100 if baseline['rps'] else 0
+            self.stdout.write(
+                f'Пропускная способность: {baseline["rps"]} ({baseline.get("label") or "база"}) -> '
+                f'{result["rps"]} ({result["label"] or "сейчас"}), {change:+.1f}%'
+            )
+
+    @staticmethod
+    def _login(username):
+        """Сессия пользователя в хранилище сервера (нужны та же БД и SECRET_KEY)"""
+        try:
+            user = get_user_model().objects.get(username=username)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Пользователь {username} не найден')
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session
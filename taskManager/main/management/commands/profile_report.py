@@ -0,0 +1,63 @@
+import io
+import pstats
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from main.profiling import PROFILE_NAME_RE, profile_dir
+
+
+class Command(BaseCommand):
+    help = 'Сводка по сохранённым cProfile-дампам медленных запросов (по представлениям)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--view',
+            help='Показать самые дорогие функции для представления, например main:dashboard',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help='Сколько функций выводить для --view',
+        )
+        parser.add_argument(
+            '--sort', default='cumulative', choices=['cumulative', 'tottime', 'calls'],
+            help='Сортировка функций для --view',
+        )
+
+    def handle(self, *args, **options):
+        by_view = defaultdict(list)
+        for path in sorted(profile_dir().glob('*.prof')):
+            match = PROFILE_NAME_RE.match(path.name)
+            if match:
+                by_view[match['view']].append((int(match['ms']), path))
+
+        if not by_view:
+            self.stdout.write(f'Дампов нет в {profile_dir()}')
+            return
+
+        if options['view']:
+            self.show_view(by_view, options)
+            return
+
+        self.stdout.write(f'{"Представление":40} {"дампов":>7} {"сред., мс":>10} {"макс., мс":>10}')
+        rows = sorted(by_view.items(), key=lambda item: -sum(ms for ms, _ in item[1]))
+        for view, dumps in rows:
+            durations = [ms for ms, _ in dumps]
+            self.stdout.write(
+                f'{view.replace(".", ":", 1):40} {len(dumps):>7} '
+                f'{sum(durations) // len(durations):>10} {max(durations):>10}'
+            )
+
+    def show_view(self, by_view, options):
+        view = options['view'].replace(':', '.')
+        dumps = by_view.get(view)
+        if not dumps:
+            self.stderr.write(f'Для {options["view"]} дампов нет')
+            return
+
+        # Статистика всех дампов представления складывается
+        output = io.StringIO()
+        stats = pstats.Stats(str(dumps[0][1]), stream=output)
+        for _, path in dumps[1:]:
+            stats.add(str(path))
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(f'{options["view"]}: {len(dumps)} дампов')
+        self.stdout.write(output.getvalue())
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from main.models import Project
+from main.stats import rebuild_project_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики ProjectStats по таблице задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'project_ids', nargs='*', type=int,
+            help='ID проектов (по умолчанию - все проекты)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько проектов пересчитывать за одну транзакцию',
+        )
+
+    def handle(self, *args, **options):
+        project_ids = options['project_ids'] or list(
+            Project.objects.order_by('id').values_list('id', flat=True)
+        )
+        batch_size = options['batch_size']
+
+        total = 0
+        for start in range(0, len(project_ids), batch_size):
+            total += rebuild_project_stats(project_ids[start:start + batch_size])
+            self.stdout.write(f'Пересчитано проектов: {total}/{len(project_ids)}')
+
+        self.stdout.write(self.style.SUCCESS(f'Готово: статистика обновлена для {total} проектов'))
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def fill_project_stats(apps, schema_editor):
+    """Заполняет счётчики для уже существующих проектов"""
+    Project = apps.get_model('main', 'Project')
+    ProjectStats = apps.get_model('main', 'ProjectStats')
+    Task = apps.get_model('main', 'Task')
+
+    active = ['todo', 'in_progress']
+    aggregated = {
+        row.pop('project_id'): row
+        for row in Task.objects.values('project_id').annotate(
+            total=Count('id'),
+            todo=Count('id', filter=Q(status='todo')),
+            in_progress=Count('id', filter=Q(status='in_progress')),
+            review=Count('id', filter=Q(status='review')),
+            done=Count('id', filter=Q(status='done')),
+            low=Count('id', filter=Q(priority='low')),
+            medium=Count('id', filter=Q(priority='medium')),
+            high=Count('id', filter=Q(priority='high')),
+            high_active=Count('id', filter=Q(priority='high', status__in=active)),
+            last_activity=Max('updated_at'),
+        ).order_by()
+    }
+    # overdue_as_of остаётся пустым - счётчик просроченных посчитается при первом чтении
+    ProjectStats.objects.bulk_create(
+        [
+            ProjectStats(project_id=project_id, **aggregated.get(project_id, {}))
+            for project_id in Project.objects.values_list('id', flat=True)
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_alter_projectmembership_can_edit_tasks_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectStats',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='main.project')),
+                ('total', models.IntegerField(default=0)),
+                ('todo', models.IntegerField(default=0)),
+                ('in_progress', models.IntegerField(default=0)),
+                ('review', models.IntegerField(default=0)),
+                ('done', models.IntegerField(default=0)),
+                ('low', models.IntegerField(default=0)),
+                ('medium', models.IntegerField(default=0)),
+                ('high', models.IntegerField(default=0)),
+                ('high_active', models.IntegerField(default=0)),
+                ('overdue', models.IntegerField(default=0)),
+                ('overdue_as_of', models.DateField(blank=True, null=True)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Статистика проекта',
+                'verbose_name_plural': 'Статистика проектов',
+            },
+        ),
+        migrations.RunPython(fill_project_stats, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
     
@@ -21,13 +22,30 @@ class Project(models.Model):
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Прежний создатель нужен для сброса его индекса доступа, если создателя поменяют
+        instance._loaded_created_by_id = instance.__dict__.get('created_by_id')
+        return instance
+    
     def get_team_members(self):
         """Возвращает всех участников проекта с их ролями"""
         return self.projectmembership_set.select_related('user')
     
+    def get_member_ids(self):
+        """Множество ID участников проекта вместе с создателем (один запрос, кэшируется в объекте)"""
+        if getattr(self, '_member_ids', None) is None:
+            self._member_ids = set(
+                self.projectmembership_set.values_list('user_id', flat=True)
+            )
+            self._member_ids.add(self.created_by_id)
+        return self._member_ids
+    
     def is_user_in_project(self, user):
         """Проверяет, является ли пользователь участником проекта"""
-        return self.team_members.filter(id=user.id).exists() or self.created_by == user
+        from .access import get_project_role
+        return get_project_role(user, self.id) is not None
     
     class Meta:
         ordering = ['name']
@@ -56,6 +74,86 @@ class ProjectMembership(models.Model):
         return f"{self.user.username} - {self.project.name} ({self.get_role_display()})"
     
 # models.py
+class TaskQuerySet(models.QuerySet):
+    """
+    Массовые операции с задачами: проверяют исполнителей одной пачкой
+    и обновляют ProjectStats и события досок, так как сигналы save/delete
+    для них не вызываются.
+    """
+    
+    def bulk_create(self, objs, *args, member_ids=None, events=True, **kwargs):
+        """events=False - событие на каждую задачу не публикуется (импорт публикует итог пачки)"""
+        from .events import publish_tasks
+        from .stats import apply_task_changes
+        
+        objs = list(objs)
+        self.model.validate_assignees(objs, member_ids)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            apply_task_changes((None, task.counters_state()) for task in objs)
+            if events:
+                publish_tasks('task.created', objs)
+        for task in objs:
+            task._loaded_counters_state = task.counters_state()
+            task._loaded_assignment = (task.project_id, task.assigned_to_id)
+        return created
+    
+    def bulk_update(self, objs, fields, *args, member_ids=None, **kwargs):
+        from .events import publish_tasks
+        from .stats import apply_task_changes
+        
+        objs = list(objs)
+        field_names = {self.model._meta.get_field(name).attname for name in fields}
+        if field_names & {'project_id', 'assigned_to_id'}:
+            self.model.validate_assignees(objs, member_ids)
+        
+        with transaction.atomic(using=self.db):
+            changes = []
+            if field_names & set(self.model.COUNTER_FIELDS):
+                # Старое состояние берём из загруженных объектов, недостающее - одним запросом
+                unknown = [task.pk for task in objs if getattr(task, '_loaded_counters_state', None) is None]
+                stored = {
+                    row.pop('id'): row
+                    for row in self.model._base_manager.filter(pk__in=unknown).values('id', *self.model.COUNTER_FIELDS)
+                } if unknown else {}
+                for task in objs:
+                    old_state = getattr(task, '_loaded_counters_state', None) or stored.get(task.pk)
+                    changes.append((old_state, task.counters_state()))
+            updated = super().bulk_update(objs, fields, *args, **kwargs)
+            apply_task_changes(changes)
+            publish_tasks('task.updated', objs)
+        for task in objs:
+            task._loaded_counters_state = task.counters_state()
+            task._loaded_assignment = (task.project_id, task.assigned_to_id)
+        return updated
+    
+    def update_with_stats(self, **values):
+        """
+        update() для массовых правок (админка, удаление участника): в той же транзакции
+        применяет разницу счётчиков ProjectStats (а с ней - версии фрагментов и страниц)
+        и публикует task.updated по каждой изменённой задаче. Возвращает число задач.
+        """
+        from .events import publish_tasks
+        from .stats import apply_task_changes
+        
+        counter_values = {
+            self.model._meta.get_field(name).attname: value for name, value in values.items()
+        }
+        counter_values = {name: value for name, value in counter_values.items() if name in self.model.COUNTER_FIELDS}
+        with transaction.atomic(using=self.db):
+            old_states = {
+                row.pop('id'): row
+                for row in self.select_for_update().values('id', *self.model.COUNTER_FIELDS)
+            }
+            if not old_states:
+                return 0
+            tasks = self.model._base_manager.filter(pk__in=list(old_states))
+            updated = tasks.update(updated_at=timezone.now(), **values)
+            apply_task_changes((state, {**state, **counter_values}) for state in old_states.values())
+            publish_tasks('task.updated', tasks.order_by('id'))
+        return updated
+
+
 class Task(models.Model):
     STATUS_CHOICES = [
         ('todo', 'К выполнению'),
@@ -72,7 +170,8 @@ class Task(models.Model):
     
     title = models.CharField(max_length=200, verbose_name="Задача")
     description = models.TextField(blank=True, verbose_name="Описание")
-    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='tasks')
+    # Отдельный индекс не нужен: все составные индексы задач начинаются с project (см. Meta.indexes)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='tasks', db_index=False)
     
     # ИСПРАВЛЕННОЕ поле assigned_to - убрана сложная валидация
     assigned_to = models.ForeignKey(
@@ -81,7 +180,9 @@ class Task(models.Model):
         null=True, 
         blank=True,
         related_name='assigned_tasks', 
-        verbose_name="Исполнитель"
+        verbose_name="Исполнитель",
+        # Покрыт индексом (assigned_to, status)
+        db_index=False,
     )
     
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_tasks')
@@ -91,14 +192,122 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = TaskQuerySet.as_manager()
+    
+    # Поля, от которых зависят счётчики ProjectStats
+    COUNTER_FIELDS = ('project_id', 'status', 'priority', 'due_date')
+    
     def __str__(self):
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженное состояние, чтобы пересчитать счётчики проекта
+        # и проверить исполнителя без лишних запросов. Отложенные поля не трогаем.
+        loaded = instance.__dict__
+        instance._loaded_counters_state = None
+        if all(field in loaded for field in cls.COUNTER_FIELDS):
+            instance._loaded_counters_state = instance.counters_state()
+        instance._loaded_assignment = (loaded.get('project_id'), loaded.get('assigned_to_id'))
+        return instance
+    
+    def counters_state(self):
+        """Поля задачи, от которых зависят счётчики ProjectStats"""
+        return {field: getattr(self, field) for field in self.COUNTER_FIELDS}
+    
+    @classmethod
+    def validate_assignees(cls, tasks, member_ids=None):
+        """
+        Проверяет пачку задач: исполнитель каждой должен быть участником или создателем проекта.
+        member_ids - уже известные участники ({project_id: set(user_id)}), для них запросов нет.
+        Остальные пары (проект, исполнитель) проверяются двумя запросами на всю пачку.
+        """
+        member_ids = member_ids or {}
+        pairs = set()
+        for task in tasks:
+            if task.assigned_to_id is None:
+                continue
+            known = member_ids.get(task.project_id)
+            if known is not None:
+                if task.assigned_to_id not in known:
+                    raise ValueError("Исполнитель должен быть участником проекта")
+            else:
+                pairs.add((task.project_id, task.assigned_to_id))
+        if not pairs:
+            return
+        
+        project_ids = {project_id for project_id, _ in pairs}
+        allowed = set(ProjectMembership.objects.filter(
+            project_id__in=project_ids,
+            user_id__in={user_id for _, user_id in pairs},
+        ).values_list('project_id', 'user_id'))
+        allowed |= set(Project.objects.filter(id__in=project_ids).values_list('id', 'created_by_id'))
+        if pairs - allowed:
+            raise ValueError("Исполнитель должен быть участником проекта")
+    
     def save(self, *args, **kwargs):
         """Проверяем, что исполнитель состоит в проекте"""
-        if self.assigned_to and not self.project.is_user_in_project(self.assigned_to):
-            raise ValueError("Исполнитель должен быть участником проекта")
-        super().save(*args, **kwargs)
+        # Исполнитель и проект не менялись с загрузки - проверка уже была при назначении
+        assignment = (self.project_id, self.assigned_to_id)
+        if getattr(self, '_loaded_assignment', None) != assignment:
+            known = getattr(self, '_validated_member_ids', None)
+            self.validate_assignees([self], {self.project_id: known} if known is not None else None)
+        # Сохранение задачи и обновление счётчиков проекта - в одной транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._loaded_assignment = assignment
+    
+    class Meta:
+        ordering = ['-created_at']
+        # Под каждую сортировку списка задач проекта (см. TASK_SORT_ORDERS в views.py)
+        indexes = [
+            models.Index(fields=['project', 'created_at', 'id'], name='task_project_created_idx'),
+            models.Index(fields=['project', 'title', 'id'], name='task_project_title_idx'),
+            models.Index(fields=['project', 'status', 'id'], name='task_project_status_idx'),
+            models.Index(fields=['project', 'priority', 'id'], name='task_project_priority_idx'),
+            models.Index(fields=['project', 'due_date', 'id'], name='task_project_due_idx'),
+            # «Мои задачи» и фильтр по статусу в них
+            models.Index(fields=['assigned_to', 'status'], name='task_assignee_status_idx'),
+            # Просроченные активные задачи: равенство по статусу, диапазон по сроку
+            models.Index(fields=['status', 'due_date'], name='task_status_due_idx'),
+        ]
+
+
+class ProjectStats(models.Model):
+    """
+    Денормализованные счётчики задач проекта.
+    Обновляются при создании, удалении и изменении задач (см. signals.py),
+    пересчитываются командой reconcile_project_stats.
+    """
+    project = models.OneToOneField(
+        Project, on_delete=models.CASCADE, primary_key=True, related_name='stats'
+    )
+    total = models.IntegerField(default=0)
+    
+    # По статусам
+    todo = models.IntegerField(default=0)
+    in_progress = models.IntegerField(default=0)
+    review = models.IntegerField(default=0)
+    done = models.IntegerField(default=0)
+    
+    # По приоритетам
+    low = models.IntegerField(default=0)
+    medium = models.IntegerField(default=0)
+    high = models.IntegerField(default=0)
+    high_active = models.IntegerField(default=0)  # высокий приоритет среди активных задач
+    
+    # Просроченные активные задачи на дату overdue_as_of
+    overdue = models.IntegerField(default=0)
+    overdue_as_of = models.DateField(null=True, blank=True)
+    
+    last_activity = models.DateTimeField(null=True, blank=True)
+    # Любое изменение задач, команды или самого проекта - версия для ETag страниц (conditional.py)
+    changed_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        verbose_name = 'Статистика проекта'
+        verbose_name_plural = 'Статистика проектов'
+    
+    def __str__(self):
+        return f"{self.project_id}: {self.total} задач"
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+Keyset-пагинация: следующая страница выбирается условием «строго после
+последней показанной строки» по полям сортировки, а не OFFSET.
+Стоимость страницы не зависит от её номера, если есть индекс по этим полям.
+
+Последнее поле сортировки должно быть уникальным (обычно id) - это
+гарантирует стабильный порядок при одинаковых значениях. Сортировать можно
+по полям модели и по аннотациям queryset.
+NULL всегда идут в конце, в обоих направлениях и во всех СУБД.
+
+Для постраничных списков с номерами страниц (админка) - EstimatedCountPaginator:
+на больших выборках вместо COUNT(*) берётся оценка планировщика PostgreSQL.
+"""
+import base64
+import datetime
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+
+
+def _parse_ordering(queryset, ordering):
+    """[(имя, по убыванию, поле модели или output_field аннотации), ...]"""
+    fields = []
+    for name in ordering:
+        desc = name.startswith('-')
+        name = name.lstrip('-')
+        if name in queryset.query.annotations:
+            field = queryset.query.annotations[name].output_field
+        else:
+            field = queryset.model._meta.get_field(name)
+        fields.append((name, desc, field))
+    return fields
+
+
+def _serialize(value):
+    # isoformat сохраняет микросекунды (DjangoJSONEncoder их обрезает)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(obj, fields):
+    """Курсор из значений полей сортировки объекта"""
+    values = [_serialize(getattr(obj, name)) for name, _, _ in fields]
+    data = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """Значения полей из курсора или None, если курсор испорчен"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(values) != len(fields):
+            return None
+        return [
+            None if value is None else field.to_python(value)
+            for (_, _, field), value in zip(fields, values)
+        ]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def _after(fields, values):
+    """Условие «строка идёт после values» для сортировки fields"""
+    condition = Q()
+    equal = Q()
+    for (name, desc, field), value in zip(fields, values):
+        if value is None:
+            # После NULL на этом поле идут только такие же NULL
+            equal &= Q(**{f'{name}__isnull': True})
+            continue
+        step = Q(**{f'{name}__{"lt" if desc else "gt"}': value})
+        if field.null:
+            step |= Q(**{f'{name}__isnull': True})
+        condition |= equal & step
+        equal &= Q(**{name: value})
+    return condition
+
+
+def keyset_queryset(queryset, ordering, cursor=None):
+    """
+    queryset, упорядоченный по ordering и начинающийся после курсора (без LIMIT).
+    Возвращает (queryset, поля сортировки для курсора).
+    """
+    fields = _parse_ordering(queryset, ordering)
+    # nulls_last только для nullable-полей: иначе PostgreSQL не сможет
+    # пройти индекс в обратном направлении для сортировки по убыванию
+    queryset = queryset.order_by(*[
+        getattr(F(name), 'desc' if desc else 'asc')(nulls_last=True if field.null else None)
+        for name, desc, field in fields
+    ])
+    values = decode_cursor(cursor, fields) if cursor else None
+    if values is not None:
+        queryset = queryset.filter(_after(fields, values))
+    return queryset, fields
+
+
+def paginate_keyset(queryset, ordering, cursor=None, per_page=50):
+    """
+    Возвращает (объекты страницы, курсор следующей страницы или None).
+    ordering - поля сортировки, например ('-created_at', '-id').
+    """
+    queryset, fields = keyset_queryset(queryset, ordering, cursor)
+    items = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1], fields)
+    return items, next_cursor
+
+
+def plan_rows(explain_output):
+    """
+    Оценка строк из результата EXPLAIN (FORMAT JSON): [{"Plan": {"Plan Rows": N, ...}}].
+    Драйвер отдаёт его строкой или уже разобранным списком. None, если формат другой.
+    """
+    try:
+        if isinstance(explain_output, (str, bytes)):
+            explain_output = json.loads(explain_output)
+        return int(explain_output[0]['Plan']['Plan Rows'])
+    except (ValueError, TypeError, KeyError, IndexError):
+        return None
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк queryset по статистике планировщика (EXPLAIN без выполнения).
+    None, если СУБД такой оценки не даёт (SQLite) или план не удалось разобрать.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        rows = cursor.fetchall()
+    if not rows or not rows[0]:
+        return None
+    return plan_rows(rows[0][0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator, который не считает большие выборки точно: если планировщик
+    оценивает выборку в ADMIN_COUNT_ESTIMATE_THRESHOLD строк и больше, число
+    страниц строится по оценке. Небольшие выборки и SQLite считаются COUNT(*).
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list) if hasattr(self.object_list, 'query') else None
+        if estimate is None or estimate < settings.ADMIN_COUNT_ESTIMATE_THRESHOLD:
+            return super().count
+        return estimate
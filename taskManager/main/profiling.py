@@ -0,0 +1,201 @@
+"""
+Замеры времени запроса для заголовка Server-Timing и выборочное профилирование.
+
+ServerTimingMiddleware на время запроса заводит RequestTimings (в ContextVar)
+и пишет в ответ заголовок, например:
+    Server-Timing: db;dur=12.4;desc="7 queries", tpl;dur=5.1, cache;desc="hits=3 misses=1", app;dur=31.0
+
+Время шаблонов считает обёртка над render() шаблонного бэкенда Django
+(ставится в MainConfig.ready), попадания в кэш отмечают сами модули через record_cache().
+
+С вероятностью PROFILE_SAMPLE_RATE запрос выполняется под cProfile; если он
+оказался медленнее PROFILE_SLOW_MS, дамп сохраняется в PROFILE_DIR
+(хранятся последние PROFILE_MAX_FILES файлов). Разбор - команда profile_report.
+Под ASGI middleware работает асинхронно и без cProfile.
+"""
+import cProfile
+import random
+import re
+import time
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+_current = ContextVar('request_timings', default=None)
+
+# Имя файла дампа: <время>_<представление>_<длительность>ms.prof
+PROFILE_NAME_RE = re.compile(r'^(?P<stamp>\d{8}T\d{6}-\d{6})_(?P<view>.+)_(?P<ms>\d+)ms\.prof$')
+
+
+class RequestTimings:
+    """Счётчики одного HTTP-запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: время каждого SQL-запроса
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;desc="hits={self.cache_hits} misses={self.cache_misses}"',
+            f'app;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+def record_cache(hit):
+    """Отмечает попадание (hit=True) или промах в кэш для текущего запроса"""
+    timings = _current.get()
+    if timings is not None:
+        if hit:
+            timings.cache_hits += 1
+        else:
+            timings.cache_misses += 1
+
+
+@asynccontextmanager
+async def in_db_thread(manager):
+    """
+    async with для контекстных менеджеров над подключениями (обёртки execute).
+    Подключения у каждого потока свои, а async-ORM ходит в БД из потока sync_to_async,
+    поэтому manager входит и выходит там же, а не в потоке цикла событий.
+    """
+    value = await sync_to_async(manager.__enter__)()
+    try:
+        yield value
+    finally:
+        await sync_to_async(manager.__exit__)(None, None, None)
+
+
+def install_template_timer():
+    """Оборачивает render() шаблонов бэкенда DjangoTemplates (вложенные include считаются внутри)"""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, '_timed', False):
+        return
+    original = Template.render
+
+    @wraps(original)
+    def render(self, *args, **kwargs):
+        timings = _current.get()
+        if timings is None:
+            return original(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            timings.template_time += time.perf_counter() - start
+
+    render._timed = True
+    Template.render = render
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILE_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+def _save_profile(profiler, view_name, duration):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S-%f')
+    safe_view = re.sub(r'[^\w.-]', '.', view_name)
+    profiler.dump_stats(directory / f'{stamp}_{safe_view}_{int(duration * 1000)}ms.prof')
+
+    # Ротация: оставляем только последние PROFILE_MAX_FILES дампов
+    files = sorted(directory.glob('*.prof'))
+    for old in files[:max(0, len(files) - getattr(settings, 'PROFILE_MAX_FILES', 200))]:
+        old.unlink(missing_ok=True)
+
+
+class ServerTimingMiddleware:
+    """
+    Заголовок Server-Timing для каждого ответа и cProfile-дампы медленных запросов.
+    Работает и синхронно, и асинхронно: под ASGI async-представления не уходят в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profiler = self._start_profiler()
+        try:
+            with self._db_timer(timings):
+                response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _current.reset(token)
+
+        duration = timings.total_time
+        if profiler is not None and duration * 1000 >= getattr(settings, 'PROFILE_SLOW_MS', 500):
+            match = getattr(request, 'resolver_match', None)
+            _save_profile(profiler, match.view_name if match else 'unresolved', duration)
+        return self._add_header(response, timings)
+
+    async def __acall__(self, request):
+        # Без cProfile: он профилирует поток целиком, а в цикле событий идут и чужие запросы
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            async with in_db_thread(self._db_timer(timings)):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._add_header(response, timings)
+
+    @staticmethod
+    def _add_header(response, timings):
+        if getattr(settings, 'SERVER_TIMING_ENABLED', True):
+            response['Server-Timing'] = timings.header()
+        return response
+
+    @staticmethod
+    def _start_profiler():
+        rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0.0)
+        if not rate or random.random() >= rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # В этом потоке уже работает другой профилировщик
+            return None
+        return profiler
+
+    @staticmethod
+    @contextmanager
+    def _db_timer(timings):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            yield
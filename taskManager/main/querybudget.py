@@ -0,0 +1,203 @@
+"""
+Бюджет SQL-запросов на представление и поиск N+1.
+
+QueryRecorder записывает все запросы (через connection.execute_wrapper),
+группирует их по «отпечатку» - SQL без литералов и с IN (...) вместо списка
+параметров - и для повторяющихся запоминает место вызова в коде проекта.
+Один и тот же отпечаток, повторённый много раз, почти всегда означает запрос в цикле.
+
+QueryBudgetMiddleware проверяет каждый запрос к сайту по лимитам из
+settings.QUERY_BUDGETS ({'main:dashboard': 10, ...}). По умолчанию включён только
+при DEBUG и в тестах (QUERY_BUDGET_ENABLED). Нарушения пишутся в лог,
+при QUERY_BUDGET_RAISE=True (в тестах) - выбрасывают исключение.
+"""
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from .profiling import in_db_thread
+
+logger = logging.getLogger(__name__)
+
+# Сколько одинаковых запросов за один HTTP-запрос считается признаком N+1
+DEFAULT_REPEAT_THRESHOLD = 5
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_RE = re.compile(r'%s|\?')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+_PROJECT_DIR = str(Path(settings.BASE_DIR).resolve())
+_THIS_FILE = str(Path(__file__).resolve())
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Представление превысило бюджет запросов или повторяет один запрос в цикле"""
+
+
+def fingerprint(sql):
+    """SQL без конкретных значений: запросы, отличающиеся только параметрами, совпадают"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PARAM_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def _wrapper_codes():
+    """Код всех установленных обёрток execute (свои и чужие, например Server-Timing)"""
+    codes = {QueryRecorder.__call__.__code__}
+    for connection in connections.all(initialized_only=True):
+        for wrapper in connection.execute_wrappers:
+            call = wrapper if hasattr(wrapper, '__code__') else getattr(type(wrapper), '__call__', None)
+            if hasattr(call, '__code__'):
+                codes.add(call.__code__)
+    return codes
+
+
+def _call_site():
+    """
+    Первый кадр стека из кода проекта (не Django, не сторонние пакеты и не
+    обёртки execute - иначе место вызова указывало бы на внешнюю обёртку)
+    """
+    skip = _wrapper_codes()
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(_PROJECT_DIR)
+            and filename != _THIS_FILE
+            and frame.f_code not in skip
+            and 'site-packages' not in filename
+        ):
+            return f'{Path(filename).relative_to(_PROJECT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return '?'
+
+
+class QueryRecorder:
+    """
+    Записывает SQL-запросы всех подключений внутри блока with.
+    На каждый запрос считается только отпечаток; место вызова (обход стека)
+    запоминается, лишь когда отпечаток повторился threshold раз.
+    """
+
+    def __init__(self, threshold=DEFAULT_REPEAT_THRESHOLD):
+        self.threshold = threshold
+        self.counts = Counter()  # отпечаток -> раз
+        self.sites = {}  # отпечаток -> Counter мест вызова, с threshold-го повтора
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        fp = fingerprint(sql)
+        self.counts[fp] += 1
+        if self.counts[fp] >= self.threshold:
+            self.sites.setdefault(fp, Counter())[_call_site()] += 1
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return self.counts.total()
+
+    def repeated(self):
+        """Отпечатки, повторённые не меньше threshold раз: [(отпечаток, раз, место вызова), ...]"""
+        # Место вызова - самое частое среди повторов: тот же запрос из middleware
+        # (например, загрузка request.user) не заслоняет цикл
+        return [
+            (fp, count, self.sites[fp].most_common(1)[0][0])
+            for fp, count in self.counts.most_common()
+            if count >= self.threshold
+        ]
+
+    def problems(self, budget=None):
+        """Список описаний нарушений (пустой, если всё в порядке)"""
+        problems = []
+        if budget is not None and len(self) > budget:
+            problems.append(f'{len(self)} запросов при бюджете {budget}')
+        for fp, count, site in self.repeated():
+            problems.append(f'N+1: {count} раз из {site}: {fp[:300]}')
+        return problems
+
+
+def query_budget(budget=None, threshold=DEFAULT_REPEAT_THRESHOLD):
+    """
+    Для тестов: with query_budget(10): self.client.get(url)
+    Выбрасывает QueryBudgetExceeded при превышении бюджета или при N+1.
+    """
+    return _BudgetContext(budget, threshold)
+
+
+class _BudgetContext(QueryRecorder):
+
+    def __init__(self, budget, threshold):
+        super().__init__(threshold)
+        self.budget = budget
+
+    def __exit__(self, exc_type, *exc_info):
+        super().__exit__(exc_type, *exc_info)
+        if exc_type is None:
+            problems = self.problems(self.budget)
+            if problems:
+                raise QueryBudgetExceeded('\n'.join(problems))
+
+
+class QueryBudgetMiddleware:
+    """Проверяет число и повторы SQL-запросов каждого представления (в WSGI и в ASGI)"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', True):
+            return self.get_response(request)
+
+        with self._recorder() as recorder:
+            response = self.get_response(request)
+        return self._check(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', True):
+            return await self.get_response(request)
+
+        async with in_db_thread(self._recorder()) as recorder:
+            response = await self.get_response(request)
+        return self._check(request, response, recorder)
+
+    @staticmethod
+    def _recorder():
+        return QueryRecorder(getattr(settings, 'QUERY_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD))
+
+    @staticmethod
+    def _check(request, response, recorder):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        if view_name in getattr(settings, 'QUERY_BUDGET_EXEMPT', ()):
+            return response
+        budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        problems = recorder.problems(budgets.get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None)))
+        if problems:
+            message = f'{view_name} ({request.method} {request.path}): ' + '; '.join(problems)
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
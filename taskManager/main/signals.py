@@ -0,0 +1,141 @@
+from contextvars import ContextVar
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from .access import invalidate_user_access
+from .events import publish_on_commit, task_data
+from .fragments import bump_project_versions
+from .models import Project, ProjectMembership, ProjectStats, Task
+from .stats import apply_task_change, mark_projects_changed, rebuild_project_stats, touch_project_stats
+
+# id проектов, удаляемых в текущем контексте: их задачи удалены одним запросом
+_deleting_projects = ContextVar('deleting_projects', default=frozenset())
+
+
+@receiver(post_save, sender=Project)
+def create_project_stats(sender, instance, created, raw=False, **kwargs):
+    """Создаёт пустую строку статистики для нового проекта"""
+    if created and not raw:
+        ProjectStats.objects.get_or_create(
+            project=instance, defaults={'overdue_as_of': timezone.now().date()}
+        )
+
+
+@receiver(post_save, sender=Task)
+def update_stats_on_task_save(sender, instance, created, raw=False, **kwargs):
+    """Пересчитывает счётчики проекта при создании или изменении задачи"""
+    if raw:
+        return
+    old_state = None if created else getattr(instance, '_loaded_counters_state', None)
+    new_state = instance.counters_state()
+    if not created and old_state is None:
+        # Задача сохранена без загрузки из БД - старое состояние неизвестно
+        rebuild_project_stats([instance.project_id])
+    elif old_state != new_state:
+        apply_task_change(old_state, new_state)
+    else:
+        # Счётчики не изменились, но в проекте была активность
+        touch_project_stats([instance.project_id])
+    instance._loaded_counters_state = new_state
+
+
+@receiver(pre_delete, sender=Project)
+def delete_project_tasks(sender, instance, using, **kwargs):
+    """
+    Удаляет задачи проекта одним DELETE. Каскад уже собрал их (у Task есть
+    получатели сигналов, быстрое удаление Django не применяет), но пересчёт
+    статистики и события на каждую задачу не нужны: статистика удаляется вместе
+    с проектом, версию страниц один раз меняет bump_fragments_on_project_change.
+    """
+    _deleting_projects.set(_deleting_projects.get() | {instance.id})
+    # У задач нет зависимых строк, так что DELETE без сборщика безопасен
+    Task._base_manager.filter(project_id=instance.id)._raw_delete(using)
+
+
+@receiver(post_delete, sender=Project)
+def finish_project_delete(sender, instance, **kwargs):
+    _deleting_projects.set(_deleting_projects.get() - {instance.id})
+
+
+@receiver(post_delete, sender=Task)
+def update_stats_on_task_delete(sender, instance, **kwargs):
+    """Уменьшает счётчики проекта при удалении задачи"""
+    if instance.project_id in _deleting_projects.get():
+        return
+    old_state = getattr(instance, '_loaded_counters_state', None) or instance.counters_state()
+    apply_task_change(old_state, None)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_access_on_project_change(sender, instance, **kwargs):
+    """Сбрасывает индекс доступа создателя проекта"""
+    invalidate_user_access(instance.created_by_id, getattr(instance, '_loaded_created_by_id', None))
+
+
+@receiver(post_save, sender=ProjectMembership)
+@receiver(post_delete, sender=ProjectMembership)
+def invalidate_access_on_membership_change(sender, instance, **kwargs):
+    """Сбрасывает индекс доступа участника при добавлении, изменении роли или удалении"""
+    invalidate_user_access(instance.user_id)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def bump_fragments_on_project_change(sender, instance, **kwargs):
+    """Название, описание, цвет или создатель проекта есть в кэшированных фрагментах"""
+    bump_project_versions(instance.id)
+
+
+@receiver(post_save, sender=ProjectMembership)
+@receiver(post_delete, sender=ProjectMembership)
+def bump_fragments_on_membership_change(sender, instance, **kwargs):
+    """Состав команды и число участников есть в кэшированных фрагментах"""
+    bump_project_versions(instance.project_id)
+
+
+
+@receiver(post_save, sender=Project)
+def mark_project_changed(sender, instance, created, raw=False, **kwargs):
+    """Меняет версию страниц проекта для ETag (новый проект получает её при создании статистики)"""
+    if not created and not raw:
+        mark_projects_changed([instance.id])
+
+
+@receiver(post_save, sender=ProjectMembership)
+@receiver(post_delete, sender=ProjectMembership)
+def mark_project_changed_on_membership(sender, instance, raw=False, **kwargs):
+    """Команда и роли выводятся на страницах проекта"""
+    if not raw:
+        mark_projects_changed([instance.project_id])
+
+
+@receiver(post_save, sender=Task)
+def publish_task_saved(sender, instance, created, raw=False, **kwargs):
+    """Событие для открытых досок проекта; при переносе задачи старая доска её убирает"""
+    if raw:
+        return
+    old_project_id = None if created else (getattr(instance, '_loaded_assignment', None) or (None, None))[0]
+    if old_project_id is not None and old_project_id != instance.project_id:
+        publish_on_commit(old_project_id, 'task.deleted', {'id': instance.id})
+    publish_on_commit(instance.project_id, 'task.created' if created else 'task.updated', task_data(instance))
+
+
+@receiver(post_delete, sender=Task)
+def publish_task_deleted(sender, instance, **kwargs):
+    if instance.project_id in _deleting_projects.get():
+        return
+    publish_on_commit(instance.project_id, 'task.deleted', {'id': instance.id})
+
+
+@receiver(post_save, sender=ProjectMembership)
+@receiver(post_delete, sender=ProjectMembership)
+def publish_membership_change(sender, instance, created=None, raw=False, **kwargs):
+    """Добавление, смена роли и удаление участника"""
+    if raw:
+        return
+    if created is None:
+        event_type = 'member.removed'
+    else:
+        event_type = 'member.added' if created else 'member.updated'
+    publish_on_commit(instance.project_id, event_type, {'user_id': instance.user_id, 'role': instance.role})
@@ -0,0 +1,17 @@
+// Фильтры с поиском в списках админки (AutocompleteFilter в main/admin.py):
+// выбор значения перезагружает список с параметром фильтра
+'use strict';
+{
+    const $ = django.jQuery;
+
+    // select2 сообщает о выборе jQuery-событием change на исходном select
+    $(document).on('change', '.autocomplete-filter select', function() {
+        const base = this.closest('.autocomplete-filter').dataset.baseUrl;
+        if (!this.value) {
+            window.location.search = base;
+            return;
+        }
+        const separator = base.length > 1 ? '&' : '';
+        window.location.search = `${base}${separator}${encodeURIComponent(this.name)}=${encodeURIComponent(this.value)}`;
+    });
+}
@@ -0,0 +1,34 @@
+"""
+WhiteNoise, пригодный для асинхронной цепочки middleware.
+
+WhiteNoiseMiddleware умеет только синхронный вызов, и под ASGI Django оборачивает
+всё, что ниже него, в async_to_sync/sync_to_async - async-представления уходят в поток.
+Здесь тот же поиск файла, но ответ приложения ожидается через await.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # Поиск файла - словарь в памяти (или stat при autorefresh в DEBUG), await не нужен
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
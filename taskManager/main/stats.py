@@ -0,0 +1,225 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Q, When
+from django.utils import timezone
+from .fragments import bump_project_versions
+from .models import Task, ProjectMembership, ProjectStats
+
+# Статусы, которые считаются «активными» (в работе или к выполнению)
+ACTIVE_STATUSES = ('todo', 'in_progress')
+
+# Счётчики, которые возвращаются для каждого проекта
+COUNTERS = ('total', 'todo', 'in_progress', 'review', 'done', 'high_active', 'overdue')
+
+# Счётчики, которые хранятся в ProjectStats
+STORED_COUNTERS = (
+    'total', 'todo', 'in_progress', 'review', 'done',
+    'low', 'medium', 'high', 'high_active', 'overdue',
+)
+
+
+def _empty_stats():
+    stats = {name: 0 for name in STORED_COUNTERS}
+    stats['members'] = 0
+    stats['last_activity'] = None
+    return stats
+
+
+def _stats_as_dict(row):
+    stats = {name: getattr(row, name) for name in STORED_COUNTERS}
+    stats['last_activity'] = row.last_activity
+    return stats
+
+
+def task_counters(state, today=None):
+    """Вклад одной задачи (в виде Task.counters_state()) в счётчики проекта"""
+    today = today or timezone.now().date()
+    active = state['status'] in ACTIVE_STATUSES
+    counters = {'total': 1, state['status']: 1, state['priority']: 1}
+    if active and state['priority'] == 'high':
+        counters['high_active'] = 1
+    if active and state['due_date'] and state['due_date'] < today:
+        counters['overdue'] = 1
+    return counters
+
+
+def _aggregate_counters(project_ids, today):
+    """Пересчитывает счётчики из таблицы Task одним сгруппированным запросом"""
+    return Task.objects.filter(project_id__in=project_ids).values('project_id').annotate(
+        total=Count('id'),
+        todo=Count('id', filter=Q(status='todo')),
+        in_progress=Count('id', filter=Q(status='in_progress')),
+        review=Count('id', filter=Q(status='review')),
+        done=Count('id', filter=Q(status='done')),
+        low=Count('id', filter=Q(priority='low')),
+        medium=Count('id', filter=Q(priority='medium')),
+        high=Count('id', filter=Q(priority='high')),
+        high_active=Count('id', filter=Q(priority='high', status__in=ACTIVE_STATUSES)),
+        overdue=Count('id', filter=Q(due_date__lt=today, status__in=ACTIVE_STATUSES)),
+        last_activity=Max('updated_at'),
+    ).order_by()
+
+
+def apply_task_change(old_state, new_state):
+    """
+    Обновляет счётчики проекта(ов) по разнице между старым и новым состоянием задачи.
+    old_state=None - задача создана, new_state=None - задача удалена.
+    Вызывается внутри транзакции сохранения/удаления задачи.
+    """
+    apply_task_changes([(old_state, new_state)])
+
+
+def apply_task_changes(changes):
+    """
+    То же для пачки изменений [(old_state, new_state), ...]:
+    разницы суммируются, и на каждый затронутый проект выполняется один UPDATE.
+    """
+    today = timezone.now().date()
+    deltas = {}
+    # Проекты, в которых задачи появились или изменились (не только удалены)
+    live_projects = set()
+    for old_state, new_state in changes:
+        if new_state is not None:
+            live_projects.add(new_state['project_id'])
+        for state, sign in ((old_state, -1), (new_state, 1)):
+            if state is None:
+                continue
+            project_deltas = deltas.setdefault(state['project_id'], {})
+            for name, value in task_counters(state, today).items():
+                project_deltas[name] = project_deltas.get(name, 0) + sign * value
+
+    # Все записи задач проходят через счётчики - здесь же устаревают фрагменты шаблонов
+    bump_project_versions(*deltas)
+    now = timezone.now()
+    for project_id, project_deltas in deltas.items():
+        updates = {
+            name: F(name) + value
+            for name, value in project_deltas.items()
+            if value and name != 'overdue'
+        }
+        if project_deltas.get('overdue'):
+            # Счётчик просроченных актуален только на дату overdue_as_of,
+            # устаревшие строки пересчитываются при чтении
+            updates['overdue'] = Case(
+                When(overdue_as_of=today, then=F('overdue') + project_deltas['overdue']),
+                default=F('overdue'),
+            )
+        updated = ProjectStats.objects.filter(project_id=project_id).update(
+            last_activity=now, changed_at=now, **updates
+        )
+        if not updated and project_id in live_projects:
+            # Строки статистики ещё нет - строим её с нуля
+            rebuild_project_stats([project_id])
+
+
+def touch_project_stats(project_ids):
+    """Отмечает активность в проектах без изменения счётчиков (массовые update())"""
+    project_ids = list(project_ids)
+    bump_project_versions(*project_ids)
+    now = timezone.now()
+    ProjectStats.objects.filter(project_id__in=project_ids).update(
+        last_activity=now, changed_at=now
+    )
+
+
+def mark_projects_changed(project_ids):
+    """Меняет версию страниц проектов без активности по задачам (команда, сам проект)"""
+    project_ids = [project_id for project_id in project_ids if project_id is not None]
+    if project_ids:
+        ProjectStats.objects.filter(project_id__in=project_ids).update(changed_at=timezone.now())
+
+
+def rebuild_project_stats(project_ids=None):
+    """
+    Пересчитывает счётчики с нуля по таблице Task.
+    project_ids=None - для всех проектов. Возвращает количество обновлённых проектов.
+    """
+    from .models import Project
+
+    if project_ids is None:
+        project_ids = Project.objects.values_list('id', flat=True)
+    project_ids = list(project_ids)
+    now = timezone.now()
+    today = now.date()
+    bump_project_versions(*project_ids)
+
+    with transaction.atomic():
+        existing = set(
+            ProjectStats.objects.filter(project_id__in=project_ids).values_list('project_id', flat=True)
+        )
+        ProjectStats.objects.bulk_create([
+            ProjectStats(project_id=project_id)
+            for project_id in project_ids if project_id not in existing
+        ])
+        aggregated = {row.pop('project_id'): row for row in _aggregate_counters(project_ids, today)}
+        rows = list(ProjectStats.objects.select_for_update().filter(project_id__in=project_ids))
+        for row in rows:
+            values = aggregated.get(row.project_id, {})
+            for name in STORED_COUNTERS:
+                setattr(row, name, values.get(name, 0))
+            row.overdue_as_of = today
+            activity = [value for value in (row.last_activity, values.get('last_activity')) if value]
+            row.last_activity = max(activity) if activity else None
+            row.changed_at = now
+        ProjectStats.objects.bulk_update(
+            rows, [*STORED_COUNTERS, 'overdue_as_of', 'last_activity', 'changed_at'], batch_size=500
+        )
+    return len(rows)
+
+
+def _refresh_overdue(rows, today):
+    """Пересчитывает только счётчик просроченных для строк, устаревших на сегодня"""
+    stale = [row for row in rows if row.overdue_as_of != today]
+    if not stale:
+        return
+    overdue = dict(
+        Task.objects.filter(
+            project_id__in=[row.project_id for row in stale],
+            due_date__lt=today,
+            status__in=ACTIVE_STATUSES,
+        ).values('project_id').annotate(n=Count('id')).order_by().values_list('project_id', 'n')
+    )
+    for row in stale:
+        row.overdue = overdue.get(row.project_id, 0)
+        row.overdue_as_of = today
+    ProjectStats.objects.bulk_update(stale, ['overdue', 'overdue_as_of'])
+
+
+def get_project_stats(project_ids, with_members=False):
+    """
+    Возвращает статистику задач для набора проектов: {project_id: {...}}.
+    Счётчики читаются из ProjectStats одним запросом - O(1) на проект
+    независимо от количества задач.
+    """
+    project_ids = list(project_ids)
+    result = {project_id: _empty_stats() for project_id in project_ids}
+    if not project_ids:
+        return result
+
+    today = timezone.now().date()
+    rows = list(ProjectStats.objects.filter(project_id__in=project_ids))
+    missing = set(project_ids) - {row.project_id for row in rows}
+    if missing:
+        rebuild_project_stats(missing)
+        rows += list(ProjectStats.objects.filter(project_id__in=missing))
+    _refresh_overdue(rows, today)
+    for row in rows:
+        result[row.project_id].update(_stats_as_dict(row))
+
+    if with_members:
+        members = ProjectMembership.objects.filter(project_id__in=project_ids).values(
+            'project_id'
+        ).annotate(members=Count('id')).order_by()
+        for row in members:
+            result[row['project_id']]['members'] = row['members']
+
+    return result
+
+
+def summarize(stats):
+    """Складывает статистику нескольких проектов в общие итоги"""
+    totals = {name: 0 for name in COUNTERS}
+    for project_stats in stats:
+        for name in COUNTERS:
+            totals[name] += project_stats[name]
+    totals['active'] = totals['todo'] + totals['in_progress']
+    return totals
@@ -0,0 +1,45 @@
+# main/templatetags/fragment_cache.py
+from django import template
+from main.fragments import get_fragment, set_fragment
+
+register = template.Library()
+
+
+class ProjectCacheNode(template.Node):
+
+    def __init__(self, nodelist, name, project_id, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.project_id = project_id
+        self.vary_on = vary_on
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        # Пачка, заранее прочитанная представлением (FragmentBatch), если есть
+        batch = context.get('fragment_batch')
+        key, content = get_fragment(name, self.project_id.resolve(context), vary_on, batch)
+        if content is None:
+            content = self.nodelist.render(context)
+            set_fragment(key, content)
+        return content
+
+
+@register.tag('projectcache')
+def do_projectcache(parser, token):
+    """
+    Кэширует фрагмент до следующего изменения проекта:
+        {% projectcache "имя" project.id user_role ... %} ... {% endprojectcache %}
+    Всё после ID проекта - значения, от которых ещё зависит фрагмент (роль, фильтры).
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' ожидает имя фрагмента и ID проекта")
+    nodelist = parser.parse(('endprojectcache',))
+    parser.delete_first_token()
+    return ProjectCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
@@ -1,3 +1,1299 @@
-from django.test import TestCase
+import json
+import random
+import threading
+import re
+import tempfile
+from pathlib import Path
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from datetime import timedelta
+from io import StringIO
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from jobs.queue import enqueue
+from users.models import ColleagueRequest
+from .access import ROLE_OWNER, clear_local_cache, get_accessible_projects, get_project_role
+from .checks import events_broker_check, shared_cache_check
+from .models import Project, ProjectMembership, ProjectStats, Task
+from . import asyncdb, benchmark, datagen, events, profiling
+from .fragments import fragment_stats, get_project_version, reset_fragment_stats
+from .pagination import EstimatedCountPaginator, estimate_count, paginate_keyset, plan_rows
+from .querybudget import QueryBudgetExceeded, QueryRecorder, fingerprint, query_budget
+from .stats import ACTIVE_STATUSES, get_project_stats, rebuild_project_stats, summarize
+from .transfer import import_tasks
+from .views import TASK_SORT_ORDERS
 
-# Create your tests here.
+User = get_user_model()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=True)
+class BaseViewTestCase(TestCase):
+    """Общие данные для тестов представлений"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='pass')
+        cls.member = User.objects.create_user('member', password='pass')
+
+    def setUp(self):
+        # Индекс доступа живёт в кэше, который не откатывается вместе с транзакцией теста
+        cache.clear()
+        clear_local_cache()
+        self.client.force_login(self.user)
+
+    def create_project(self, name, tasks=3):
+        project = Project.objects.create(name=name, created_by=self.user)
+        ProjectMembership.objects.create(project=project, user=self.user, role='manager')
+        ProjectMembership.objects.create(project=project, user=self.member)
+        statuses = ['todo', 'in_progress', 'review', 'done']
+        for i in range(tasks):
+            Task.objects.create(
+                title=f'{name} #{i}',
+                project=project,
+                created_by=self.user,
+                assigned_to=self.member,
+                status=statuses[i % len(statuses)],
+                priority='high',
+            )
+        return project
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+
+class ProjectStatsTests(BaseViewTestCase):
+
+    def test_counters_per_project_and_totals(self):
+        first = self.create_project('First', tasks=4)
+        second = self.create_project('Second', tasks=2)
+        empty = Project.objects.create(name='Empty', created_by=self.user)
+
+        with self.assertNumQueries(2):
+            stats = get_project_stats([first.id, second.id, empty.id], with_members=True)
+
+        self.assertEqual(stats[first.id]['total'], 4)
+        self.assertEqual(stats[first.id]['done'], 1)
+        self.assertEqual(stats[first.id]['high_active'], 2)
+        self.assertEqual(stats[first.id]['members'], 2)
+        self.assertEqual(stats[empty.id]['total'], 0)
+        self.assertIsNone(stats[empty.id]['last_activity'])
+
+        totals = summarize(stats.values())
+        self.assertEqual(totals['total'], 6)
+        self.assertEqual(totals['active'], 4)
+
+
+class ProjectStatsMaintenanceTests(BaseViewTestCase):
+
+    def stats(self, project):
+        return ProjectStats.objects.get(project=project)
+
+    def test_counters_follow_task_changes(self):
+        project = self.create_project('Counters', tasks=0)
+        task = Task.objects.create(
+            title='Task', project=project, created_by=self.user,
+            priority='high', due_date=timezone.now().date() - timedelta(days=1),
+        )
+        stats = self.stats(project)
+        self.assertEqual((stats.total, stats.todo, stats.high, stats.high_active, stats.overdue), (1, 1, 1, 1, 1))
+
+        task = Task.objects.get(pk=task.pk)
+        task.status = 'done'
+        task.save()
+        stats = self.stats(project)
+        self.assertEqual((stats.todo, stats.done, stats.high_active, stats.overdue), (0, 1, 0, 0))
+
+        task.delete()
+        stats = self.stats(project)
+        self.assertEqual((stats.total, stats.done, stats.high), (0, 0, 0))
+
+    def test_ajax_status_update_and_member_removal(self):
+        project = self.create_project('Ajax', tasks=1)
+        task = project.tasks.get()
+        self.client.post(
+            reverse('main:update_task_status', args=[task.id]),
+            {'status': 'review'},
+            headers={'x-requested-with': 'XMLHttpRequest'},
+        )
+        stats = self.stats(project)
+        self.assertEqual((stats.todo, stats.review), (0, 1))
+
+        before = stats.last_activity
+        version = get_project_version(project.id)
+        cursor = events.get_broker().latest(project.id)
+        # Без исполнителя заданий: всё делается в самом запросе
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('main:remove_from_project', args=[project.id, self.member.id]))
+        self.assertGreater(self.stats(project).last_activity, before)
+        self.assertFalse(project.tasks.filter(assigned_to=self.member).exists())
+        self.assertNotEqual(get_project_version(project.id), version)
+        published = events.get_broker().events_after(project.id, cursor)
+        self.assertIn(('task.updated', {'id': task.id, 'assigned_to_id': None}), [
+            (event.type, {'id': event.data['id'], 'assigned_to_id': event.data['assigned_to_id']})
+            for event in published if event.type == 'task.updated'
+        ])
+
+    def test_admin_bulk_actions_apply_counters_in_request(self):
+        project = self.create_project('Admin bulk', tasks=4)
+        self.client.force_login(User.objects.create_superuser('root', password='pass'))
+        cursor = events.get_broker().latest(project.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:main_task_changelist'), {
+                'action': 'mark_as_done',
+                '_selected_action': list(project.tasks.values_list('id', flat=True)),
+            })
+        stats = self.stats(project)
+        self.assertEqual((stats.todo, stats.in_progress, stats.review, stats.done), (0, 0, 0, 4))
+        updated = [event for event in events.get_broker().events_after(project.id, cursor) if event.type == 'task.updated']
+        self.assertEqual(len(updated), 4)
+        self.assertTrue(all(event.data['status'] == 'done' for event in updated))
+
+    def test_reconcile_command_rebuilds_counters(self):
+        project = self.create_project('Drift', tasks=4)
+        ProjectStats.objects.filter(project=project).update(total=100, done=50, overdue_as_of=None)
+        call_command('reconcile_project_stats', stdout=StringIO())
+        stats = self.stats(project)
+        self.assertEqual((stats.total, stats.done, stats.in_progress), (4, 1, 1))
+
+    def test_rebuild_matches_incremental_counters(self):
+        project = self.create_project('Same', tasks=7)
+        incremental = get_project_stats([project.id])[project.id]
+        rebuild_project_stats([project.id])
+        self.assertEqual(get_project_stats([project.id])[project.id], incremental)
+
+
+class AccessIndexTests(BaseViewTestCase):
+
+    def test_roles_and_cached_lookups(self):
+        project = self.create_project('Access', tasks=0)
+        self.assertEqual(get_accessible_projects(self.user), {project.id: ROLE_OWNER})
+        self.assertEqual(get_project_role(self.member, project.id), 'developer')
+
+        # Без запросов к таблицам приложения; в тестах кэш в памяти процесса, с DatabaseCache
+        # каждое обращение читает версию из cache_table (см. main/access.py)
+        clear_local_cache()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_project_role(self.member, project.id), 'developer')
+
+    def test_multiple_workers_require_shared_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache_table'}}
+        with override_settings(WEB_WORKERS=3, CACHES=locmem):
+            self.assertEqual([error.id for error in shared_cache_check(None)], ['main.E001'])
+        with override_settings(WEB_WORKERS=1, CACHES=locmem):
+            self.assertEqual(shared_cache_check(None), [])
+        with override_settings(WEB_WORKERS=3, CACHES=shared):
+            self.assertEqual(shared_cache_check(None), [])
+
+    def test_multiple_workers_require_shared_events_broker(self):
+        with override_settings(WEB_WORKERS=3, EVENTS_BROKER='main.events.InProcessBroker'):
+            self.assertEqual([error.id for error in events_broker_check(None)], ['main.E002'])
+        with override_settings(WEB_WORKERS=1, EVENTS_BROKER='main.events.InProcessBroker'):
+            self.assertEqual(events_broker_check(None), [])
+        with override_settings(WEB_WORKERS=3, EVENTS_BROKER='main.events.CacheBroker'):
+            self.assertEqual(events_broker_check(None), [])
+
+    def test_membership_signals_invalidate_index(self):
+        project = self.create_project('Revoke', tasks=0)
+        outsider = User.objects.create_user('outsider', password='pass')
+        self.assertIsNone(get_project_role(outsider, project.id))
+
+        membership = ProjectMembership.objects.create(project=project, user=outsider, role='tester')
+        self.assertEqual(get_project_role(outsider, project.id), 'tester')
+
+        membership.delete()
+        self.assertIsNone(get_project_role(outsider, project.id))
+
+        project_id = project.id
+        project.delete()
+        self.assertNotIn(project_id, get_accessible_projects(self.user))
+
+    def test_project_delete_skips_per_task_work(self):
+        def delete_project(tasks):
+            project = self.create_project(f'Doomed {tasks}', tasks=tasks)
+            with mock.patch('main.signals.publish_on_commit') as publish:
+                with CaptureQueriesContext(connection) as ctx:
+                    project.delete()
+            self.assertFalse(Task.objects.filter(project_id=project.id).exists())
+            self.assertNotIn('task.deleted', [call.args[1] for call in publish.call_args_list])
+            return len(ctx)
+
+        # Задачи удаляются одним запросом, без пересчёта статистики и событий на каждую
+        self.assertEqual(delete_project(2), delete_project(8))
+        project = self.create_project('Survivor', tasks=2)
+        project.tasks.first().delete()
+        self.assertEqual(get_project_stats([project.id])[project.id]['total'], 1)
+
+    def test_task_view_denies_outsider(self):
+        project = self.create_project('Denied', tasks=1)
+        outsider = User.objects.create_user('stranger', password='pass')
+        self.client.force_login(outsider)
+        response = self.client.get(reverse('main:task_edit', args=[project.tasks.get().id]))
+        self.assertEqual(response.status_code, 403)
+
+
+class TaskMembershipValidationTests(BaseViewTestCase):
+
+    def membership_queries(self, ctx):
+        return [q['sql'] for q in ctx.captured_queries if 'main_projectmembership' in q['sql']]
+
+    def test_task_create_resolves_members_once(self):
+        project = self.create_project('Create', tasks=0)
+        url = reverse('main:task_create', args=[project.id])
+        get_accessible_projects(self.user)  # индекс доступа уже в кэше
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {
+                'title': 'New task', 'assigned_to': self.member.id,
+                'status': 'todo', 'priority': 'medium',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(project.tasks.get().assigned_to, self.member)
+        self.assertEqual(len(self.membership_queries(ctx)), 1)
+
+    def test_form_rejects_non_member(self):
+        project = self.create_project('Reject', tasks=0)
+        outsider = User.objects.create_user('outsider', password='pass')
+        response = self.client.post(reverse('main:task_create', args=[project.id]), {
+            'title': 'Task', 'assigned_to': outsider.id,
+            'status': 'todo', 'priority': 'medium',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('assigned_to', response.context['form'].errors)
+        self.assertFalse(project.tasks.exists())
+
+    def test_save_skips_check_when_assignee_unchanged(self):
+        project = self.create_project('Unchanged', tasks=1)
+        task = Task.objects.get(project=project)
+        task.title = 'Renamed'
+        with CaptureQueriesContext(connection) as ctx:
+            task.save()
+        self.assertEqual(self.membership_queries(ctx), [])
+
+    def test_bulk_create_and_update_validate_assignees(self):
+        project = self.create_project('Bulk', tasks=0)
+        outsider = User.objects.create_user('outsider', password='pass')
+        with self.assertRaises(ValueError):
+            Task.objects.bulk_create([
+                Task(title='Bad', project=project, created_by=self.user, assigned_to=outsider),
+            ])
+
+        tasks = Task.objects.bulk_create([
+            Task(title=f'Bulk {i}', project=project, created_by=self.user, assigned_to=self.member)
+            for i in range(3)
+        ])
+        self.assertEqual(ProjectStats.objects.get(project=project).todo, 3)
+
+        tasks = list(Task.objects.filter(project=project))
+        for task in tasks:
+            task.status = 'done'
+        Task.objects.bulk_update(tasks, ['status'])
+        stats = ProjectStats.objects.get(project=project)
+        self.assertEqual((stats.todo, stats.done), (0, 3))
+
+        tasks[0].assigned_to = outsider
+        with self.assertRaises(ValueError):
+            Task.objects.bulk_update(tasks[:1], ['assigned_to'])
+
+
+class BulkStatusUpdateTests(BaseViewTestCase):
+
+    def move(self, moves):
+        return self.client.post(
+            reverse('main:update_tasks_status_bulk'),
+            json.dumps({'moves': moves}),
+            content_type='application/json',
+            headers={'x-requested-with': 'XMLHttpRequest'},
+        )
+
+    def test_moves_are_applied_and_counted(self):
+        project = self.create_project('Board', tasks=4)
+        ids = list(project.tasks.values_list('id', flat=True))
+        response = self.move([{'task_id': task_id, 'status': 'done'} for task_id in ids])
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(len(data['updated']), 4)
+        self.assertEqual(project.tasks.filter(status='done').count(), 4)
+
+        stats = ProjectStats.objects.get(project=project)
+        self.assertEqual((stats.todo, stats.in_progress, stats.review, stats.done), (0, 0, 0, 4))
+        rebuild_project_stats([project.id])
+        self.assertEqual(ProjectStats.objects.get(project=project).done, 4)
+
+    def test_query_count_does_not_grow_with_moves(self):
+        project = self.create_project('Batch', tasks=12)
+        ids = list(project.tasks.values_list('id', flat=True))
+        get_accessible_projects(self.user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.move([{'task_id': ids[0], 'status': 'review'}])
+        few = len(ctx.captured_queries)
+        with CaptureQueriesContext(connection) as ctx:
+            self.move([{'task_id': task_id, 'status': 'review'} for task_id in ids[1:]])
+        self.assertLessEqual(len(ctx.captured_queries), few)
+
+    def test_foreign_tasks_are_rejected(self):
+        own = self.create_project('Own', tasks=1)
+        other_owner = User.objects.create_user('other', password='pass')
+        foreign = Project.objects.create(name='Foreign', created_by=other_owner)
+        foreign_task = Task.objects.create(title='Secret', project=foreign, created_by=other_owner)
+        own_task = own.tasks.get()
+
+        data = self.move([
+            {'task_id': own_task.id, 'status': 'done'},
+            {'task_id': foreign_task.id, 'status': 'done'},
+        ]).json()
+        self.assertFalse(data['success'])
+        self.assertEqual(data['failed'], [foreign_task.id])
+        foreign_task.refresh_from_db()
+        self.assertEqual(foreign_task.status, 'todo')
+
+    def test_invalid_payload(self):
+        project = self.create_project('Invalid', tasks=1)
+        task = project.tasks.get()
+        self.assertEqual(self.move([{'task_id': task.id, 'status': 'archived'}]).status_code, 400)
+        self.assertEqual(self.move([]).status_code, 400)
+        response = self.client.post(
+            reverse('main:update_tasks_status_bulk'), 'not json', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_moves_are_rejected(self):
+        task = self.create_project('Malformed', tasks=1).tasks.get()
+        malformed = [
+            {'moves': {'task_id': task.id, 'status': 'done'}},
+            {'moves': ['done']},
+            {'moves': [{'task_id': str(task.id), 'status': 'done'}]},
+            {'moves': [{'task_id': True, 'status': 'done'}]},
+            {'moves': [{'task_id': task.id, 'status': ['done']}]},
+            {'moves': [{'task_id': task.id}]},
+            [{'task_id': task.id, 'status': 'done'}],
+        ]
+        for payload in malformed:
+            with self.subTest(payload=payload):
+                response = self.client.post(
+                    reverse('main:update_tasks_status_bulk'), json.dumps(payload), content_type='application/json'
+                )
+                self.assertEqual(response.status_code, 400)
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'todo')
+
+
+class TaskKeysetPaginationTests(BaseViewTestCase):
+
+    def create_tasks(self, project, count=13):
+        today = timezone.now().date()
+        for i in range(count):
+            Task.objects.create(
+                title=f'Task {i % 4}',  # одинаковые названия проверяют порядок по id
+                project=project,
+                created_by=self.user,
+                priority=['low', 'medium', 'high'][i % 3],
+                due_date=today + timedelta(days=i % 3) if i % 2 else None,
+            )
+
+    def test_pages_match_full_ordering(self):
+        project = self.create_project('Pages', tasks=0)
+        self.create_tasks(project)
+        tasks = project.tasks.all()
+        for ordering in TASK_SORT_ORDERS.values():
+            expected = [task.id for task in paginate_keyset(tasks, ordering, per_page=100)[0]]
+            seen, cursor = [], None
+            while True:
+                page, cursor = paginate_keyset(tasks, ordering, cursor, per_page=4)
+                seen += [task.id for task in page]
+                if not cursor:
+                    break
+            self.assertEqual(seen, expected, ordering)
+            self.assertEqual(len(seen), 13)
+
+    def test_page_endpoint_and_bad_cursor(self):
+        project = self.create_project('Scroll', tasks=0)
+        self.create_tasks(project, count=3)
+        url = reverse('main:project_tasks_page', args=[project.id])
+        response = self.client.get(url, {'sort': 'due_date', 'after': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['tasks']), 3)
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, 'task-page-sentinel')
+
+    def test_detail_renders_one_page(self):
+        project = self.create_project('Big', tasks=0)
+        Task.objects.bulk_create([
+            Task(title=f'Bulk {i}', project=project, created_by=self.user) for i in range(60)
+        ])
+        response = self.client.get(reverse('main:project_detail', args=[project.id]))
+        self.assertEqual(len(response.context['tasks']), 50)
+        self.assertContains(response, 'task-page-sentinel')
+
+        response = self.client.get(
+            reverse('main:project_tasks_page', args=[project.id]),
+            {'after': response.context['next_cursor']},
+        )
+        self.assertEqual(len(response.context['tasks']), 10)
+
+
+class DashboardQueryCountTests(BaseViewTestCase):
+
+    def test_query_count_does_not_grow_with_projects(self):
+        url = reverse('main:dashboard')
+        self.create_project('Project 1')
+        baseline = self.count_queries(url)
+
+        for i in range(2, 8):
+            self.create_project(f'Project {i}')
+        self.assertEqual(self.count_queries(url), baseline)
+
+    def test_project_pages_use_constant_queries(self):
+        project = self.create_project('Detail', tasks=2)
+        detail_url = reverse('main:project_detail', args=[project.id])
+        edit_url = reverse('main:project_edit', args=[project.id])
+        list_url = reverse('users:project_list')
+        detail_before = self.count_queries(detail_url)
+        edit_before = self.count_queries(edit_url)
+        list_before = self.count_queries(list_url)
+
+        for i in range(5):
+            self.create_project(f'Other {i}', tasks=3)
+        # Сравниваем отрисовку без кэша фрагментов, как и в первом замере
+        cache.clear()
+        self.assertEqual(self.count_queries(detail_url), detail_before)
+        self.assertEqual(self.count_queries(edit_url), edit_before)
+        self.assertEqual(self.count_queries(list_url), list_before)
+
+
+class QueryBudgetTests(BaseViewTestCase):
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            fingerprint('SELECT * FROM t WHERE id IN (%s) AND name = \'y\' LIMIT 5'),
+        )
+
+    def test_repeated_queries_are_reported_with_call_site(self):
+        project = self.create_project('Loop', tasks=6)
+        with self.assertRaisesRegex(QueryBudgetExceeded, r'N\+1: 6 раз из main/tests\.py:\d+'):
+            with query_budget():
+                for task in Task.objects.filter(project=project):
+                    task.assigned_to.username  # исполнитель не загружен заранее - запрос на каждую задачу
+
+        with query_budget(2):
+            list(Task.objects.filter(project=project).select_related('assigned_to'))
+
+    def test_call_site_is_captured_only_for_repeats(self):
+        project = self.create_project('Loop', tasks=6)
+        with mock.patch('main.querybudget._call_site', return_value='here') as call_site:
+            with QueryRecorder(threshold=5) as recorder:
+                list(Task.objects.filter(project=project))
+                for task in Task.objects.filter(project=project):
+                    task.assigned_to.username
+        self.assertEqual(len(recorder), 8)
+        # Стек обходится с пятого повтора и дальше, разовые запросы его не трогают
+        self.assertEqual(call_site.call_count, 2)
+        self.assertEqual([(count, site) for _, count, site in recorder.repeated()], [(6, 'here')])
+
+    def test_middleware_reports_call_site_behind_server_timing(self):
+        # ServerTimingMiddleware включён в settings.MIDDLEWARE и ставит свою обёртку execute
+        # снаружи - место вызова всё равно указывает на код, делающий запросы
+        self.create_project('Loop', tasks=6)
+
+        def stats_in_a_loop(project_ids, **kwargs):
+            for task in Task.objects.filter(project__in=project_ids):
+                task.assigned_to.username
+            return get_project_stats(project_ids, **kwargs)
+
+        with mock.patch('main.views.get_project_stats', stats_in_a_loop):
+            with self.assertRaisesRegex(QueryBudgetExceeded, r'N\+1: \d+ раз из main/tests\.py:\d+ in stats_in_a_loop'):
+                self.client.get(reverse('main:dashboard'))
+
+    def test_middleware_enforces_view_budgets(self):
+        url = reverse('main:dashboard')
+        with override_settings(QUERY_BUDGETS={'main:dashboard': 1}):
+            with self.assertRaisesRegex(QueryBudgetExceeded, 'main:dashboard'):
+                self.client.get(url)
+
+            with override_settings(QUERY_BUDGET_RAISE=False):
+                with self.assertLogs('main.querybudget', 'WARNING') as logs:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertIn('при бюджете 1', logs.output[0])
+
+
+class ServerTimingTests(BaseViewTestCase):
+
+    def timing(self, response):
+        return dict(
+            (part.split(';')[0].strip(), part) for part in response['Server-Timing'].split(',')
+        )
+
+    def test_header_reports_db_templates_and_cache(self):
+        self.create_project('Timed', tasks=2)
+        self.client.get(reverse('main:dashboard'))  # индекс доступа уже в кэше
+        timing = self.timing(self.client.get(reverse('main:dashboard')))
+        self.assertEqual(set(timing), {'db', 'tpl', 'cache', 'app'})
+        self.assertRegex(timing['db'], r'dur=[\d.]+;desc="\d+ queries"')
+        self.assertNotRegex(timing['tpl'], r'dur=0\.0$')
+        self.assertRegex(timing['cache'], r'desc="hits=[1-9]')
+
+    def test_slow_requests_are_profiled_and_reported(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                PROFILE_SAMPLE_RATE=1.0, PROFILE_SLOW_MS=0, PROFILE_DIR=Path(directory), PROFILE_MAX_FILES=2,
+            ):
+                for _ in range(3):
+                    self.client.get(reverse('main:dashboard'))
+                dumps = list(Path(directory).glob('*.prof'))
+                self.assertEqual(len(dumps), 2)
+                self.assertIn('main.dashboard', dumps[0].name)
+
+                out = StringIO()
+                call_command('profile_report', stdout=out)
+                self.assertIn('main:dashboard', out.getvalue())
+                out = StringIO()
+                call_command('profile_report', view='main:dashboard', limit=5, stdout=out)
+                self.assertIn('2 дампов', out.getvalue())
+
+
+class FragmentCacheTests(BaseViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_fragment_stats()
+
+    def detail(self, project, user=None):
+        self.client.force_login(user or self.user)
+        response = self.client.get(reverse('main:project_detail', args=[project.id]))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_unchanged_fragments_served_from_cache(self):
+        project = self.create_project('Cached')
+        first = self.count_queries(reverse('main:project_detail', args=[project.id]))
+        second = self.count_queries(reverse('main:project_detail', args=[project.id]))
+        # Состав команды запрашивается только при отрисовке фрагмента
+        self.assertLess(second, first)
+        stats = fragment_stats()
+        self.assertEqual(stats['task_rows'], {'hits': 1, 'misses': 1})
+        self.assertEqual(stats['project_sidebar'], {'hits': 1, 'misses': 1})
+
+        self.client.get(reverse('main:dashboard'))
+        self.client.get(reverse('main:dashboard'))
+        self.assertEqual(fragment_stats()['dashboard_card'], {'hits': 1, 'misses': 1})
+
+    def test_page_fragments_read_with_two_get_many(self):
+        for number in range(5):
+            self.create_project(f'Card {number}', tasks=1)
+        project = Project.objects.first()
+        pages = [reverse('main:dashboard'), reverse('main:project_detail', args=[project.id])]
+        for url in pages:
+            self.client.get(url)
+
+        # Сколько бы проектов ни было на странице - два обращения к кэшу, а не два на фрагмент
+        for url in pages:
+            with mock.patch('main.fragments.cache', wraps=cache) as spy:
+                self.assertContains(self.client.get(url), 'Card')
+            self.assertEqual(spy.get.call_count, 0)
+            self.assertEqual(spy.get_many.call_count, 2)
+        self.assertEqual(fragment_stats()['dashboard_card'], {'hits': 5, 'misses': 5})
+        self.assertEqual(fragment_stats()['task_rows'], {'hits': 1, 'misses': 1})
+
+    def test_writes_bump_only_their_project(self):
+        project = self.create_project('Changed')
+        other = self.create_project('Other')
+        task = project.tasks.first()
+
+        def bumps(write):
+            before = get_project_version(project.id), get_project_version(other.id)
+            write()
+            after = get_project_version(project.id), get_project_version(other.id)
+            return before[0] != after[0], before[1] != after[1]
+
+        def rename_task():
+            task.title = 'Renamed task'
+            task.save()
+
+        def move_tasks():
+            self.client.post(
+                reverse('main:update_tasks_status_bulk'),
+                json.dumps({'moves': [{'task_id': task.id, 'status': 'done'}]}),
+                content_type='application/json',
+            )
+
+        def add_member():
+            ProjectMembership.objects.create(project=project, user=User.objects.create_user('newbie'))
+
+        def rename_member():
+            member = User.objects.get(pk=self.member.pk)
+            member.username = 'renamed'
+            member.save()
+
+        self.assertEqual(bumps(rename_task), (True, False))
+        self.assertEqual(bumps(move_tasks), (True, False))
+        self.assertEqual(bumps(add_member), (True, False))
+        self.assertEqual(bumps(lambda: task.delete()), (True, False))
+        self.assertEqual(bumps(rename_member), (True, True))
+
+    def test_changes_are_visible_immediately(self):
+        project = self.create_project('Visible')
+        self.assertIn('Visible #0', self.detail(project))
+
+        task = project.tasks.get(title='Visible #0')
+        task.title = 'Updated title'
+        task.save()
+        ProjectMembership.objects.create(project=project, user=User.objects.create_user('joined'))
+        content = self.detail(project)
+        self.assertIn('Updated title', content)
+        self.assertIn('joined', content)
+
+    def test_fragments_vary_by_viewer(self):
+        project = self.create_project('Roles')
+        remove_url = reverse('main:remove_from_project', args=[project.id, self.member.id])
+        self.assertIn(remove_url, self.detail(project))
+        self.assertNotIn(remove_url, self.detail(project, self.member))
+
+    def test_stats_endpoint_for_staff(self):
+        url = reverse('main:fragment_cache_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.detail(self.create_project('Stats'))
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.json()['fragments']['task_rows'], {'hits': 0, 'misses': 1})
+
+
+class AsyncViewTests(BaseViewTestCase):
+
+    async def test_read_views_over_asgi(self):
+        project = await sync_to_async(self.create_project)('Async', tasks=4)
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(reverse('main:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_tasks'], 4)
+        self.assertEqual([task.project_id for task in response.context['recent_tasks']], [project.id] * 4)
+        self.assertIn('Server-Timing', response.headers)
+
+        response = await self.async_client.get(reverse('users:profile', args=[self.member.username]))
+        self.assertEqual(response.context['task_stats']['total'], 4)
+        self.assertEqual(response.context['user_projects'], [project])
+
+    async def test_middleware_chain_stays_async(self):
+        await sync_to_async(self.create_project)('Async', tasks=2)
+        await self.async_client.aforce_login(self.user)
+        # При DEBUG Django пишет в django.request про каждый middleware, который пришлось адаптировать
+        with self.settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            response = await self.async_client.get(reverse('main:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    async def test_query_budget_checks_async_requests(self):
+        await sync_to_async(self.create_project)('Async', tasks=2)
+        await self.async_client.aforce_login(self.user)
+        with self.settings(QUERY_BUDGETS={'main:dashboard': 1}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'при бюджете 1'):
+                await self.async_client.get(reverse('main:dashboard'))
+
+    def test_pool_keeps_request_counters(self):
+        timings = profiling.RequestTimings()
+        token = profiling._current.set(timings)
+
+        def job(value):
+            profiling.record_cache(hit=True)
+            return value, threading.current_thread().name
+
+        try:
+            with mock.patch.object(asyncdb, 'parallel_allowed', return_value=True):
+                results = async_to_sync(asyncdb.run_concurrently)(lambda: job(1), lambda: job(2))
+        finally:
+            profiling._current.reset(token)
+        self.assertEqual([value for value, _ in results], [1, 2])
+        self.assertTrue(all(name.startswith('async-query') for _, name in results))
+        self.assertEqual(timings.cache_hits, 2)
+        # Внутри транзакции теста потоки пула не видели бы данных - выполняем по очереди
+        self.assertFalse(asyncdb.parallel_allowed())
+
+
+class ConditionalGetTests(BaseViewTestCase):
+
+    def fetch_etag(self, url):
+        # Первый ответ выдаёт cookie CSRF, а его значение входит в ETag
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, headers={'If-None-Match': etag})
+
+    def test_project_page_answers_304_with_one_lookup(self):
+        project = self.create_project('Cached', tasks=3)
+        url = reverse('main:project_detail', args=[project.id])
+        etag = self.fetch_etag(url)
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        # Сессия, пользователь и версия проекта; задачи и шаблон не трогаются
+        tables = [query['sql'] for query in ctx.captured_queries]
+        self.assertEqual(len(tables), 3)
+        self.assertFalse(any('main_task' in sql for sql in tables))
+
+        # Изменение задачи меняет версию
+        task = project.tasks.first()
+        task.title = 'Changed'
+        task.save()
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # Изменение команды - тоже
+        membership = ProjectMembership.objects.get(project=project, user=self.member)
+        membership.role = 'manager'
+        membership.save()
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_etag_is_per_user(self):
+        project = self.create_project('Shared', tasks=1)
+        url = reverse('main:project_detail', args=[project.id])
+        etag = self.fetch_etag(url)
+        self.client.force_login(self.member)
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_pending_messages_are_rendered(self):
+        project = self.create_project('Messages', tasks=1)
+        url = reverse('main:project_detail', args=[project.id])
+        etag = self.fetch_etag(url)
+        # Версия проекта не меняется, но в сессии ждёт сообщение об успехе
+        with mock.patch('main.signals.mark_projects_changed'):
+            self.client.post(reverse('main:project_edit', args=[project.id]), {
+                'name': project.name, 'description': project.description, 'color': project.color,
+            })
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(list(response.context['messages'])), 1)
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+    def test_dashboard_and_my_tasks(self):
+        project = self.create_project('Mine', tasks=2)
+        for url in (reverse('main:dashboard'), reverse('users:my_tasks')):
+            with self.subTest(url=url):
+                etag = self.fetch_etag(url)
+                self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+        dashboard = reverse('main:dashboard')
+        etag = self.fetch_etag(dashboard)
+        # Новый проект меняет набор доступных проектов
+        Project.objects.create(name='Another', created_by=self.user)
+        self.assertEqual(self.revalidate(dashboard, etag).status_code, 200)
+        etag = self.client.get(dashboard)['ETag']
+        Task.objects.create(title='New', project=project, created_by=self.user)
+        self.assertEqual(self.revalidate(dashboard, etag).status_code, 200)
+
+
+@override_settings(EVENTS_BROKER='main.events.InProcessBroker', EVENTS_HISTORY=3)
+class LiveEventsTests(BaseViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Свежий брокер: история не переходит между тестами
+        events._broker = None
+
+    def published(self, project):
+        broker = events.get_broker()
+        return [(event.type, event.data.get('id')) for event in broker.events_after(project.id, f'{broker.epoch}.0')]
+
+    def test_changes_are_published_after_commit(self):
+        with override_settings(EVENTS_HISTORY=100), self.captureOnCommitCallbacks(execute=True):
+            project = self.create_project('Live', tasks=1)
+            task = project.tasks.get()
+            task_id = task.id
+            task.title = 'Renamed'
+            task.save()
+            self.client.post(
+                reverse('main:update_tasks_status_bulk'),
+                json.dumps({'moves': [{'task_id': task_id, 'status': 'done'}]}),
+                content_type='application/json',
+                headers={'x-requested-with': 'XMLHttpRequest'},
+            )
+            task.delete()
+            ProjectMembership.objects.filter(project=project, user=self.member).get().delete()
+        self.assertEqual(self.published(project), [
+            ('member.added', None), ('member.added', None), ('task.created', task_id),
+            ('task.updated', task_id), ('task.updated', task_id), ('task.deleted', task_id),
+            ('member.removed', None),
+        ])
+
+    def test_brokers_replay_from_cursor(self):
+        # Общий кэш для CacheBroker в тестах - LocMemCache
+        for broker in (events.InProcessBroker(), events.CacheBroker()):
+            with self.subTest(broker=type(broker).__name__):
+                cache.clear()
+                first = broker.publish(1, 'task.created', {'id': 1})
+                broker.publish(1, 'task.updated', {'id': 1})
+                broker.publish(2, 'task.created', {'id': 2})
+                self.assertEqual([event.type for event in broker.events_after(1, first.id)], ['task.updated'])
+                self.assertEqual(broker.events_after(1, broker.latest(1)), [])
+                # Другая эпоха (перезапуск сервера) и мусор в курсоре - продолжить нельзя
+                self.assertIsNone(broker.events_after(1, '1.1'))
+                self.assertIsNone(broker.events_after(1, 'garbage'))
+                # Отставший дальше истории клиент получает reset
+                for i in range(5):
+                    broker.publish(1, 'task.updated', {'id': 1})
+                self.assertIsNone(broker.events_after(1, first.id))
+
+    def test_polling_endpoint_under_wsgi(self):
+        project = self.create_project('Poll', tasks=0)
+        url = reverse('main:project_events', args=[project.id])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        cursor = re.search(r'^id: (\S+)$', response.content.decode(), re.M).group(1)
+
+        events.get_broker().publish(project.id, 'task.created', {'id': 7, 'title': 'Новая'})
+        body = self.client.get(url, headers={'Last-Event-ID': cursor}).content.decode()
+        self.assertIn('event: task.created', body)
+        self.assertIn('"title": "Новая"', body)
+
+        outsider = User.objects.create_user('outsider', password='pass')
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    @override_settings(EVENTS_HEARTBEAT=0.05)
+    async def test_stream_over_asgi(self):
+        project = await sync_to_async(self.create_project)('Stream', tasks=0)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('main:project_events', args=[project.id]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b'retry:'))
+        self.assertTrue((await anext(chunks)).startswith(b'id:'))
+        try:
+            broker = events.get_broker()
+            broker.publish(project.id, 'task.updated', {'id': 1, 'status': 'done'})
+            self.assertIn(b'event: task.updated', await anext(chunks))
+            self.assertEqual(await anext(chunks), b': ping\n\n')
+            # Клиент не читал, пока история ушла вперёд - вместо потерянных событий reset
+            for i in range(5):
+                broker.publish(project.id, 'task.updated', {'id': 1, 'status': 'todo'})
+            self.assertIn(b'event: reset', await anext(chunks))
+        finally:
+            await chunks.aclose()
+
+
+class TaskTransferTests(BaseViewTestCase):
+
+    CSV = (
+        'title,status,priority,due_date,assigned_to,extra\n'
+        'Первая,done,high,2030-01-02,member,x\n'
+        'Вторая,,,,,\n'
+        '"Третья, с запятой",later,low,,member,\n'
+        ',todo,low,,,\n'
+        'Пятая,todo,low,02.01.2030,ghost,\n'
+    )
+
+    def upload(self, project, content, name='tasks.csv'):
+        return self.client.post(
+            reverse('main:task_import', args=[project.id]),
+            {'file': SimpleUploadedFile(name, content.encode())},
+        )
+
+    def test_import_validates_rows_and_reports_errors(self):
+        project = self.create_project('Import', tasks=0)
+        with override_settings(TASK_IMPORT_CHUNK_SIZE=2):
+            response = self.upload(project, self.CSV)
+        report = response.context['report']
+        self.assertEqual((report.created, report.failed), (2, 3))
+        self.assertEqual([line for line, _ in report.errors], [4, 5, 6])
+        self.assertIn('status', report.errors[0][1])
+        self.assertIn('title', report.errors[1][1])
+        self.assertIn('«ghost» не участник проекта', report.errors[2][1])
+
+        first, second = project.tasks.order_by('id')
+        self.assertEqual((first.title, first.assigned_to, str(first.due_date)), ('Первая', self.member, '2030-01-02'))
+        self.assertEqual((second.status, second.priority, second.assigned_to, second.created_by), ('todo', 'medium', None, self.user))
+        stats = ProjectStats.objects.get(project=project)
+        self.assertEqual((stats.total, stats.done, stats.todo), (2, 1, 1))
+
+    def test_import_queries_per_chunk_not_per_row(self):
+        project = self.create_project('Bulk', tasks=0)
+        rows = [{'title': f'T{i}', 'assigned_to': 'member'} for i in range(40)]
+
+        def queries(count):
+            fresh = Project.objects.get(pk=project.pk)
+            with CaptureQueriesContext(connection) as ctx:
+                report = import_tasks(fresh, self.user, enumerate(rows[:count], 1), chunk_size=50)
+            self.assertEqual(report.created, count)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries(2), queries(40))
+
+    def test_jsonl_command(self):
+        project = self.create_project('Jsonl', tasks=0)
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as file:
+            file.write('{"title": "Из JSON", "assigned_to": "member", "priority": "high"}\n\n')
+            file.write('{"title": \n')
+            file.write('["не объект"]\n')
+        self.addCleanup(Path(file.name).unlink)
+
+        out, err = StringIO(), StringIO()
+        call_command('import_tasks', project.id, file.name, stdout=out, stderr=err)
+        self.assertIn('создано задач 1', out.getvalue())
+        self.assertIn('Строка 3: Некорректный JSON', err.getvalue())
+        self.assertIn('Строка 4: Ожидается JSON-объект', err.getvalue())
+        self.assertEqual(project.tasks.get().assigned_to, self.member)
+
+    def test_export_streams_and_round_trips(self):
+        source = self.create_project('Source', tasks=5)
+        response = self.client.get(reverse('main:task_export', args=[source.id]), {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        self.assertIn('project-%d-tasks.csv' % source.id, response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode()
+
+        target = self.create_project('Target', tasks=0)
+        report = self.upload(target, content).context['report']
+        self.assertEqual((report.created, report.failed), (5, 0))
+        exported = list(source.tasks.order_by('id').values_list('title', 'status', 'assigned_to'))
+        imported = list(target.tasks.order_by('id').values_list('title', 'status', 'assigned_to'))
+        self.assertEqual(imported, exported)
+
+        response = self.client.get(reverse('main:task_export', args=[source.id]), {'format': 'jsonl'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['assigned_to'], 'member')
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        source = await sync_to_async(self.create_project)('Async export', tasks=5)
+        await self.async_client.aforce_login(self.user)
+        with override_settings(TASK_EXPORT_CHUNK_SIZE=2):
+            response = await self.async_client.get(reverse('main:task_export', args=[source.id]), {'format': 'jsonl'})
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        # Пачки по две строки: 2 + 2 + 1
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [2, 2, 1])
+
+    def test_outsider_cannot_export(self):
+        project = self.create_project('Private', tasks=1)
+        self.client.force_login(User.objects.create_user('outsider', password='pass'))
+        self.assertEqual(self.client.get(reverse('main:task_export', args=[project.id])).status_code, 403)
+
+
+class AdminChangelistQueryTests(BaseViewTestCase):
+    # Запросов на страницу списка каждой модели в админке: сессия, пользователь, фильтры,
+    # COUNT(*) (у больших таблиц - без второго, по всей таблице) и сама страница.
+    # Число не должно зависеть от количества строк
+    CHANGELIST_QUERIES = {
+        'auth.group': 5,
+        'users.user': 4,
+        'main.project': 4,
+        'main.projectmembership': 4,
+        'main.task': 4,
+        'jobs.job': 7,
+        'jobs.deadjob': 7,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('root', password='pass'))
+
+    def changelist_url(self, model):
+        return reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+
+    def test_changelists_have_fixed_query_count(self):
+        self.assertEqual(
+            {model._meta.label_lower for model in admin.site._registry}, set(self.CHANGELIST_QUERIES)
+        )
+        for rows in (1, 5):
+            for i in range(rows):
+                self.create_project(f'Admin {rows}.{i}', tasks=2)
+                enqueue('removed.job', [i])
+            for model in admin.site._registry:
+                with self.subTest(model=model._meta.label_lower, rows=rows):
+                    with self.assertNumQueries(self.CHANGELIST_QUERIES[model._meta.label_lower]):
+                        self.assertEqual(self.client.get(self.changelist_url(model)).status_code, 200)
+
+    def test_project_counters_are_annotated_and_sortable(self):
+        small = self.create_project('Small', tasks=1)
+        big = self.create_project('Big', tasks=3)
+        ProjectMembership.objects.create(project=big, user=User.objects.create_user('third'))
+
+        # Колонки «Участников» и «Задач» - 3-я и 4-я в list_display
+        response = self.client.get(self.changelist_url(Project), {'o': '-3'})
+        projects = list(response.context['cl'].result_list)
+        self.assertEqual(projects, [big, small])
+        self.assertEqual([project.members_total for project in projects], [3, 2])
+        response = self.client.get(self.changelist_url(Project), {'o': '4'})
+        self.assertEqual(list(response.context['cl'].result_list), [small, big])
+
+    def test_project_without_stats_row_shows_zero_tasks(self):
+        project = Project.objects.create(name='No stats', created_by=self.user)
+        ProjectStats.objects.filter(project=project).delete()
+
+        response = self.client.get(self.changelist_url(Project))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p.tasks_total for p in response.context['cl'].result_list], [0])
+        response = self.client.get(reverse('admin:main_project_change', args=[project.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Всего задач')
+
+
+class AdminScalabilityTests(BaseViewTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('root', password='pass'))
+
+    def test_autocomplete_filter_loads_only_selected_value(self):
+        project = self.create_project('Wanted', tasks=2)
+        self.create_project('Other', tasks=3)
+        url = reverse('admin:main_task_changelist')
+
+        response = self.client.get(url)
+        self.assertNotContains(response, '>Wanted</option>')
+        self.assertContains(response, 'data-field-name="assigned_to"')
+        self.assertContains(response, 'JS/admin_autocomplete_filter.js')
+
+        # Одним запросом больше - подпись выбранного проекта
+        with self.assertNumQueries(5):
+            response = self.client.get(url, {'project': project.id})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        self.assertContains(response, f'<option value="{project.id}" selected>Wanted</option>', html=True)
+
+        response = self.client.get(url, {'assigned_to': 'junk'})
+        self.assertEqual(response.context['cl'].result_count, 5)
+
+    def test_autocomplete_endpoint_searches_users_and_projects(self):
+        self.create_project('Searchable', tasks=0)
+        url = reverse('admin:autocomplete')
+        response = self.client.get(url, {
+            'app_label': 'main', 'model_name': 'task', 'field_name': 'assigned_to', 'term': 'memb',
+        })
+        self.assertEqual([item['text'] for item in response.json()['results']], ['member'])
+        response = self.client.get(url, {
+            'app_label': 'main', 'model_name': 'task', 'field_name': 'project', 'term': 'search',
+        })
+        self.assertEqual([item['text'] for item in response.json()['results']], ['Searchable'])
+
+    def test_estimated_count_paginator(self):
+        self.create_project('Counted', tasks=3)
+        tasks = Task.objects.order_by('id')
+        self.assertIsNone(estimate_count(tasks))  # SQLite - только точный подсчёт
+        self.assertEqual(EstimatedCountPaginator(tasks, 2).count, 3)
+
+        with mock.patch('main.pagination.estimate_count', return_value=2_000_000):
+            paginator = EstimatedCountPaginator(tasks, 100)
+            with self.assertNumQueries(0):
+                self.assertEqual((paginator.count, paginator.num_pages), (2_000_000, 20_000))
+        with mock.patch('main.pagination.estimate_count', return_value=50):
+            with self.assertNumQueries(1):
+                self.assertEqual(EstimatedCountPaginator(tasks, 100).count, 3)
+
+    # Вывод EXPLAIN (FORMAT JSON) из PostgreSQL 16 для списка задач админки
+    CAPTURED_PLAN = (
+        '[{"Plan": {"Node Type": "Seq Scan", "Parallel Aware": false, "Async Capable": false, '
+        '"Relation Name": "main_task", "Alias": "main_task", "Startup Cost": 0.00, '
+        '"Total Cost": 26942.00, "Plan Rows": 1000183, "Plan Width": 156}}]'
+    )
+
+    def test_estimate_reads_postgres_explain_json(self):
+        tasks = Task.objects.order_by('id')
+        self.assertEqual(plan_rows(self.CAPTURED_PLAN), 1000183)
+        # psycopg разбирает json сам - приходит список
+        self.assertEqual(plan_rows(json.loads(self.CAPTURED_PLAN)), 1000183)
+        self.assertIsNone(plan_rows('QUERY PLAN'))
+        self.assertIsNone(plan_rows([{'Plan': {}}]))
+
+        for output, expected in ((self.CAPTURED_PLAN, 1000183), (json.loads(self.CAPTURED_PLAN), 1000183), ('?', None)):
+            cursor = mock.MagicMock()
+            cursor.__enter__.return_value.fetchall.return_value = [(output,)]
+            with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                    mock.patch.object(connection, 'cursor', return_value=cursor):
+                self.assertEqual(estimate_count(tasks), expected)
+            sql = cursor.__enter__.return_value.execute.call_args[0][0]
+            self.assertTrue(sql.startswith('EXPLAIN (FORMAT JSON) SELECT'))
+            self.assertNotIn('ORDER BY', sql)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_seed_run_and_compare(self):
+        dataset = benchmark.seed({'users': 6, 'projects': 3, 'tasks': 4, 'members': 2, 'requests': 2})
+        self.assertEqual(Task.objects.count(), 12)
+        self.assertEqual(ProjectStats.objects.get(project=dataset['project']).total, 4)
+
+        report = benchmark.report(dataset, benchmark.run(dataset, iterations=2, warmup=0), 2)
+        results = report['results']
+        self.assertEqual(len(results), len(benchmark._scenarios(dataset)))
+        for name, row in results.items():
+            self.assertEqual(row['status'], 200, name)
+            self.assertGreater(row['queries'], 0, name)
+        self.assertEqual(json.loads(json.dumps(report))['meta']['sizes']['users'], 6)
+
+        slower = json.loads(json.dumps(report))
+        slower['results']['dashboard']['queries'] += 1
+        slower['results']['my_tasks']['p95_ms'] = results['my_tasks']['p95_ms'] * 2 + 1
+        regressions = benchmark.compare(report, slower)
+        self.assertEqual(len(regressions), 2)
+        self.assertEqual(benchmark.compare(report, report), [])
+
+
+class GenerateDataTests(TestCase):
+
+    def generate(self, **sizes):
+        plan = datagen.Plan(**{'users': 20, 'projects': 6, 'tasks': 300, 'members': 3, 'colleagues': 2, **sizes})
+        datagen.Generator(plan, batch_size=50, log=lambda message: None).run()
+        return plan
+
+    def snapshot(self):
+        return list(Task.objects.order_by('project__name', 'id').values_list(
+            'project__name', 'title', 'status', 'priority', 'due_date', 'assigned_to__username',
+        ))
+
+    def test_consistent_skewed_dataset(self):
+        plan = self.generate()
+        self.assertEqual(Task.objects.count(), 300)
+        self.assertEqual(sorted(plan.task_counts, reverse=True), sorted(
+            Task.objects.values('project').annotate(n=Count('id')).values_list('n', flat=True), reverse=True,
+        ))
+        for project in Project.objects.filter(name__startswith='gen #'):
+            allowed = project.get_member_ids()
+            assignees = set(project.tasks.exclude(assigned_to=None).values_list('assigned_to_id', flat=True))
+            self.assertLessEqual(assignees, allowed)
+            self.assertEqual(project.stats.total, project.tasks.count())
+        self.assertTrue(ColleagueRequest.objects.exists())
+
+    def test_power_law_sizes(self):
+        sizes = datagen.power_law(random.Random(0), 1000, 100000)
+        self.assertEqual(sum(sizes), 100000)
+        # Десятая часть проектов держит больше половины задач
+        self.assertGreater(sum(sorted(sizes)[-100:]), 50000)
+
+        capped = datagen.power_law(random.Random(0), 100, 1000, minimum=1, maximum=20)
+        self.assertEqual(sum(capped), 1000)
+        self.assertLessEqual(max(capped), 20)
+        self.assertGreaterEqual(min(capped), 1)
+
+    def test_resume_is_deterministic(self):
+        self.generate()
+        expected = self.snapshot()
+        project = Project.objects.get(name='gen #0')
+        ids = list(project.tasks.order_by('id').values_list('id', flat=True))
+        Task.objects.filter(id__in=ids[len(ids) // 2:]).delete()
+
+        self.generate()
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(ProjectStats.objects.get(project=project).total, project.tasks.count())
+
+        call_command('generate_data', users=20, projects=6, tasks=300, members=3, colleagues=2, stdout=StringIO())
+        self.assertEqual(Task.objects.count(), 300)
+
+
+class QueryPlanTests(BaseViewTestCase):
+    """
+    Проверяет по EXPLAIN, что горячие запросы из main.views и users.views идут по индексам.
+    Работает на SQLite и на PostgreSQL (тесты с DATABASE_URL=postgres://...).
+    В PostgreSQL на маленьких данных планировщик и так выбрал бы Seq Scan,
+    поэтому он отключается: если индекса нет, Seq Scan всё равно останется.
+    """
+
+    # Признаки полного прохода по таблице в выводе EXPLAIN
+    SEQ_SCAN_PATTERNS = {
+        'sqlite': re.compile(r'\bSCAN (\w+)(?! USING (COVERING )?INDEX \w+ \()'),
+        'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        from users.models import ColleagueRequest
+        from users.search import index_users
+
+        project = Project.objects.create(name='Plans', created_by=cls.user)
+        ProjectMembership.objects.create(project=project, user=cls.member)
+        today = timezone.now().date()
+        Task.objects.bulk_create([
+            Task(
+                title=f'Task {i}', project=project, created_by=cls.user, assigned_to=cls.member,
+                status=['todo', 'in_progress', 'review', 'done'][i % 4],
+                due_date=today - timedelta(days=i % 5) if i % 2 else None,
+            )
+            for i in range(40)
+        ])
+        ColleagueRequest.objects.create(from_user=cls.user, to_user=cls.member)
+        index_users([cls.user, cls.member])
+        cls.project = project
+
+    def project_tasks_page(self, **params):
+        """Запрос страницы задач проекта так, как его строит представление"""
+        from .pagination import keyset_queryset
+        from .views import TASKS_PER_PAGE, _project_tasks_queryset
+
+        tasks, ordering, _ = _project_tasks_queryset(RequestFactory().get('/', params), self.project)
+        return keyset_queryset(tasks, ordering)[0][:TASKS_PER_PAGE + 1]
+
+    def my_tasks(self, **params):
+        from users.views import _my_tasks_queryset
+
+        return _my_tasks_queryset(RequestFactory().get('/', params), self.member)[0]
+
+    def hot_queries(self):
+        from users.models import ColleagueRequest, Colleagueship, UserSearchToken
+        from users.views import MY_TASKS_SORT_ORDERS
+
+        today = timezone.now().date()
+        queries = {
+            f'project tasks sorted by {sort}': self.project_tasks_page(sort=sort)
+            for sort in TASK_SORT_ORDERS
+        }
+        queries.update({
+            f'my tasks sorted by {sort}': self.my_tasks(sort=sort)
+            for sort in MY_TASKS_SORT_ORDERS
+        })
+        queries.update({
+            'project tasks by status': self.project_tasks_page(status='todo', sort='status'),
+            'project tasks by assignee': self.project_tasks_page(assigned_to=str(self.member.id)),
+            'my tasks by status': self.my_tasks(status='todo'),
+            'overdue tasks': Task.objects.filter(status__in=ACTIVE_STATUSES, due_date__lt=today),
+            'project stats': ProjectStats.objects.filter(project_id__in=[self.project.id]),
+            'access memberships': ProjectMembership.objects.filter(user=self.member),
+            'access owned projects': Project.objects.filter(created_by=self.user).values('id'),
+            'incoming requests': ColleagueRequest.objects.filter(to_user=self.member, status='pending'),
+            'outgoing requests': ColleagueRequest.objects.filter(from_user=self.user, status='pending'),
+            'colleague ids': Colleagueship.objects.filter(user=self.user).values('colleague_id'),
+            'user search': UserSearchToken.objects.filter(token__gte='own', token__lt='own\U0010ffff'),
+        })
+        return queries
+
+    def explain(self, queryset):
+        if connection.vendor != 'postgresql':
+            return queryset.explain()
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+        try:
+            return queryset.explain()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def test_hot_queries_use_indexes(self):
+        pattern = self.SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            self.skipTest(f'Нет правил разбора EXPLAIN для {connection.vendor}')
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(name):
+                plan = self.explain(queryset)
+                self.assertIsNone(pattern.search(plan), f'{name}: полный проход по таблице\n{plan}')
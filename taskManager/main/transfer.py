@@ -0,0 +1,209 @@
+"""
+Массовый импорт и экспорт задач проекта в CSV и JSON Lines.
+
+Импорт читает файл потоком и обрабатывает его пачками по TASK_IMPORT_CHUNK_SIZE
+строк: исполнители пачки (по username) находятся одним запросом среди
+участников проекта, строки проверяются валидаторами полей модели без запросов,
+а корректные записываются одним bulk_create в своей транзакции - счётчики
+проекта обновляются один раз на пачку. Ошибочные строки пропускаются и попадают
+в отчёт с номером строки; в отчёте хранятся первые TASK_IMPORT_MAX_ERRORS.
+
+Экспорт идёт через .iterator(chunk_size=TASK_EXPORT_CHUNK_SIZE) и отдаётся
+StreamingHttpResponse, так что память не зависит от размера проекта. Под ASGI
+синхронный итератор Django сначала собрал бы целиком, поэтому там ответ получает
+асинхронный итератор (aexport_rows), читающий пачки строк в sync_to_async.
+Экспортированный файл можно импортировать обратно (id и created_at игнорируются).
+"""
+import csv
+import io
+import json
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .events import publish_on_commit
+from .models import Task
+
+FORMATS = ('csv', 'jsonl')
+
+EXPORT_FIELDS = ('id', 'title', 'description', 'status', 'priority', 'due_date', 'assigned_to', 'created_at')
+# Колонки, которые читает импорт; остальные игнорируются
+IMPORT_FIELDS = ('title', 'description', 'status', 'priority', 'due_date', 'assigned_to')
+
+
+def detect_format(filename, default='csv'):
+    """Формат по расширению файла: .jsonl/.ndjson - JSON Lines, иначе default"""
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+class ImportReport:
+    """Итог импорта: сколько создано и какие строки отклонены"""
+
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []  # [(номер строки, сообщение)], не больше TASK_IMPORT_MAX_ERRORS
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < settings.TASK_IMPORT_MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+def read_rows(binary_file, file_format):
+    """
+    Строки файла по одной: (номер строки, dict) или (номер строки, сообщение об ошибке).
+    Файл читается потоком, целиком в память не загружается.
+    """
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='' if file_format == 'csv' else None)
+    try:
+        if file_format == 'csv':
+            reader = csv.DictReader(text)
+            for row in reader:
+                # Номер строки файла с учётом заголовка и переносов внутри значений
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                yield line_number, f'Некорректный JSON: {error}'
+                continue
+            if not isinstance(row, dict):
+                yield line_number, 'Ожидается JSON-объект'
+                continue
+            yield line_number, row
+    except UnicodeDecodeError:
+        yield None, 'Файл должен быть в кодировке UTF-8'
+    finally:
+        # Сам файл закрывает владелец
+        text.detach()
+
+
+def _clean_value(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _build_task(row, project, user, assignees):
+    """Задача из строки файла; ValidationError с описанием, если строка некорректна"""
+    values = {field: _clean_value(row.get(field)) for field in IMPORT_FIELDS}
+    task = Task(
+        title=values['title'],
+        description=values['description'],
+        status=values['status'] or 'todo',
+        priority=values['priority'] or 'medium',
+        due_date=values['due_date'] or None,
+        project=project,
+        created_by=user,
+    )
+    username = values['assigned_to']
+    if username:
+        if username not in assignees:
+            raise ValidationError({'assigned_to': f'«{username}» не участник проекта'})
+        task.assigned_to_id = assignees[username]
+    # Проверки полей модели (обязательность, длина, допустимые статусы, формат даты) без запросов
+    task.full_clean(exclude=['project', 'created_by', 'assigned_to'], validate_unique=False)
+    return task
+
+
+def _format_error(error):
+    if hasattr(error, 'message_dict'):
+        return '; '.join(
+            f'{field}: {" ".join(messages)}' for field, messages in error.message_dict.items()
+        )
+    return ' '.join(error.messages)
+
+
+def import_tasks(project, user, rows, chunk_size=None):
+    """Импортирует строки read_rows() в проект от имени user; возвращает ImportReport"""
+    chunk_size = chunk_size or settings.TASK_IMPORT_CHUNK_SIZE
+    report = ImportReport()
+    member_ids = project.get_member_ids()
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        usernames = {
+            _clean_value(row.get('assigned_to'))
+            for _, row in chunk if isinstance(row, dict)
+        } - {''}
+        assignees = dict(
+            get_user_model().objects.filter(username__in=usernames, id__in=member_ids)
+            .values_list('username', 'id')
+        ) if usernames else {}
+
+        tasks = []
+        for line, row in chunk:
+            if not isinstance(row, dict):
+                report.add_error(line, row)
+                continue
+            try:
+                tasks.append(_build_task(row, project, user, assignees))
+            except ValidationError as error:
+                report.add_error(line, _format_error(error))
+        if not tasks:
+            continue
+
+        with transaction.atomic():
+            # Исполнители уже проверены по member_ids - повторных запросов нет
+            Task.objects.bulk_create(tasks, member_ids={project.id: member_ids}, events=False)
+            # Одно событие на пачку вместо события на каждую задачу
+            publish_on_commit(project.id, 'tasks.imported', {'count': len(tasks)})
+        report.created += len(tasks)
+    return report
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: write() возвращает строку, а не пишет её"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(project, file_format):
+    """Строки выгрузки задач проекта (для StreamingHttpResponse)"""
+    columns = [field if field != 'assigned_to' else 'assigned_to__username' for field in EXPORT_FIELDS]
+    tasks = (
+        Task.objects.filter(project=project).order_by('id')
+        .values_list(*columns)
+        .iterator(chunk_size=settings.TASK_EXPORT_CHUNK_SIZE)
+    )
+    if file_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for values in tasks:
+            yield writer.writerow(['' if value is None else _export_value(value) for value in values])
+        return
+    for values in tasks:
+        row = {field: _export_value(value) for field, value in zip(EXPORT_FIELDS, values)}
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+async def aexport_rows(project, file_format):
+    """export_rows() для ASGI: пачки по TASK_EXPORT_CHUNK_SIZE строк без блокировки цикла событий"""
+    rows = export_rows(project, file_format)
+    # thread_sensitive: все пачки читаются в одном потоке, на одном подключении и курсоре
+    next_chunk = sync_to_async(lambda: ''.join(islice(rows, settings.TASK_EXPORT_CHUNK_SIZE)))
+    try:
+        while chunk := await next_chunk():
+            yield chunk
+    finally:
+        await sync_to_async(rows.close)()
+
+
+def _export_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
@@ -11,6 +11,8 @@ urlpatterns = [
         path('projects/create/', views.project_create, name='project_create'),  # Создание проекта
         path('projects/<int:project_id>/', views.project_detail, name='project_detail'),  # Детали проекта
         path('projects/<int:project_id>/edit/', views.project_edit, name='project_edit'),  # Редактирование проекта
+        path('projects/<int:project_id>/tasks/', views.project_tasks_page, name='project_tasks_page'),  # Следующая страница задач (AJAX)
+        path('projects/<int:project_id>/events/', views.project_events, name='project_events'),  # Живые обновления доски (SSE)
         #path('projects/', views.project_list, name='project_list'), # Список проектов
         
         # 👥 Управление участниками проектов
@@ -19,8 +21,14 @@ urlpatterns = [
         
         # ✅ URLs для задач
         path('projects/<int:project_id>/tasks/create/', views.task_create, name='task_create'),  # Создание задачи
+        path('projects/<int:project_id>/tasks/import/', views.task_import, name='task_import'),  # Импорт задач из CSV/JSONL
+        path('projects/<int:project_id>/tasks/export/', views.task_export, name='task_export'),  # Выгрузка задач в CSV/JSONL
         path('tasks/<int:task_id>/edit/', views.task_edit, name='task_edit'),  # Редактирование задачи
         path('tasks/<int:task_id>/delete/', views.task_delete, name='task_delete'),  # Удаление задачи
         path('tasks/<int:task_id>/update-status/', views.update_task_status, name='update_task_status'),  # AJAX обновление статуса
+        path('tasks/update-status/', views.update_tasks_status_bulk, name='update_tasks_status_bulk'),  # AJAX пакетное обновление статусов
+        
+        # 📊 Служебное
+        path('stats/fragments/', views.fragment_cache_stats, name='fragment_cache_stats'),  # Счётчики кэша фрагментов (для персонала)
 ]
 
@@ -1,21 +1,31 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
-from django.http import JsonResponse
-from django.db import models
-from django.db.models import Count, Q
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db import models, transaction
 from django.utils import timezone
 from datetime import timedelta
+import json
 from .models import Project, Task, ProjectMembership
 from .forms import ProjectForm, TaskForm, ProjectInviteForm
+from .fragments import FragmentBatch, fragment_stats
+from .access import get_accessible_project_ids, get_project_role
+from .asyncdb import get_request_user, run_concurrently
+from .conditional import conditional_page, project_page_version, user_pages_version
+from .events import publish_on_commit, snapshot as events_snapshot, stream as events_stream
+from .pagination import paginate_keyset
+from .stats import apply_task_changes, get_project_stats, summarize, touch_project_stats
+from .transfer import FORMATS as TRANSFER_FORMATS, aexport_rows, detect_format, export_rows, import_tasks, read_rows
 
 def check_project_access(user, project):
     """
     Проверяет, имеет ли пользователь доступ к проекту.
     Вызывает PermissionDenied если доступ запрещен.
     """
-    if not project.is_user_in_project(user):
+    if get_project_role(user, project.id) is None:
         raise PermissionDenied("У вас нет доступа к этому проекту")
     
 def landing(request):
@@ -24,73 +34,39 @@ def landing(request):
     return render(request, 'main/landing.html')
 
 @login_required
-def dashboard(request):
+@conditional_page(user_pages_version)
+async def dashboard(request):
     """
     Главная страница - панель управления пользователя.
     Показывает обзор проектов и последние задачи.
+    Независимые запросы выполняются параллельно (см. asyncdb.py).
     """
-    # Получаем все проекты, где пользователь является создателем или участником
-    projects = Project.objects.filter(
-        Q(created_by=request.user) | 
-        Q(team_members=request.user)
-    ).distinct().select_related('created_by')
-    
-    # Получаем последние 5 задач из доступных проектов
-    recent_tasks = Task.objects.filter(
-        project__in=projects
-    ).select_related('project', 'assigned_to', 'created_by').order_by('-created_at')[:5]
-    
-    # ПРАВИЛЬНЫЙ подсчет статистики
-    total_tasks = 0
-    total_done = 0
-    total_in_progress = 0
-    total_todo = 0
-    
-    # Собираем детальную статистику по каждому проекту
-    projects_stats = []
-    for project in projects:
-        project_tasks = project.tasks.all()
-        task_count = project_tasks.count()
-        done_count = project_tasks.filter(status='done').count()
-        in_progress_count = project_tasks.filter(status='in_progress').count()
-        todo_count = project_tasks.filter(status='todo').count()
-        
-        # Общая статистика
-        total_tasks += task_count
-        total_done += done_count
-        total_in_progress += in_progress_count
-        total_todo += todo_count
-        
-        # Статистика для каждого проекта
-        projects_stats.append({
-            'project': project,
-            'total': task_count,
-            'done': done_count,
-            'in_progress': in_progress_count,
-            'todo': todo_count,
-        })
-    
-    # Задачи назначенные на текущего пользователя
-    my_tasks_count = Task.objects.filter(assigned_to=request.user).count()
-    
-    # Просроченные задачи (только активные, не выполненные)
-    overdue_tasks = Task.objects.filter(
-        project__in=projects,
-        due_date__lt=timezone.now().date(),
-        status__in=['todo', 'in_progress']
-    ).count()
-    
-    # Задачи с высоким приоритетом
-    high_priority_tasks = Task.objects.filter(
-        project__in=projects,
-        priority='high',
-        status__in=['todo', 'in_progress']
-    ).count()
+    user = await get_request_user(request)
+    project_ids = await sync_to_async(get_accessible_project_ids)(user)
+    
+    projects, recent_tasks, stats_by_project, my_tasks_count, fragment_batch = await run_concurrently(
+        # Все проекты, где пользователь является создателем или участником
+        lambda: list(Project.objects.filter(id__in=project_ids).select_related('created_by')),
+        # Последние 5 задач из доступных проектов
+        lambda: list(Task.objects.filter(
+            project_id__in=project_ids
+        ).select_related('project', 'assigned_to', 'created_by').order_by('-created_at')[:5]),
+        # Статистика по всем проектам - из ProjectStats одним запросом
+        lambda: get_project_stats(project_ids, with_members=True),
+        # Задачи назначенные на текущего пользователя
+        lambda: Task.objects.filter(assigned_to=user).count(),
+        # Карточки проектов из кэша фрагментов - двумя get_many на все проекты
+        lambda: FragmentBatch(('dashboard_card', project_id, ()) for project_id in project_ids),
+    )
+    
+    projects_stats = [
+        {'project': project, **stats_by_project[project.id]}
+        for project in projects
+    ]
+    totals = summarize(projects_stats)
     
     # Проекты с наибольшим количеством задач
-    top_projects = projects.annotate(
-        task_count=Count('tasks')
-    ).order_by('-task_count')[:3]
+    top_projects = sorted(projects_stats, key=lambda stats: stats['total'], reverse=True)[:3]
     
     context = {
         'projects': projects,
@@ -98,43 +74,46 @@ def dashboard(request):
         'projects_stats': projects_stats,
         
         # Основная статистика
-        'total_tasks': total_tasks,
-        'total_done': total_done,
-        'total_active': total_in_progress + total_todo,  # Активные = в работе + к выполнению
-        'total_in_progress': total_in_progress,
-        'total_todo': total_todo,
+        'total_tasks': totals['total'],
+        'total_done': totals['done'],
+        'total_active': totals['active'],  # Активные = в работе + к выполнению
+        'total_in_progress': totals['in_progress'],
+        'total_todo': totals['todo'],
         'my_tasks_count': my_tasks_count,
-        'overdue_tasks': overdue_tasks,
-        'high_priority_tasks': high_priority_tasks,
+        'overdue_tasks': totals['overdue'],
+        'high_priority_tasks': totals['high_active'],
         'today': timezone.now().date(),
         
         # Дополнительная информация
         'top_projects': top_projects,
+        'fragment_batch': fragment_batch,
     }
     
-    return render(request, 'main/index/dashboard.html', context)
+    # Шаблон может обращаться к БД (request.user, кэш фрагментов) - рендерим в потоке
+    return await sync_to_async(render)(request, 'main/index/dashboard.html', context)
 
-@login_required
-def project_detail(request, project_id):
+# Поддерживаемые сортировки списка задач проекта: id в конце делает порядок однозначным.
+# Для каждой есть составной индекс (project, поле, id) - см. Task.Meta.indexes
+TASK_SORT_ORDERS = {
+    '-created_at': ('-created_at', '-id'),
+    'created_at': ('created_at', 'id'),
+    'title': ('title', 'id'),
+    '-title': ('-title', '-id'),
+    'status': ('status', 'id'),
+    'priority': ('priority', 'id'),
+    'due_date': ('due_date', 'id'),
+}
+
+# Сколько задач выводится за один раз
+TASKS_PER_PAGE = 50
+
+def _project_tasks_queryset(request, project):
     """
-    Детальная страница проекта со списком задач.
-    Поддерживает фильтрацию и сортировку задач.
+    Задачи проекта по GET-параметрам status, assigned_to и sort (без постраничности).
+    Возвращает (queryset, поля сортировки, параметры фильтров для шаблона).
     """
-    # Получаем проект или возвращаем 404
-    project = get_object_or_404(Project, id=project_id)
-    
-    # Проверяем доступ пользователя к проекту
-    check_project_access(request.user, project)
-    
-    # Получаем все задачи проекта с оптимизацией запросов
     tasks = project.tasks.all().select_related('assigned_to', 'created_by')
     
-    project_tasks = project.tasks.all()
-    task_count = project_tasks.count()
-    done_count = project_tasks.filter(status='done').count()
-    in_progress_count = project_tasks.filter(status='in_progress').count()
-    
-    
     # Фильтрация по статусу из GET-параметра
     status_filter = request.GET.get('status', '')
     if status_filter:
@@ -142,13 +121,48 @@ def project_detail(request, project_id):
     
     # Фильтрация по исполнителю из GET-параметра
     assigned_filter = request.GET.get('assigned_to', '')
-    if assigned_filter:
+    if assigned_filter.isdigit():
         tasks = tasks.filter(assigned_to_id=assigned_filter)
     
     # Сортировка из GET-параметра (по умолчанию - новые сначала)
     sort_by = request.GET.get('sort', '-created_at')
-    if sort_by in ['title', 'status', 'priority', 'due_date', '-created_at']:
-        tasks = tasks.order_by(sort_by)
+    if sort_by not in TASK_SORT_ORDERS:
+        sort_by = '-created_at'
+    
+    filters = {
+        'status_filter': status_filter,
+        'assigned_filter': assigned_filter,
+        'sort_by': sort_by,
+    }
+    return tasks, TASK_SORT_ORDERS[sort_by], filters
+
+def _project_tasks_page(request, project):
+    """
+    Страница задач проекта по GET-параметрам status, assigned_to, sort и after.
+    Возвращает (задачи, курсор следующей страницы, параметры фильтров для шаблона).
+    """
+    tasks, ordering, filters = _project_tasks_queryset(request, project)
+    tasks, next_cursor = paginate_keyset(tasks, ordering, request.GET.get('after'), TASKS_PER_PAGE)
+    return tasks, next_cursor, filters
+
+@login_required
+@conditional_page(project_page_version)
+def project_detail(request, project_id):
+    """
+    Детальная страница проекта со списком задач.
+    Поддерживает фильтрацию и сортировку задач.
+    """
+    # Получаем проект или возвращаем 404
+    project = get_object_or_404(Project, id=project_id)
+    
+    # Проверяем доступ пользователя к проекту
+    check_project_access(request.user, project)
+    
+    # Первая страница задач, остальные подгружаются через project_tasks_page
+    tasks, next_cursor, filters = _project_tasks_page(request, project)
+    
+    # Статистика проекта - один агрегирующий запрос
+    stats = get_project_stats([project.id], with_members=True)[project.id]
     
     # Получаем участников проекта для фильтра по исполнителям
     available_assignees = project.team_members.all()
@@ -156,20 +170,52 @@ def project_detail(request, project_id):
     # Получаем информацию о членах команды с их ролями
     team_members = project.get_team_members()
     
+    user_role = get_project_role(request.user, project.id)
+    today = timezone.now().date()
+    # Оба фрагмента страницы - двумя get_many; vary_on как в тегах шаблонов
+    fragment_batch = FragmentBatch([
+        ('project_sidebar', project.id, [user_role]),
+        ('task_rows', project.id, [
+            request.user.id, filters['sort_by'], filters['status_filter'], filters['assigned_filter'],
+            request.GET.get('after', ''), today,
+        ]),
+    ])
+    
     context = {
         'project': project,
+        'user_role': user_role,
         'tasks': tasks,
-        "task_count": task_count,
-        "done_count": done_count,
-        "progress_count": in_progress_count,
-        'status_filter': status_filter,
-        'assigned_filter': assigned_filter,
+        'next_cursor': next_cursor,
+        'today': today,
+        'fragment_batch': fragment_batch,
+        'stats': stats,
+        "task_count": stats['total'],
+        "done_count": stats['done'],
+        "progress_count": stats['in_progress'],
         'available_assignees': available_assignees,
         'team_members': team_members,
-        'sort_by': sort_by,
+        **filters,
     }
     return render(request, 'main/project/project_detail.html', context)
 
+@login_required
+def project_tasks_page(request, project_id):
+    """
+    Следующая страница задач проекта (HTML-фрагмент для бесконечной прокрутки).
+    Принимает те же параметры фильтрации и сортировки, что и project_detail, и курсор after.
+    """
+    project = get_object_or_404(Project, id=project_id)
+    check_project_access(request.user, project)
+    
+    tasks, next_cursor, filters = _project_tasks_page(request, project)
+    return render(request, 'main/project/_task_rows.html', {
+        'project': project,
+        'tasks': tasks,
+        'next_cursor': next_cursor,
+        'today': timezone.now().date(),
+        **filters,
+    })
+
 @login_required
 def project_create(request):
     """
@@ -212,16 +258,15 @@ def project_edit(request, project_id):
         raise PermissionDenied("Только создатель может редактировать проект")
     
     # Вычисляем статистику
-    total_tasks = project.tasks.count()
-    done_tasks = project.tasks.filter(status='done').count()
-    team_members_count = project.team_members.count() + 1  # + создатель
+    stats = get_project_stats([project.id], with_members=True)[project.id]
+    team_members_count = stats['members'] + 1  # + создатель
     
     if request.method == 'POST':
         form = ProjectForm(request.POST, instance=project)
         if form.is_valid():
             form.save()
             messages.success(request, f'Проект "{project.name}" успешно обновлен!')
-            return redirect('project_detail', project_id=project.id)
+            return redirect('main:project_detail', project_id=project.id)
     else:
         form = ProjectForm(instance=project)
     
@@ -229,8 +274,8 @@ def project_edit(request, project_id):
         'form': form, 
         'title': 'Редактировать проект',
         'project': project,
-        'total_tasks': total_tasks,
-        'done_tasks': done_tasks,
+        'total_tasks': stats['total'],
+        'done_tasks': stats['done'],
         'team_members_count': team_members_count,
     }
     return render(request, 'main/project/project_form.html', context)
@@ -272,17 +317,60 @@ def task_create(request, project_id):
         'title': 'Создать задачу'
     })
 
+@login_required
+def task_import(request, project_id):
+    """
+    Импорт задач из CSV или JSON Lines.
+    Файл читается потоком и записывается пачками; ошибочные строки попадают в отчёт.
+    """
+    project = get_object_or_404(Project, id=project_id)
+    check_project_access(request.user, project)
+
+    report = None
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if upload is None:
+            messages.error(request, 'Выберите файл для импорта')
+        else:
+            file_format = request.POST.get('format') or detect_format(upload.name)
+            if file_format not in TRANSFER_FORMATS:
+                file_format = detect_format(upload.name)
+            report = import_tasks(project, request.user, read_rows(upload.file, file_format))
+            if report.created:
+                messages.success(request, f'Импортировано задач: {report.created}')
+
+    return render(request, 'main/project/task_import.html', {
+        'project': project,
+        'report': report,
+    })
+
+@login_required
+def task_export(request, project_id):
+    """Выгрузка задач проекта потоком: память не зависит от числа задач"""
+    project = get_object_or_404(Project, id=project_id)
+    check_project_access(request.user, project)
+
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in TRANSFER_FORMATS:
+        file_format = 'csv'
+    content_type = 'text/csv; charset=utf-8' if file_format == 'csv' else 'application/x-ndjson; charset=utf-8'
+    # Под ASGI синхронный итератор был бы собран в память целиком
+    rows = aexport_rows(project, file_format) if hasattr(request, 'scope') else export_rows(project, file_format)
+    response = StreamingHttpResponse(rows, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="project-{project.id}-tasks.{file_format}"'
+    return response
+
 @login_required
 def task_edit(request, task_id):
     """
     Редактирование существующей задачи.
     """
     # Получаем задачу и проверяем доступ к ее проекту
-    task = get_object_or_404(Task, id=task_id)
+    task = get_object_or_404(Task.objects.select_related('project'), id=task_id)
     check_project_access(request.user, task.project)
     
     # Проверяем права на редактирование (только создатель или участник с правами)
-    if task.created_by != request.user and not task.project.projectmembership_set.filter(
+    if task.created_by_id != request.user.id and not task.project.projectmembership_set.filter(
         user=request.user, can_edit_tasks=True
     ).exists():
         raise PermissionDenied("У вас нет прав для редактирования этой задачи")
@@ -293,7 +381,7 @@ def task_edit(request, task_id):
         if form.is_valid():
             form.save()
             messages.success(request, f'Задача "{task.title}" обновлена!')
-            return redirect('project_detail', project_id=task.project.id)
+            return redirect('main:project_detail', project_id=task.project.id)
     else:
         # Показываем форму с текущими данными задачи
         form = TaskForm(instance=task, project=task.project)
@@ -335,6 +423,47 @@ def task_delete(request, task_id):
     }
     return render(request, 'main/project/task_confirm_delete.html', context)
 
+# Сколько перемещений карточек принимается в одном запросе
+MAX_STATUS_MOVES = 500
+
+def apply_status_moves(user, moves):
+    """
+    Применяет пачку смен статуса {task_id: status} в одной транзакции.
+    Доступ проверяется одним запросом по индексу доступных проектов,
+    затем на каждый целевой статус выполняется один UPDATE, который
+    меняет только status и updated_at.
+    Возвращает (обновлённые {task_id: status}, ID задач без доступа).
+    """
+    accessible = get_accessible_project_ids(user)
+    with transaction.atomic():
+        rows = Task.objects.select_for_update().filter(
+            id__in=list(moves), project_id__in=accessible
+        ).values_list('id', *Task.COUNTER_FIELDS)
+        
+        old_states = {}
+        for task_id, *values in rows:
+            old_states[task_id] = dict(zip(Task.COUNTER_FIELDS, values))
+        
+        # Группируем задачи по новому статусу, пропуская те, у которых он не меняется
+        by_status = {}
+        for task_id, state in old_states.items():
+            if state['status'] != moves[task_id]:
+                by_status.setdefault(moves[task_id], []).append(task_id)
+        
+        now = timezone.now()
+        changes = []
+        for new_status, task_ids in by_status.items():
+            Task.objects.filter(id__in=task_ids).update(status=new_status, updated_at=now)
+            for task_id in task_ids:
+                changes.append((old_states[task_id], {**old_states[task_id], 'status': new_status}))
+                # UPDATE не вызывает сигналов - событие для открытых досок публикуем сами
+                publish_on_commit(old_states[task_id]['project_id'], 'task.updated', {'id': task_id, 'status': new_status})
+        apply_task_changes(changes)
+    
+    updated = {task_id: moves[task_id] for task_id in old_states}
+    denied = [task_id for task_id in moves if task_id not in old_states]
+    return updated, denied
+
 @login_required
 def update_task_status(request, task_id):
     """
@@ -343,29 +472,80 @@ def update_task_status(request, task_id):
     """
     # Проверяем, что это AJAX-запрос
     if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        # Получаем задачу и проверяем доступ
-        task = get_object_or_404(Task, id=task_id)
-        check_project_access(request.user, task.project)
-        
         # Получаем новый статус из POST-данных
         new_status = request.POST.get('status')
         
         # Проверяем, что статус допустимый
         if new_status in dict(Task.STATUS_CHOICES):
-            # Обновляем статус и сохраняем
-            task.status = new_status
-            task.save()
+            updated, denied = apply_status_moves(request.user, {task_id: new_status})
+            if denied:
+                # Задачи нет или нет доступа к её проекту
+                if not Task.objects.filter(id=task_id).exists():
+                    raise Http404("Задача не найдена")
+                raise PermissionDenied("У вас нет доступа к этому проекту")
             
             # Возвращаем JSON-ответ об успехе
             return JsonResponse({
                 'success': True, 
-                'new_status': task.get_status_display(),
-                'status': task.status
+                'new_status': dict(Task.STATUS_CHOICES)[new_status],
+                'status': new_status
             })
     
     # Если что-то пошло не так, возвращаем ошибку
     return JsonResponse({'success': False, 'error': 'Не удалось обновить статус'})
 
+def _parse_status_moves(payload):
+    """{task_id: статус} из {"moves": [{"task_id": int, "status": str}, ...]} или None, если формат другой"""
+    raw_moves = payload.get('moves') if isinstance(payload, dict) else None
+    if not isinstance(raw_moves, list):
+        return None
+    moves = {}
+    for move in raw_moves:
+        if not isinstance(move, dict):
+            return None
+        task_id, status = move.get('task_id'), move.get('status')
+        # bool - подкласс int, но id задачи не бывает true/false
+        if not isinstance(task_id, int) or isinstance(task_id, bool) or not isinstance(status, str):
+            return None
+        moves[task_id] = status
+    return moves
+
+@login_required
+def update_tasks_status_bulk(request):
+    """
+    AJAX-функция для пакетного перемещения карточек между колонками.
+    Принимает JSON: {"moves": [{"task_id": 1, "status": "done"}, ...]}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Ожидается POST-запрос'}, status=405)
+    
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        payload = None
+    moves = _parse_status_moves(payload)
+    if moves is None:
+        return JsonResponse({'success': False, 'error': 'Некорректный формат данных'}, status=400)
+    
+    statuses = dict(Task.STATUS_CHOICES)
+    if not moves or len(moves) > MAX_STATUS_MOVES:
+        return JsonResponse({
+            'success': False,
+            'error': f'Можно переместить от 1 до {MAX_STATUS_MOVES} задач за раз',
+        }, status=400)
+    if any(status not in statuses for status in moves.values()):
+        return JsonResponse({'success': False, 'error': 'Недопустимый статус'}, status=400)
+    
+    updated, denied = apply_status_moves(request.user, moves)
+    return JsonResponse({
+        'success': not denied,
+        'updated': [
+            {'task_id': task_id, 'status': status, 'new_status': statuses[status]}
+            for task_id, status in updated.items()
+        ],
+        'failed': denied,
+    })
+
 # @login_required
 # def invite_to_project(request, project_id):
 #     """
@@ -426,10 +606,12 @@ def remove_from_project(request, project_id, user_id):
     user_tasks_count = project.tasks.filter(assigned_to=user_to_remove).count()
 
     if request.method == 'POST':
-        # Снимаем участника с его задач
-        project.tasks.filter(assigned_to=user_to_remove).update(assigned_to=None)
-        # Удаляем из проекта
-        ProjectMembership.objects.filter(project=project, user=user_to_remove).delete()
+        with transaction.atomic():
+            # Удаляем из проекта
+            ProjectMembership.objects.filter(project=project, user=user_to_remove).delete()
+            touch_project_stats([project.id])
+            # Один UPDATE; счётчики, версии страниц и события досок - в той же транзакции
+            project.tasks.filter(assigned_to=user_to_remove).update_with_stats(assigned_to=None)
 
         if user_tasks_count:
             messages.success(request, f'Пользователь {user_to_remove.username} удалён. Его {user_tasks_count} задач теперь без исполнителя.')
@@ -443,4 +625,32 @@ def remove_from_project(request, project_id, user_id):
         'membership': membership,
         'user_tasks_count': user_tasks_count,
     }
-    return render(request, 'main/project/remove_member_confirm.html', context)
\ No newline at end of file
+    return render(request, 'main/project/remove_member_confirm.html', context)
+
+@login_required
+async def project_events(request, project_id):
+    """
+    Живые обновления доски проекта (Server-Sent Events): задачи и состав команды.
+    EventSource переподключается сам и продолжает с заголовка Last-Event-ID.
+    """
+    user = await get_request_user(request)
+    if await sync_to_async(get_project_role)(user, project_id) is None:
+        raise PermissionDenied("У вас нет доступа к этому проекту")
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if hasattr(request, 'scope'):
+        # ASGI: соединение держит только корутина, воркер свободен
+        response = StreamingHttpResponse(events_stream(project_id, last_event_id), content_type='text/event-stream')
+        # nginx не должен буферизовать поток
+        response['X-Accel-Buffering'] = 'no'
+    else:
+        # WSGI: удержание заняло бы воркер - отдаём накопленное, клиент опросит снова
+        body = await sync_to_async(events_snapshot)(project_id, last_event_id)
+        response = HttpResponse(''.join(body), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@staff_member_required
+def fragment_cache_stats(request):
+    """Попадания и промахи кэша фрагментов шаблонов (счётчики этого процесса)"""
+    return JsonResponse({'fragments': fragment_stats()})
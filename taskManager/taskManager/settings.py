@@ -4,6 +4,7 @@ Django settings for taskManager project.
 
 from pathlib import Path
 import os
+import sys
 import dj_database_url
 from dotenv import load_dotenv
 
@@ -21,6 +22,8 @@ if not SECRET_KEY:
     raise ValueError("SECRET_KEY не задан! Добавьте его в .env или переменные окружения.")
 
 DEBUG = os.environ.get('DEBUG', 'False') == 'True'
+# manage.py test: кэш по умолчанию - в памяти процесса (см. КЭШ)
+TESTING = sys.argv[1:2] == ['test']
 
 # Парсим ALLOWED_HOSTS из переменной окружения
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost').split(',')
@@ -56,11 +59,14 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'main',
     'users',
+    'jobs',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'main.profiling.ServerTimingMiddleware',
+    'main.querybudget.QueryBudgetMiddleware',
+    'main.staticfiles.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -112,6 +118,140 @@ else:
         }
     }
 
+# Режим сервера приложений: wsgi (gunicorn) или asgi (uvicorn), см. Dockerfile
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+# Число процессов сервера (WEB_CONCURRENCY - его читает gunicorn из Procfile):
+# при нескольких нужен общий кэш (проверка main.E001)
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS') or os.environ.get('WEB_CONCURRENCY') or 1)
+
+if SERVER_MODE == 'asgi' and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    # Под ASGI каждый запрос открывает подключение в своём контексте, постоянные
+    # подключения копились бы - вместо них пул psycopg (CONN_MAX_AGE должен быть 0)
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 20)),
+    }
+
+# Потоки для параллельных запросов async-представлений (main/asyncdb.py);
+# каждый держит своё подключение к БД. 0 - запросы выполняются по очереди
+ASYNC_QUERY_THREADS = int(os.environ.get('ASYNC_QUERY_THREADS', 4))
+
+# ==============================================================
+# КЭШ
+# ==============================================================
+
+# Версии индекса доступа и фрагментов живут в кэше: сброс из одного процесса (веб-воркер,
+# исполнитель заданий, другой экземпляр) должны видеть все остальные. Поэтому по умолчанию -
+# DatabaseCache в таблице cache_table (manage.py createcachetable выполняют Dockerfile,
+# Procfile и vercel.json). Кэш в памяти процесса - только для DEBUG и тестов; с ним
+# несколько процессов не запустятся (проверка main.E001).
+if DEBUG or TESTING:
+    _DEFAULT_CACHE = ('django.core.cache.backends.locmem.LocMemCache', 'taskmanager')
+else:
+    _DEFAULT_CACHE = ('django.core.cache.backends.db.DatabaseCache', 'cache_table')
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', _DEFAULT_CACHE[0]),
+        'LOCATION': os.environ.get('CACHE_LOCATION', _DEFAULT_CACHE[1]),
+    }
+}
+
+# Индекс доступных пользователю проектов (main/access.py)
+ACCESS_CACHE_TIMEOUT = int(os.environ.get('ACCESS_CACHE_TIMEOUT', 60 * 60))
+ACCESS_CACHE_LOCAL_SIZE = int(os.environ.get('ACCESS_CACHE_LOCAL_SIZE', 1024))
+
+# Фрагменты шаблонов (main/fragments.py) инвалидируются версией проекта,
+# таймаут лишь ограничивает время жизни неиспользуемых записей
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 24 * 60 * 60))
+
+# ==============================================================
+# ЖИВЫЕ ОБНОВЛЕНИЯ ДОСОК (main/events.py)
+# ==============================================================
+
+# main.events.CacheBroker - через общий кэш, события видят все воркеры (по умолчанию);
+# main.events.InProcessBroker - в памяти процесса, только для одного процесса
+# (runserver, тесты): при WEB_WORKERS > 1 не запустится (проверка main.E002)
+EVENTS_BROKER = os.environ.get('EVENTS_BROKER', 'main.events.CacheBroker')
+# Сколько последних событий проекта хранится для переподключения клиентов
+EVENTS_HISTORY = int(os.environ.get('EVENTS_HISTORY', 500))
+# Время жизни события в CacheBroker, с
+EVENTS_TTL = int(os.environ.get('EVENTS_TTL', 10 * 60))
+# Как часто CacheBroker проверяет новые события, с
+EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 1))
+# Под ASGI: пинг простаивающего потока и переподключение после EVENTS_STREAM_TIMEOUT, с
+EVENTS_HEARTBEAT = int(os.environ.get('EVENTS_HEARTBEAT', 15))
+EVENTS_STREAM_TIMEOUT = int(os.environ.get('EVENTS_STREAM_TIMEOUT', 5 * 60))
+# Под WSGI поток не держится: клиент опрашивает сервер с этим интервалом, мс
+EVENTS_POLL_RETRY_MS = int(os.environ.get('EVENTS_POLL_RETRY_MS', 5000))
+
+# ==============================================================
+# БЮДЖЕТ SQL-ЗАПРОСОВ (main/querybudget.py)
+# ==============================================================
+
+# Обёртка считает каждый SQL-запрос, поэтому в продакшене по умолчанию выключена
+QUERY_BUDGET_ENABLED = os.environ.get('QUERY_BUDGET_ENABLED', str(DEBUG or TESTING)) == 'True'
+# True - нарушение выбрасывает исключение (включается в тестах), иначе пишется в лог
+QUERY_BUDGET_RAISE = os.environ.get('QUERY_BUDGET_RAISE', 'False') == 'True'
+# Одинаковый запрос, повторённый столько раз за HTTP-запрос, считается N+1
+QUERY_REPEAT_THRESHOLD = 5
+# Лимит для представлений, которых нет в QUERY_BUDGETS (None - без лимита)
+QUERY_BUDGET_DEFAULT = None
+# Лимиты с запасом над замеренными значениями. Раз в сутки страницы со статистикой
+# делают ещё пару запросов, пересчитывая просроченные задачи (main/stats.py)
+QUERY_BUDGETS = {
+    'main:dashboard': 12,
+    'main:project_detail': 12,
+    'main:project_edit': 10,
+    'main:project_tasks_page': 6,
+    'main:task_create': 12,
+    'main:task_edit': 12,
+    'main:task_delete': 10,
+    'main:update_task_status': 10,
+    'main:update_tasks_status_bulk': 12,
+    'users:project_list': 6,
+    'users:my_tasks': 7,
+    'users:profile': 12,
+    'users:colleagues': 8,
+    'users:search_users': 8,
+    'users:invite_to_project': 10,
+    'admin:main_project_changelist': 6,
+    # POST сюда же - массовые действия (update_with_stats): правка, счётчики, события
+    'admin:main_task_changelist': 10,
+    'admin:main_projectmembership_changelist': 6,
+}
+
+# Представления, где число запросов растёт с объёмом входных данных по замыслу
+# (пачки импорта): для них бюджет и поиск N+1 не применяются
+QUERY_BUDGET_EXEMPT = {'main:task_import'}
+
+# Списки админки (EstimatedCountPaginator в main/pagination.py): начиная с этой
+# оценки планировщика PostgreSQL число строк не считается через COUNT(*)
+ADMIN_COUNT_ESTIMATE_THRESHOLD = 10000
+
+# ==============================================================
+# ИМПОРТ И ЭКСПОРТ ЗАДАЧ (main/transfer.py)
+# ==============================================================
+
+# Строк импорта в одной пачке: один запрос исполнителей и один bulk_create
+TASK_IMPORT_CHUNK_SIZE = 1000
+# Сколько ошибочных строк показывать в отчёте (считаются все)
+TASK_IMPORT_MAX_ERRORS = 100
+# Строк, читаемых из БД за раз при экспорте
+TASK_EXPORT_CHUNK_SIZE = 2000
+
+# ==============================================================
+# SERVER-TIMING И ПРОФИЛИРОВАНИЕ (main/profiling.py)
+# ==============================================================
+
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'True') == 'True'
+# Доля запросов, выполняемых под cProfile (0 - выключено, 0.01 - каждый сотый)
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# Дамп сохраняется, только если запрос шёл дольше порога
+PROFILE_SLOW_MS = int(os.environ.get('PROFILE_SLOW_MS', 500))
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', BASE_DIR / 'profiles'))
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 200))
+
 # ==============================================================
 # ВАЛИДАЦИЯ ПАРОЛЕЙ
 # ==============================================================
@@ -152,6 +292,21 @@ else:
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Миниатюры аватаров (users/avatars.py): размеры в пикселях и качество WebP/JPEG
+AVATAR_SIZES = (32, 64, 128)
+AVATAR_QUALITY = 82
+
+# Очередь фоновых заданий (jobs/queue.py, manage.py runworker)
+# Пауза исполнителя при пустой очереди, секунды
+JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 1.0))
+# Попыток по умолчанию, затем задание переносится в DeadJob
+JOBS_MAX_ATTEMPTS = 5
+# Задержка повтора: база * 2^(попытка-1), не больше максимума, секунды
+JOBS_RETRY_BASE_DELAY = 10
+JOBS_RETRY_MAX_DELAY = 60 * 60
+# Задание, выполняющееся дольше, считается брошенным и возвращается в очередь, секунды
+JOBS_LOCK_TIMEOUT = 15 * 60
+
 # ==============================================================
 # ПРОЧЕЕ
 # ==============================================================
@@ -1,4 +1,12 @@
 from django.contrib import admin
+from main.admin import LargeTableAdmin
 from users.models import User
 
-admin.site.register(User)
\ No newline at end of file
+
+@admin.register(User)
+class UserAdmin(LargeTableAdmin):
+    list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'is_active')
+    list_filter = ('is_staff', 'is_active')
+    # Поиск нужен и фильтрам-автодополнению по пользователям в других списках
+    search_fields = ('username', 'email', 'first_name', 'last_name')
+    ordering = ('username',)
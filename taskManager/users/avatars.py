@@ -0,0 +1,147 @@
+"""
+Миниатюры аватаров: квадраты AVATAR_SIZES пикселей в WebP и JPEG.
+
+Оригинал декодируется один раз (для JPEG - сразу в уменьшенном масштабе через
+draft), метаданные (EXIF, ICC) не переносятся. Миниатюры лежат в отдельном
+каталоге, куда пользователи ничего не загружают, под хэшем имени оригинала:
+users/photo.jpg -> avatars/renditions/<хэш>/64.webp, avatars/renditions/<хэш>/64.jpg.
+
+Обработка идёт в фоновом задании (users/jobs.py) в процессе manage.py runworker,
+чтобы не занимать веб-воркер. Готовность отмечается в строке пользователя
+(User.avatar_renditions - имя аватара, для которого есть миниатюры), поэтому
+вывод аватара не обращается ни к хранилищу, ни к кэшу; пока миниатюр нет, шаблоны
+выводят оригинал (тег {% avatar %} в templatetags/avatars.py). Существующие
+аватары обрабатывает команда build_avatar_renditions.
+"""
+import hashlib
+import logging
+from io import BytesIO
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+# Расширение файла и формат Pillow для каждого варианта миниатюры
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+
+# Каталог миниатюр в хранилище (upload_to аватаров - users/)
+RENDITIONS_DIR = 'avatars/renditions'
+
+
+def rendition_name(name, size, extension):
+    digest = hashlib.sha256(name.encode()).hexdigest()[:32]
+    return f'{RENDITIONS_DIR}/{digest}/{size}.{extension}'
+
+
+def render_renditions(data, sizes, quality):
+    """
+    Миниатюры изображения: {(размер, расширение): байты}.
+    Выполняется в процессе пула, поэтому не обращается ни к Django, ни к файлам.
+    """
+    largest = max(sizes)
+    with Image.open(BytesIO(data)) as image:
+        # JPEG декодируется сразу в масштабе 1/2..1/8, не меньше нужного размера
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # У JPEG нет прозрачности - кладём на белый фон
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+
+    renditions = {}
+    # Каждый следующий размер уменьшается из предыдущего, а не из оригинала
+    source = image
+    for size in sorted(sizes, reverse=True):
+        source = ImageOps.fit(source, (size, size), Image.Resampling.LANCZOS)
+        for extension, image_format in FORMATS.items():
+            buffer = BytesIO()
+            if image_format == 'JPEG':
+                source.save(buffer, image_format, quality=quality, optimize=True, progressive=True)
+            else:
+                source.save(buffer, image_format, quality=quality, method=4)
+            renditions[size, extension] = buffer.getvalue()
+    return renditions
+
+
+def store_renditions(name, renditions):
+    """Записывает миниатюры оригинала name и отмечает их у пользователей с этим аватаром"""
+    # Самая крупная JPEG-миниатюра записывается последней: по ней проверяется готовность
+    marker = (max(size for size, _ in renditions), 'jpg')
+    for key in sorted(renditions, key=lambda key: key == marker):
+        path = rendition_name(name, *key)
+        # Каталог принадлежит только миниатюрам этого оригинала
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        default_storage.save(path, ContentFile(renditions[key]))
+    mark_renditions_ready(name)
+
+
+def mark_renditions_ready(name):
+    """Миниатюры name готовы - у всех пользователей с этим аватаром (например, общим по умолчанию)"""
+    from main.fragments import bump_project_versions
+    from main.models import Project, ProjectMembership
+    from main.stats import mark_projects_changed
+
+    User = get_user_model()
+    user_ids = list(User.objects.filter(avatar=name).exclude(avatar_renditions=name).values_list('pk', flat=True))
+    if not user_ids:
+        return
+    User.objects.filter(pk__in=user_ids).update(avatar_renditions=name)
+    # update() без сигналов: аватары выводятся в кэшированных фрагментах и на страницах
+    # проектов этих пользователей, их версии (и ETag) меняются здесь
+    project_ids = set(
+        ProjectMembership.objects.filter(user_id__in=user_ids).values_list('project_id', flat=True)
+    ) | set(Project.objects.filter(created_by_id__in=user_ids).values_list('id', flat=True))
+    bump_project_versions(*project_ids)
+    mark_projects_changed(project_ids)
+
+
+def renditions_ready(name):
+    """Есть ли миниатюры в хранилище (для команды и новых пользователей, не для вывода страниц)"""
+    if not name:
+        return False
+    return default_storage.exists(rendition_name(name, max(settings.AVATAR_SIZES), 'jpg'))
+
+
+def build_renditions(name):
+    """Готовит миниатюры в текущем процессе. Возвращает False, если файл не читается"""
+    try:
+        with default_storage.open(name, 'rb') as file:
+            data = file.read()
+        renditions = render_renditions(data, settings.AVATAR_SIZES, settings.AVATAR_QUALITY)
+    except (OSError, Image.DecompressionBombError) as error:
+        logger.warning('Не удалось подготовить миниатюры аватара %s: %s', name, error)
+        return False
+    store_renditions(name, renditions)
+    return True
+
+
+def avatar_sources(user, size):
+    """
+    Для вывода аватара пользователя шириной size: {'webp': srcset, 'jpg': srcset, 'src': url}
+    с вариантами 1x и 2x, или None, пока миниатюр нет.
+    """
+    name = user.avatar.name
+    if not name or user.avatar_renditions != name:
+        return None
+    sizes = sorted(settings.AVATAR_SIZES)
+
+    def pick(width):
+        return next((candidate for candidate in sizes if candidate >= width), sizes[-1])
+
+    one, two = pick(size), pick(size * 2)
+    sources = {}
+    for extension in FORMATS:
+        urls = [f'{default_storage.url(rendition_name(name, one, extension))} 1x']
+        if two != one:
+            urls.append(f'{default_storage.url(rendition_name(name, two, extension))} 2x')
+        sources[extension] = ', '.join(urls)
+    sources['src'] = default_storage.url(rendition_name(name, one, 'jpg'))
+    return sources
@@ -0,0 +1,9 @@
+"""Фоновые задания приложения users (выполняет manage.py runworker)"""
+from jobs.queue import job
+from .avatars import build_renditions
+
+
+@job(max_attempts=3)
+def build_avatar_renditions(name):
+    """Миниатюры загруженного аватара"""
+    build_renditions(name)
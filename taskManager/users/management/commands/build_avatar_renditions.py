@@ -0,0 +1,87 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from users.avatars import (
+    build_renditions, mark_renditions_ready, render_renditions, renditions_ready, store_renditions,
+)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Готовит миниатюры WebP/JPEG для уже загруженных аватаров, '
+        'включая аватар по умолчанию'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать миниатюры, даже если они уже есть',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count(),
+            help='Сколько процессов обрабатывают изображения (0 - в текущем процессе)',
+        )
+
+    def handle(self, *args, **options):
+        default = User._meta.get_field('avatar').get_default()
+        names = set(
+            User.objects.exclude(avatar__isnull=True).exclude(avatar='')
+            .values_list('avatar', flat=True).distinct().iterator()
+        )
+        names.add(default)
+        pending = []
+        for name in sorted(names):
+            if options['force'] or not renditions_ready(name):
+                pending.append(name)
+            else:
+                # Миниатюры уже в хранилище - достаточно отметить их у пользователей
+                mark_renditions_ready(name)
+        self.stdout.write(f'Аватаров: {len(names)}, без миниатюр: {len(pending)}')
+
+        done = failed = 0
+        if options['workers'] > 0:
+            done, failed = self._build_in_pool(pending, options['workers'])
+        else:
+            for name in pending:
+                if build_renditions(name):
+                    done += 1
+                else:
+                    failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Готово: миниатюры созданы для {done} аватаров'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'Не удалось обработать: {failed} (подробности в логе)'))
+
+    def _build_in_pool(self, names, workers):
+        """Декодирование в процессах пула; в работе не больше 4 изображений на процесс"""
+        done = failed = 0
+        window = workers * 4
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            for start in range(0, len(names), window):
+                futures = {}
+                for name in names[start:start + window]:
+                    try:
+                        with default_storage.open(name, 'rb') as file:
+                            data = file.read()
+                    except OSError as error:
+                        self.stderr.write(f'{name}: {error}')
+                        failed += 1
+                        continue
+                    futures[name] = pool.submit(
+                        render_renditions, data, settings.AVATAR_SIZES, settings.AVATAR_QUALITY
+                    )
+
+                for name, future in futures.items():
+                    try:
+                        store_renditions(name, future.result())
+                    except Exception as error:
+                        self.stderr.write(f'{name}: {error}')
+                        failed += 1
+                        continue
+                    done += 1
+                self.stdout.write(f'Обработано аватаров: {done + failed}/{len(names)}')
+        return done, failed
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from users.models import User
+from users.search import index_users
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс пользователей (UserSearchToken)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько пользователей индексировать за одну транзакцию',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users = User.objects.only('id', *User.SEARCH_FIELDS).order_by('id')
+
+        total = 0
+        last_id = 0
+        while True:
+            batch = list(users.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            index_users(batch)
+            total += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f'Проиндексировано пользователей: {total}')
+
+        self.stdout.write(self.style.SUCCESS(f'Готово: индекс построен для {total} пользователей'))
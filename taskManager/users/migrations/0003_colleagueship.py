@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_colleagueships(apps, schema_editor):
+    """Строит связи по уже принятым запросам в коллеги"""
+    ColleagueRequest = apps.get_model('users', 'ColleagueRequest')
+    Colleagueship = apps.get_model('users', 'Colleagueship')
+    pairs = ColleagueRequest.objects.filter(status='accepted').values_list('from_user_id', 'to_user_id')
+    edges = []
+    for from_user_id, to_user_id in pairs.iterator():
+        edges.append(Colleagueship(user_id=from_user_id, colleague_id=to_user_id))
+        edges.append(Colleagueship(user_id=to_user_id, colleague_id=from_user_id))
+    Colleagueship.objects.bulk_create(edges, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_colleaguerequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Colleagueship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('colleague', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Коллега',
+                'verbose_name_plural': 'Коллеги',
+                'unique_together': {('user', 'colleague')},
+            },
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='colleagues',
+            field=models.ManyToManyField(blank=True, through='users.Colleagueship', through_fields=('user', 'colleague'), to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_colleagueships, migrations.RunPython.noop),
+    ]
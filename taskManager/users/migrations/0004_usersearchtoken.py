@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_search_index(apps, schema_editor):
+    """Индексирует уже существующих пользователей"""
+    from users.search import tokenize
+
+    User = apps.get_model('users', 'User')
+    UserSearchToken = apps.get_model('users', 'UserSearchToken')
+    tokens = []
+    for user in User.objects.only('id', 'username', 'first_name', 'last_name').iterator():
+        for token, weight in tokenize(user.username, user.first_name, user.last_name).items():
+            tokens.append(UserSearchToken(user_id=user.id, token=token, weight=weight))
+    UserSearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_colleagueship'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=150)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Поисковый токен',
+                'verbose_name_plural': 'Поисковые токены',
+                'indexes': [models.Index(fields=['token', 'user'], name='users_search_token_idx')],
+                'unique_together': {('user', 'token')},
+            },
+        ),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
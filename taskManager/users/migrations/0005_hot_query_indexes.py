@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_usersearchtoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='colleaguerequest',
+            index=models.Index(fields=['to_user', 'status'], name='colleague_req_to_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='colleaguerequest',
+            index=models.Index(fields=['from_user', 'status'], name='colleague_req_from_status_idx'),
+        ),
+    ]
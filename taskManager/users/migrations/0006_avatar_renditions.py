@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_renditions',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
@@ -3,35 +3,75 @@ from django.contrib.auth.models import AbstractUser
 
 class User(AbstractUser):
     avatar = models.ImageField(upload_to='users', null=True, blank=True, default='users/anonimuser.jpg')
+    # Имя аватара, для которого готовы миниатюры (users/avatars.py); с другим именем - не готовы
+    avatar_renditions = models.CharField(max_length=100, blank=True, default='', editable=False)
     bio = models.TextField('Biography', null=True, blank=True)
+    colleagues = models.ManyToManyField(
+        'self',
+        through='Colleagueship',
+        through_fields=('user', 'colleague'),
+        symmetrical=True,
+        blank=True,
+    )
     
+    # Поля, из которых строится поисковый индекс (см. search.py)
+    SEARCH_FIELDS = ('username', 'first_name', 'last_name')
+
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Загруженные значения нужны, чтобы не переиндексировать пользователя без изменений
+        instance._loaded_search_values = tuple(instance.__dict__.get(name) for name in cls.SEARCH_FIELDS)
+        return instance
+
     def get_colleagues(self):
-        """Возвращает всех подтверждённых коллег пользователя"""
-        from django.db.models import Q
-        accepted = ColleagueRequest.objects.filter(
-            Q(from_user=self, status='accepted') |
-            Q(to_user=self, status='accepted')
-        ).select_related('from_user', 'to_user')
-        
-        colleagues = []
-        for req in accepted:
-            if req.from_user == self:
-                colleagues.append(req.to_user)
-            else:
-                colleagues.append(req.from_user)
-        return colleagues
+        """Возвращает всех подтверждённых коллег пользователя (QuerySet)"""
+        return self.colleagues.order_by('username')
+
+    def get_colleague_ids(self):
+        """Множество ID коллег (один запрос, кэшируется в объекте)"""
+        if getattr(self, '_colleague_ids', None) is None:
+            self._colleague_ids = set(
+                Colleagueship.objects.filter(user=self).values_list('colleague_id', flat=True)
+            )
+        return self._colleague_ids
 
     def is_colleague_with(self, other_user):
         """Проверяет, являются ли пользователи коллегами"""
-        from django.db.models import Q
-        return ColleagueRequest.objects.filter(
-            Q(from_user=self, to_user=other_user) |
-            Q(from_user=other_user, to_user=self),
-            status='accepted'
-        ).exists()
+        return other_user.pk in self.get_colleague_ids()
+
+    def get_relationships(self, users):
+        """
+        Состояние отношений с каждым из пользователей одним запросом:
+        {user_id: {'is_colleague': bool, 'pending_sent': запрос|None, 'pending_received': запрос|None}}.
+        users - пользователи или их ID.
+        """
+        user_ids = {getattr(user, 'pk', user) for user in users}
+        relations = {
+            user_id: {'is_colleague': False, 'pending_sent': None, 'pending_received': None}
+            for user_id in user_ids
+        }
+        if not user_ids:
+            return relations
+
+        requests = ColleagueRequest.objects.filter(
+            models.Q(from_user=self, to_user_id__in=user_ids) |
+            models.Q(to_user=self, from_user_id__in=user_ids),
+            status__in=['pending', 'accepted'],
+        )
+        for req in requests:
+            sent = req.from_user_id == self.pk
+            relation = relations[req.to_user_id if sent else req.from_user_id]
+            if req.status == 'accepted':
+                relation['is_colleague'] = True
+            elif sent:
+                relation['pending_sent'] = req
+            else:
+                relation['pending_received'] = req
+        return relations
 
     def get_pending_request_to(self, other_user):
         """Возвращает исходящий запрос к другому пользователю, если есть"""
@@ -67,8 +107,67 @@ class ColleagueRequest(models.Model):
     class Meta:
         unique_together = ['from_user', 'to_user']
         ordering = ['-created_at']
+        # Входящие и исходящие запросы пользователя по статусу
+        indexes = [
+            models.Index(fields=['to_user', 'status'], name='colleague_req_to_status_idx'),
+            models.Index(fields=['from_user', 'status'], name='colleague_req_from_status_idx'),
+        ]
         verbose_name = 'Запрос в коллеги'
         verbose_name_plural = 'Запросы в коллеги'
 
     def __str__(self):
-        return f"{self.from_user} → {self.to_user} ({self.get_status_display()})"
\ No newline at end of file
+        return f"{self.from_user} → {self.to_user} ({self.get_status_display()})"
+
+
+class Colleagueship(models.Model):
+    """
+    Связь «коллеги»: по строке на каждое направление, поэтому выборка
+    коллег пользователя и проверка пары идут по одному индексу.
+    Синхронизируется с принятыми ColleagueRequest (см. signals.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    colleague = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'colleague']
+        verbose_name = 'Коллега'
+        verbose_name_plural = 'Коллеги'
+
+    def __str__(self):
+        return f"{self.user_id} ↔ {self.colleague_id}"
+
+    @classmethod
+    def link(cls, first_id, second_id):
+        """Создаёт связь в обе стороны (повторный вызов ничего не меняет)"""
+        cls.objects.bulk_create([
+            cls(user_id=first_id, colleague_id=second_id),
+            cls(user_id=second_id, colleague_id=first_id),
+        ], ignore_conflicts=True)
+
+    @classmethod
+    def unlink(cls, first_id, second_id):
+        """Удаляет связь в обе стороны"""
+        cls.objects.filter(
+            models.Q(user_id=first_id, colleague_id=second_id) |
+            models.Q(user_id=second_id, colleague_id=first_id)
+        ).delete()
+
+
+class UserSearchToken(models.Model):
+    """
+    Поисковый индекс пользователей: нормализованные слова из username и имени.
+    Поиск по префиксу идёт диапазоном по индексу token, без сканирования таблицы.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=150)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        unique_together = ['user', 'token']
+        indexes = [models.Index(fields=['token', 'user'], name='users_search_token_idx')]
+        verbose_name = 'Поисковый токен'
+        verbose_name_plural = 'Поисковые токены'
+
+    def __str__(self):
+        return f"{self.token} → {self.user_id}"
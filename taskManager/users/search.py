@@ -0,0 +1,111 @@
+"""
+Поиск пользователей по таблице UserSearchToken.
+
+Каждое слово из username, имени и фамилии хранится отдельной строкой в нижнем
+регистре. Префиксный поиск - это диапазон token >= 'ив' AND token < 'ив\U0010ffff',
+который одинаково использует B-tree индекс в SQLite и PostgreSQL.
+Ранжирование: точное совпадение весит вдвое больше префиксного,
+совпадение в username - больше, чем в имени.
+"""
+import re
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Q, Value, When
+from .models import User, UserSearchToken
+
+WEIGHT_USERNAME = 3
+WEIGHT_NAME = 2
+
+# Ограничения запроса: лишние слова отбрасываются
+MAX_TERMS = 5
+PAGE_SIZE = 20
+
+TOKEN_MAX_LENGTH = UserSearchToken._meta.get_field('token').max_length
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Приводит текст к виду, в котором он хранится в индексе"""
+    return (text or '').casefold().replace('ё', 'е')
+
+
+def tokenize(username, first_name='', last_name=''):
+    """Токены пользователя с весами: {token: weight}"""
+    tokens = {}
+    username = normalize(username)
+    # Username целиком (с точками, @ и т.п.) и по словам
+    for token in [username, *_WORD_RE.findall(username)]:
+        tokens[token[:TOKEN_MAX_LENGTH]] = WEIGHT_USERNAME
+    for value in (first_name, last_name):
+        for token in _WORD_RE.findall(normalize(value)):
+            tokens.setdefault(token[:TOKEN_MAX_LENGTH], WEIGHT_NAME)
+    tokens.pop('', None)
+    return tokens
+
+
+def index_users(users):
+    """Перестраивает токены для переданных пользователей"""
+    users = list(users)
+    with transaction.atomic():
+        UserSearchToken.objects.filter(user__in=users).delete()
+        UserSearchToken.objects.bulk_create([
+            UserSearchToken(user=user, token=token, weight=weight)
+            for user in users
+            for token, weight in tokenize(user.username, user.first_name, user.last_name).items()
+        ], batch_size=1000)
+
+
+def parse_terms(query):
+    return _WORD_RE.findall(normalize(query))[:MAX_TERMS]
+
+
+def parse_cursor(value):
+    """Курсор страницы вида '<score>-<user_id>' или None"""
+    try:
+        score, user_id = (int(part) for part in (value or '').split('-'))
+    except ValueError:
+        return None
+    return score, user_id
+
+
+def _prefix(term):
+    return Q(token__gte=term, token__lt=term + '\U0010ffff')
+
+
+def find_users(query, exclude_id=None, cursor=None, limit=PAGE_SIZE):
+    """
+    Ищет пользователей, у которых каждое слово запроса совпадает с началом
+    какого-нибудь токена. Возвращает (пользователи по убыванию релевантности,
+    курсор следующей страницы или None).
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return [], None
+
+    matches = Q()
+    scores = {}
+    for i, term in enumerate(terms):
+        matches |= _prefix(term)
+        scores[f'term_{i}'] = Max(Case(
+            When(token=term, then=F('weight') * 2),
+            When(_prefix(term), then=F('weight')),
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+
+    rows = UserSearchToken.objects.filter(matches)
+    if exclude_id is not None:
+        rows = rows.exclude(user_id=exclude_id)
+    rows = rows.values('user_id').annotate(**scores).filter(
+        **{f'{name}__gt': 0 for name in scores}
+    ).annotate(score=sum((F(name) for name in scores), Value(0)))
+    if cursor:
+        score, user_id = cursor
+        rows = rows.filter(Q(score__lt=score) | Q(score=score, user_id__gt=user_id))
+    rows = list(rows.order_by('-score', 'user_id').values_list('user_id', 'score')[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = '{}-{}'.format(rows[-1][1], rows[-1][0])
+    users = User.objects.in_bulk([user_id for user_id, _ in rows])
+    return [users[user_id] for user_id, _ in rows if user_id in users], next_cursor
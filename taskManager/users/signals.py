@@ -0,0 +1,60 @@
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .avatars import renditions_ready
+from .models import ColleagueRequest, Colleagueship, User
+
+
+def _sync_colleagueship(request, deleted=False):
+    """Приводит связь пары пользователей в соответствие с их запросами"""
+    if request.status == 'accepted' and not deleted:
+        Colleagueship.link(request.from_user_id, request.to_user_id)
+        return
+    # Встречный запрос мог быть принят отдельно - тогда связь остаётся
+    still_accepted = ColleagueRequest.objects.filter(
+        Q(from_user_id=request.from_user_id, to_user_id=request.to_user_id) |
+        Q(from_user_id=request.to_user_id, to_user_id=request.from_user_id),
+        status='accepted',
+    ).exists()
+    if not still_accepted:
+        Colleagueship.unlink(request.from_user_id, request.to_user_id)
+
+
+@receiver(post_save, sender=ColleagueRequest)
+def colleague_request_saved(sender, instance, **kwargs):
+    _sync_colleagueship(instance)
+
+
+@receiver(post_delete, sender=ColleagueRequest)
+def colleague_request_deleted(sender, instance, **kwargs):
+    _sync_colleagueship(instance, deleted=True)
+
+
+@receiver(pre_save, sender=User)
+def inherit_avatar_renditions(sender, instance, **kwargs):
+    """Новый пользователь с уже обработанным аватаром (обычно общим по умолчанию) сразу получает миниатюры"""
+    name = instance.avatar.name
+    if instance._state.adding and name and instance.avatar_renditions != name and renditions_ready(name):
+        instance.avatar_renditions = name
+
+
+@receiver(post_save, sender=User)
+def reindex_user_for_search(sender, instance, created, update_fields=None, **kwargs):
+    """Обновляет поисковый индекс, только если изменились username или имя"""
+    from main.access import get_accessible_project_ids
+    from main.fragments import bump_project_versions
+    from main.stats import mark_projects_changed
+    from .search import index_users
+
+    if update_fields is not None and not set(update_fields) & set(User.SEARCH_FIELDS):
+        return
+    values = tuple(getattr(instance, name) for name in User.SEARCH_FIELDS)
+    loaded = getattr(instance, '_loaded_search_values', None)
+    if created or loaded != values:
+        index_users([instance])
+    if not created and loaded is not None and loaded[0] != instance.username:
+        # username выводится в кэшированных фрагментах и на страницах всех проектов пользователя
+        project_ids = get_accessible_project_ids(instance)
+        bump_project_versions(*project_ids)
+        mark_projects_changed(project_ids)
+    instance._loaded_search_values = values
@@ -0,0 +1,27 @@
+# users/templatetags/avatars.py
+from django import template
+from django.utils.html import format_html, format_html_join
+from users.avatars import avatar_sources
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar(user, size, **attrs):
+    """
+    Аватар шириной size пикселей: миниатюры WebP с запасным JPEG и вариантом 2x.
+        {% avatar user 28 class="rounded-circle" style="..." %}
+    Пока миниатюры не готовы - оригинал.
+    """
+    attributes = format_html_join(' ', '{}="{}"', sorted({'alt': '', **attrs}.items()))
+    sources = avatar_sources(user, int(size))
+    if sources is None:
+        return format_html('<img src="{}" {}>', user.avatar.url, attributes)
+    # display: contents - <picture> не создаёт своего блока и не ломает flex-разметку
+    return format_html(
+        '<picture style="display:contents">'
+        '<source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" width="{}" height="{}" loading="lazy" {}>'
+        '</picture>',
+        sources['webp'], sources['src'], sources['jpg'], size, size, attributes,
+    )
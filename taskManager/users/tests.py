@@ -1,3 +1,385 @@
-from django.test import TestCase
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from jobs.worker import drain
+from main.access import clear_local_cache
+from main.models import Project, ProjectMembership
+from .models import ColleagueRequest, Colleagueship, User, UserSearchToken
+from . import avatars, views
+from .search import find_users, parse_cursor
 
-# Create your tests here.
+
+@override_settings(SECURE_SSL_REDIRECT=False, QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=True)
+class ColleagueGraphTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', password='pass')
+        cls.bob = User.objects.create_user('bob', password='pass')
+        cls.carol = User.objects.create_user('carol', password='pass')
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.client.force_login(self.alice)
+
+    def befriend(self, first, second):
+        return ColleagueRequest.objects.create(from_user=first, to_user=second, status='accepted')
+
+    def fresh(self, user):
+        return User.objects.get(pk=user.pk)
+
+    def test_edges_follow_requests(self):
+        request = ColleagueRequest.objects.create(from_user=self.alice, to_user=self.bob)
+        self.assertFalse(self.fresh(self.alice).is_colleague_with(self.bob))
+
+        request.status = 'accepted'
+        request.save()
+        self.assertTrue(self.fresh(self.alice).is_colleague_with(self.bob))
+        self.assertTrue(self.fresh(self.bob).is_colleague_with(self.alice))
+        self.assertEqual(Colleagueship.objects.count(), 2)
+
+        self.client.post(reverse('users:remove_colleague', args=[self.bob.id]))
+        self.assertFalse(self.fresh(self.bob).is_colleague_with(self.alice))
+        self.assertFalse(Colleagueship.objects.exists())
+
+    def test_membership_check_is_cached(self):
+        self.befriend(self.alice, self.bob)
+        alice = self.fresh(self.alice)
+        with self.assertNumQueries(1):
+            self.assertTrue(alice.is_colleague_with(self.bob))
+            self.assertFalse(alice.is_colleague_with(self.carol))
+
+    def test_profile_uses_bounded_colleague_queries(self):
+        url = reverse('users:profile', args=[self.bob.username])
+        self.befriend(self.bob, self.alice)
+        response = self.client.get(url)
+        self.assertEqual(response.context['colleagues_count'], 1)
+
+        for i in range(10):
+            self.befriend(self.bob, User.objects.create_user(f'user{i}', password='pass'))
+        response = self.client.get(url)
+        self.assertEqual(response.context['colleagues_count'], 11)
+        self.assertEqual(len(response.context['colleagues']), 8)
+
+    def test_invite_lists_only_colleagues_outside_project(self):
+        self.befriend(self.alice, self.bob)
+        self.befriend(self.carol, self.alice)
+        project = Project.objects.create(name='Invite', created_by=self.alice)
+        ProjectMembership.objects.create(project=project, user=self.bob)
+
+        response = self.client.get(reverse('users:invite_to_project', args=[project.id]))
+        self.assertEqual(list(response.context['available_colleagues']), [self.carol])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=True)
+class RelationshipResolverTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.me = User.objects.create_user('me', password='pass')
+
+    def setUp(self):
+        self.client.force_login(self.me)
+
+    def search_queries(self, query):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('users:search_users'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_states_resolved_in_one_query(self):
+        colleague = User.objects.create_user('colleague', password='pass')
+        invited = User.objects.create_user('invited', password='pass')
+        inviter = User.objects.create_user('inviter', password='pass')
+        stranger = User.objects.create_user('stranger', password='pass')
+        ColleagueRequest.objects.create(from_user=colleague, to_user=self.me, status='accepted')
+        sent = ColleagueRequest.objects.create(from_user=self.me, to_user=invited)
+        received = ColleagueRequest.objects.create(from_user=inviter, to_user=self.me)
+
+        with self.assertNumQueries(1):
+            relations = self.me.get_relationships([colleague, invited, inviter, stranger.id])
+        self.assertTrue(relations[colleague.id]['is_colleague'])
+        self.assertEqual(relations[invited.id]['pending_sent'], sent)
+        self.assertEqual(relations[inviter.id]['pending_received'], received)
+        self.assertEqual(
+            relations[stranger.id],
+            {'is_colleague': False, 'pending_sent': None, 'pending_received': None},
+        )
+
+    def test_search_query_count_is_constant(self):
+        User.objects.create_user('match0', password='pass')
+        baseline, _ = self.search_queries('match')
+
+        for i in range(1, 15):
+            other = User.objects.create_user(f'match{i}', password='pass')
+            if i % 2:
+                ColleagueRequest.objects.create(from_user=other, to_user=self.me)
+        queries, response = self.search_queries('match')
+        self.assertEqual(queries, baseline)
+        self.assertEqual(len(response.context['results']), 15)
+
+
+class UserSearchIndexTests(TestCase):
+
+    def names(self, users):
+        return [user.username for user in users]
+
+    def test_prefix_match_and_ranking(self):
+        User.objects.create_user('ivan', first_name='Пётр')
+        User.objects.create_user('ivanova', first_name='Анна')
+        User.objects.create_user('petr', first_name='Иван', last_name='Иванов')
+        User.objects.create_user('ivanych', last_name='Иванченко')
+        User.objects.create_user('other')
+
+        users, _ = find_users('ivan')
+        self.assertEqual(self.names(users), ['ivan', 'ivanova', 'ivanych'])
+        users, _ = find_users('ИВАН')
+        self.assertEqual(self.names(users), ['petr', 'ivanych'])
+        users, _ = find_users('пётр')
+        self.assertEqual(self.names(users), ['ivan'])
+        users, _ = find_users('иван иванов')
+        self.assertEqual(self.names(users), ['petr'])
+        self.assertEqual(find_users('%'), ([], None))
+
+    def test_keyset_pages(self):
+        for i in range(5):
+            User.objects.create_user(f'page{i}')
+        seen = []
+        users, cursor = find_users('page', limit=2)
+        while True:
+            seen += self.names(users)
+            if not cursor:
+                break
+            users, cursor = find_users('page', cursor=parse_cursor(cursor), limit=2)
+        self.assertEqual(seen, [f'page{i}' for i in range(5)])
+
+    def test_index_follows_user_changes(self):
+        user = User.objects.create_user('renamed')
+        user = User.objects.get(pk=user.pk)
+        user.last_name = 'Смирнов'
+        user.save()
+        self.assertEqual(self.names(find_users('смир')[0]), ['renamed'])
+
+        with self.assertNumQueries(1):
+            user.save(update_fields=['last_login'])
+
+        UserSearchToken.objects.all().delete()
+        call_command('rebuild_user_search_index', stdout=StringIO())
+        self.assertEqual(self.names(find_users('смирнов')[0]), ['renamed'])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=True)
+class MyTasksTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('worker', password='pass')
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.client.force_login(self.user)
+
+    def add_project(self, name, statuses):
+        from main.models import Task
+
+        project = Project.objects.create(name=name, created_by=self.user)
+        for status in statuses:
+            Task.objects.create(
+                title=f'{name} {status}', project=project, created_by=self.user,
+                assigned_to=self.user, status=status, priority='high',
+            )
+        return project
+
+    def get(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('users:my_tasks'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_grouping_and_counters(self):
+        self.add_project('Small', ['done'])
+        self.add_project('Large', ['todo', 'in_progress', 'done'])
+        _, response = self.get()
+        groups = response.context['tasks_by_project']
+        self.assertEqual([group['project'].name for group in groups], ['Large', 'Small'])
+        self.assertEqual(groups[0]['stats'], {'total': 3, 'done': 1, 'in_progress': 1, 'todo': 1})
+        self.assertEqual(response.context['total_tasks'], 4)
+        self.assertEqual(response.context['done_count'], 2)
+        self.assertEqual(response.context['high_priority_count'], 4)
+        self.assertEqual(response.context['urgent_tasks_count'], 2)
+
+    def test_query_count_does_not_grow_with_projects(self):
+        self.add_project('First', ['todo'])
+        baseline, _ = self.get()
+        for i in range(6):
+            self.add_project(f'Project {i}', ['todo', 'done'])
+        queries, _ = self.get()
+        self.assertEqual(queries, baseline)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=True)
+class ProjectListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        from main.models import Task
+
+        cls.user = User.objects.create_user('lead', password='pass')
+        cls.member = User.objects.create_user('dev', password='pass')
+        for i, name in enumerate(['Beta', 'Alpha', 'Gamma']):
+            project = Project.objects.create(name=name, created_by=cls.user)
+            ProjectMembership.objects.create(project=project, user=cls.member)
+            for j in range(i + 1):
+                Task.objects.create(
+                    title=f'{name} {j}', project=project, created_by=cls.user,
+                    status='done' if j == 0 else 'todo',
+                )
+
+    def setUp(self):
+        cache.clear()
+        clear_local_cache()
+        self.client.force_login(self.user)
+
+    def names(self, response):
+        return [project.name for project in response.context['projects']]
+
+    def test_annotations_and_database_sorting(self):
+        url = reverse('users:project_list')
+        response = self.client.get(url, {'sort': '-task_count'})
+        self.assertEqual(self.names(response), ['Gamma', 'Alpha', 'Beta'])
+        gamma = response.context['projects'][0]
+        self.assertEqual((gamma.task_count, gamma.done_count, gamma.team_count), (3, 1, 1))
+        self.assertEqual(self.names(self.client.get(url, {'sort': 'name'})), ['Alpha', 'Beta', 'Gamma'])
+
+    def test_keyset_pages(self):
+        url = reverse('users:project_list')
+        with mock.patch.object(views, 'PROJECTS_PER_PAGE', 2):
+            first = self.client.get(url, {'sort': 'task_count'})
+            second = self.client.get(url, {'sort': 'task_count', 'after': first.context['next_cursor']})
+        self.assertEqual(self.names(first), ['Beta', 'Alpha'])
+        self.assertEqual(self.names(second), ['Gamma'])
+        self.assertIsNone(second.context['next_cursor'])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AvatarRenditionTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = Path(media.name)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('pictured', password='pass')
+
+    def image_bytes(self, image_format='JPEG', size=(600, 400), mode='RGB'):
+        image = Image.new(mode, size, 'red')
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        buffer = BytesIO()
+        image.save(buffer, image_format, exif=exif)
+        return buffer.getvalue()
+
+    def test_renditions_are_square_and_stripped(self):
+        renditions = avatars.render_renditions(self.image_bytes(), (32, 64, 128), 80)
+        self.assertEqual(set(renditions), {(size, ext) for size in (32, 64, 128) for ext in ('webp', 'jpg')})
+        for (size, extension), data in renditions.items():
+            with Image.open(BytesIO(data)) as image:
+                self.assertEqual(image.size, (size, size))
+                self.assertEqual(image.format, avatars.FORMATS[extension])
+                self.assertFalse(image.getexif())
+        # Прозрачный PNG кладётся на белый фон
+        transparent = avatars.render_renditions(self.image_bytes('PNG', mode='RGBA'), (32,), 80)
+        self.assertEqual(len(transparent), 2)
+
+    def test_upload_builds_renditions_for_srcset(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('me.jpg', self.image_bytes(), content_type='image/jpeg')
+        self.client.post(reverse('users:edit_profile'), {'avatar': upload})
+        self.user.refresh_from_db()
+        name = self.user.avatar.name
+        self.assertFalse(avatars.renditions_ready(name))
+        self.assertEqual(drain().processed, 1)
+        for size in settings.AVATAR_SIZES:
+            self.assertTrue((self.media_root / avatars.rendition_name(name, size, 'webp')).exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_renditions, name)
+
+        # Готовность берётся из строки пользователя, хранилище при выводе не опрашивается
+        with mock.patch.object(avatars.default_storage, 'exists') as exists:
+            html = self.client.get(reverse('users:profile', args=[self.user.username])).content.decode()
+        exists.assert_not_called()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f'{avatars.rendition_name(name, 32, "webp")} 1x, ', html)
+        self.assertIn(f'{avatars.rendition_name(name, 64, "webp")} 2x', html)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_ready_renditions_change_project_page_version(self):
+        owner = User.objects.create_user('owner', password='pass')
+        project = Project.objects.create(name='Faces', created_by=owner)
+        ProjectMembership.objects.create(project=project, user=self.user)
+        self.user.avatar = 'users/face.jpg'
+        self.user.save()
+        self.client.force_login(owner)
+        url = reverse('main:project_detail', args=[project.id])
+        self.client.get(url)  # первый ответ выдаёт cookie CSRF, а его значение входит в ETag
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        # Аватар участника выводится на странице проекта: с миниатюрами он уже другой
+        avatars.mark_renditions_ready('users/face.jpg')
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_renditions_do_not_collide_with_uploads(self):
+        # Файл пользователя с «миниатюрным» именем не перезаписывается и не удаляется
+        upload = self.media_root / 'users' / 'me.64px.jpg'
+        upload.parent.mkdir(parents=True)
+        upload.write_bytes(b'user file')
+        avatars.store_renditions('users/me.jpg', avatars.render_renditions(self.image_bytes(), (64,), 80))
+        self.assertEqual(upload.read_bytes(), b'user file')
+        self.assertTrue(avatars.rendition_name('users/me.jpg', 64, 'jpg').startswith(avatars.RENDITIONS_DIR + '/'))
+
+        # Новый файл с тем же именем снова ждёт миниатюр
+        self.user.avatar = 'users/me.jpg'
+        self.user.avatar_renditions = 'users/me.jpg'
+        self.user.save()
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('me.jpg', self.image_bytes(), content_type='image/jpeg')
+        self.client.post(reverse('users:edit_profile'), {'avatar': upload})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_renditions, '')
+
+    def test_backfill_includes_default_avatar(self):
+        default = User._meta.get_field('avatar').get_default()
+        target = self.media_root / default
+        target.parent.mkdir(parents=True)
+        target.write_bytes(self.image_bytes())
+        User.objects.create_user('broken', password='pass', avatar='users/missing.jpg')
+
+        out = StringIO()
+        call_command('build_avatar_renditions', workers=1, stdout=out, stderr=StringIO())
+        self.assertIn('без миниатюр: 2', out.getvalue())
+        self.assertTrue(avatars.renditions_ready(default))
+        self.assertIn('Не удалось обработать: 1', out.getvalue())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_renditions, default)
+        # Новые пользователи с аватаром по умолчанию получают готовые миниатюры сразу
+        self.assertEqual(User.objects.create_user('newcomer').avatar_renditions, default)
+
+        out = StringIO()
+        with self.assertLogs('users.avatars', 'WARNING'):
+            call_command('build_avatar_renditions', workers=0, stdout=out, stderr=StringIO())
+        self.assertIn('без миниатюр: 1', out.getvalue())
@@ -1,12 +1,21 @@
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Count, Q
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from main.models import Project, Task, ProjectMembership
+from main.access import get_accessible_project_ids
+from main.asyncdb import get_request_user, run_concurrently
+from main.conditional import conditional_page, user_pages_version
+from main.pagination import paginate_keyset
+from main.stats import ACTIVE_STATUSES
 from .forms import RegisterForm
+from .jobs import build_avatar_renditions
 from .models import User, ColleagueRequest
+from .search import find_users, parse_cursor
 
 
 # ─────────────────────────── AUTH ───────────────────────────
@@ -47,55 +56,114 @@ def register_view(request):
 
 # ─────────────────────────── PROJECTS / TASKS ───────────────────────────
 
+# Сортировки списка проектов; id в конце делает порядок однозначным для курсора
+PROJECT_SORT_ORDERS = {
+    '-created_at': ('-created_at', '-id'),
+    'created_at': ('created_at', 'id'),
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+    '-task_count': ('-task_count', '-id'),
+    'task_count': ('task_count', 'id'),
+}
+
+PROJECTS_PER_PAGE = 30
+
+
 @login_required
 def project_list(request):
+    """
+    Проекты пользователя со статистикой. Счётчики берутся из ProjectStats
+    одним JOIN, сортировка и постраничный вывод - на стороне БД.
+    """
+    sort_by = request.GET.get('sort', '')
+    if sort_by not in PROJECT_SORT_ORDERS:
+        sort_by = '-created_at'
+
+    members = ProjectMembership.objects.filter(project=OuterRef('pk')).order_by().values(
+        'project'
+    ).annotate(n=Count('id')).values('n')
     projects = Project.objects.filter(
-        Q(created_by=request.user) | Q(team_members=request.user)
-    ).distinct().select_related('created_by')
-
-    projects_with_stats = []
-    for project in projects:
-        task_count = project.tasks.count()
-        team_count = project.team_members.count()
-        done_count = project.tasks.filter(status='done').count()
-        high_priority_count = project.tasks.filter(
-            priority='high', status__in=['todo', 'in_progress']
-        ).count()
-        last_task = project.tasks.order_by('-updated_at').first()
-        last_updated = last_task.updated_at if last_task else project.created_at
-
-        project.task_count = task_count
-        project.team_count = team_count
-        project.done_count = done_count
-        project.high_priority_count = high_priority_count
-        project.last_updated = last_updated
-        projects_with_stats.append(project)
+        id__in=get_accessible_project_ids(request.user)
+    ).select_related('created_by').annotate(
+        task_count=Coalesce('stats__total', 0),
+        done_count=Coalesce('stats__done', 0),
+        high_priority_count=Coalesce('stats__high_active', 0),
+        team_count=Coalesce(Subquery(members), 0),
+        last_updated=Coalesce('stats__last_activity', 'created_at'),
+    )
+    projects, next_cursor = paginate_keyset(
+        projects, PROJECT_SORT_ORDERS[sort_by], request.GET.get('after'), PROJECTS_PER_PAGE
+    )
 
-    sort_by = request.GET.get('sort', '')
-    sort_map = {
-        'name': lambda x: x.name,
-        '-name': (lambda x: x.name, True),
-        '-created_at': (lambda x: x.created_at, True),
-        'created_at': lambda x: x.created_at,
-        '-task_count': (lambda x: x.task_count, True),
-        'task_count': lambda x: x.task_count,
-    }
-    if sort_by in sort_map:
-        val = sort_map[sort_by]
-        if isinstance(val, tuple):
-            projects_with_stats.sort(key=val[0], reverse=True)
-        else:
-            projects_with_stats.sort(key=val)
-    else:
-        projects_with_stats.sort(key=lambda x: x.created_at, reverse=True)
+    return render(request, 'users/profile_projects.html', {
+        'projects': projects,
+        'sort_by': sort_by,
+        'next_cursor': next_cursor,
+    })
 
-    return render(request, 'users/profile_projects.html', {'projects': projects_with_stats})
 
+# Задачи пользователя читаются порциями, чтобы не держать весь курсор в памяти
+MY_TASKS_CHUNK_SIZE = 2000
 
-@login_required
-def my_tasks(request):
+# Сортировки «Моих задач» по GET-параметру sort
+MY_TASKS_SORT_ORDERS = {
+    'due_date': 'due_date',
+    '-due_date': '-due_date',
+    '-created_at': '-created_at',
+    'created_at': 'created_at',
+    'priority': 'priority',
+}
+
+# Сколько срочных задач показывать в боковой панели
+URGENT_TASKS_LIMIT = 5
+
+
+def _group_my_tasks(tasks, today):
+    """
+    Один проход по задачам (в нужном порядке): группировка по проектам,
+    счётчики по статусам/приоритетам/просрочке и список срочных задач.
+    """
+    counters = {name: 0 for name in (
+        'total', 'todo', 'in_progress', 'review', 'done', 'overdue', 'high', 'medium', 'low',
+    )}
+    groups = {}
+    urgent_tasks = []
+    for task in tasks:
+        active = task.status in ACTIVE_STATUSES
+        counters['total'] += 1
+        counters[task.status] += 1
+        counters[task.priority] += 1
+        if active and task.due_date and task.due_date < today:
+            counters['overdue'] += 1
+        if active and task.priority == 'high' and len(urgent_tasks) < URGENT_TASKS_LIMIT:
+            urgent_tasks.append(task)
+
+        group = groups.get(task.project_id)
+        if group is None:
+            group = groups[task.project_id] = {
+                'project': task.project,
+                'tasks': [],
+                'stats': {'total': 0, 'done': 0, 'in_progress': 0, 'todo': 0},
+            }
+        group['tasks'].append(task)
+        group['stats']['total'] += 1
+        if task.status in group['stats']:
+            group['stats'][task.status] += 1
+
+    # Проекты по алфавиту, затем по количеству задач (сортировка устойчивая)
+    tasks_by_project = sorted(groups.values(), key=lambda group: group['project'].name)
+    tasks_by_project.sort(key=lambda group: group['stats']['total'], reverse=True)
+    return {
+        'tasks_by_project': tasks_by_project,
+        'urgent_tasks': urgent_tasks,
+        'counters': counters,
+    }
+
+
+def _my_tasks_queryset(request, user):
+    """Задачи пользователя по GET-параметрам status и sort: (queryset, status, sort)"""
     tasks = Task.objects.filter(
-        assigned_to=request.user
+        assigned_to=user
     ).select_related('project', 'created_by').order_by('-created_at')
 
     status_filter = request.GET.get('status', '')
@@ -103,101 +171,84 @@ def my_tasks(request):
         tasks = tasks.filter(status=status_filter)
 
     sort_by = request.GET.get('sort', '')
-    sort_map = {
-        'due_date': 'due_date',
-        '-due_date': '-due_date',
-        '-created_at': '-created_at',
-        'created_at': 'created_at',
-        'priority': 'priority',
-    }
-    tasks = tasks.order_by(sort_map.get(sort_by, '-created_at'))
+    tasks = tasks.order_by(MY_TASKS_SORT_ORDERS.get(sort_by, '-created_at'))
+    return tasks, status_filter, sort_by
+
+
+@login_required
+@conditional_page(user_pages_version)
+async def my_tasks(request):
+    user = await get_request_user(request)
+    tasks, status_filter, sort_by = _my_tasks_queryset(request, user)
 
-    projects = Project.objects.filter(
-        Q(created_by=request.user) | Q(team_members=request.user)
-    ).distinct()
-
-    tasks_by_project = []
-    project_ids = tasks.values_list('project_id', flat=True).distinct()
-    for project in Project.objects.filter(id__in=project_ids):
-        project_tasks = tasks.filter(project=project)
-        if project_tasks.exists():
-            tasks_by_project.append({
-                'project': project,
-                'tasks': list(project_tasks),
-                'stats': {
-                    'total': project_tasks.count(),
-                    'done': project_tasks.filter(status='done').count(),
-                    'in_progress': project_tasks.filter(status='in_progress').count(),
-                    'todo': project_tasks.filter(status='todo').count(),
-                }
-            })
-    tasks_by_project.sort(key=lambda x: x['stats']['total'], reverse=True)
-
-    urgent_tasks = tasks.filter(priority='high', status__in=['todo', 'in_progress'])[:5]
     today = timezone.now().date()
+    summary, first_project_id = await run_concurrently(
+        lambda: _group_my_tasks(tasks.iterator(chunk_size=MY_TASKS_CHUNK_SIZE), today),
+        # Проект для кнопки «Новая задача» - первый по алфавиту из доступных
+        lambda: Project.objects.filter(
+            id__in=get_accessible_project_ids(user)
+        ).values_list('id', flat=True).first(),
+    )
+    counters = summary['counters']
 
     context = {
-        'tasks_by_project': tasks_by_project,
-        'urgent_tasks': urgent_tasks,
-        'urgent_tasks_count': urgent_tasks.count(),
-        'projects': projects,
+        'tasks_by_project': summary['tasks_by_project'],
+        'urgent_tasks': summary['urgent_tasks'],
+        'urgent_tasks_count': len(summary['urgent_tasks']),
+        'first_project_id': first_project_id,
         'status_filter': status_filter,
         'sort_by': sort_by,
         'today': today,
-        'total_tasks': tasks.count(),
-        'todo_count': tasks.filter(status='todo').count(),
-        'in_progress_count': tasks.filter(status='in_progress').count(),
-        'review_count': tasks.filter(status='review').count(),
-        'done_count': tasks.filter(status='done').count(),
-        'overdue_count': tasks.filter(due_date__lt=today, status__in=['todo', 'in_progress']).count(),
-        'high_priority_count': tasks.filter(priority='high').count(),
-        'medium_priority_count': tasks.filter(priority='medium').count(),
-        'low_priority_count': tasks.filter(priority='low').count(),
+        'total_tasks': counters['total'],
+        'todo_count': counters['todo'],
+        'in_progress_count': counters['in_progress'],
+        'review_count': counters['review'],
+        'done_count': counters['done'],
+        'overdue_count': counters['overdue'],
+        'high_priority_count': counters['high'],
+        'medium_priority_count': counters['medium'],
+        'low_priority_count': counters['low'],
     }
-    return render(request, 'users/profile_tasks.html', context)
+    return await sync_to_async(render)(request, 'users/profile_tasks.html', context)
 
 
 # ─────────────────────────── PROFILE ───────────────────────────
 
 @login_required
-def profile_view(request, username):
+async def profile_view(request, username):
     """Профиль пользователя — видят все авторизованные."""
-    profile_user = get_object_or_404(User, username=username)
-    me = request.user
-
-    # Статус коллегства
-    is_colleague = me.is_colleague_with(profile_user)
-    pending_sent = me.get_pending_request_to(profile_user)
-    pending_received = ColleagueRequest.objects.filter(
-        from_user=profile_user, to_user=me, status='pending'
-    ).first()
-
-    # Публичные проекты (только те, где profile_user — создатель или участник)
-    user_projects = Project.objects.filter(
-        Q(created_by=profile_user) | Q(team_members=profile_user)
-    ).distinct().select_related('created_by')[:6]
-
-    # Статистика задач
-    task_stats = Task.objects.filter(assigned_to=profile_user).aggregate(
-        total=Count('id'),
-        done=Count('id', filter=Q(status='done')),
-        in_progress=Count('id', filter=Q(status='in_progress')),
+    me = await get_request_user(request)
+    profile_user = await aget_object_or_404(User, username=username)
+
+    relation, user_projects, task_stats, colleagues, colleagues_count = await run_concurrently(
+        # Статус коллегства
+        lambda: me.get_relationships([profile_user])[profile_user.id],
+        # Публичные проекты (только те, где profile_user — создатель или участник)
+        lambda: list(Project.objects.filter(
+            id__in=get_accessible_project_ids(profile_user)
+        ).select_related('created_by')[:6]),
+        # Статистика задач
+        lambda: Task.objects.filter(assigned_to=profile_user).aggregate(
+            total=Count('id'),
+            done=Count('id', filter=Q(status='done')),
+            in_progress=Count('id', filter=Q(status='in_progress')),
+        ),
+        lambda: list(profile_user.get_colleagues()[:8]),
+        lambda: profile_user.colleagues.count(),
     )
 
-    colleagues = profile_user.get_colleagues()
-
     context = {
         'profile_user': profile_user,
         'is_own_profile': me == profile_user,
-        'is_colleague': is_colleague,
-        'pending_sent': pending_sent,
-        'pending_received': pending_received,
+        'is_colleague': relation['is_colleague'],
+        'pending_sent': relation['pending_sent'],
+        'pending_received': relation['pending_received'],
         'user_projects': user_projects,
         'task_stats': task_stats,
-        'colleagues': colleagues[:8],
-        'colleagues_count': len(colleagues),
+        'colleagues': colleagues,
+        'colleagues_count': colleagues_count,
     }
-    return render(request, 'users/profile.html', context)
+    return await sync_to_async(render)(request, 'users/profile.html', context)
 
 
 @login_required
@@ -208,9 +259,14 @@ def edit_profile(request):
         user.first_name = request.POST.get('first_name', '').strip()
         user.last_name = request.POST.get('last_name', '').strip()
         user.bio = request.POST.get('bio', '').strip()
-        if 'avatar' in request.FILES:
+        avatar_uploaded = 'avatar' in request.FILES
+        if avatar_uploaded:
             user.avatar = request.FILES['avatar']
+            # Миниатюры нового файла ещё не готовы, даже если имя совпало с прежним
+            user.avatar_renditions = ''
         user.save()
+        if avatar_uploaded:
+            build_avatar_renditions.delay(user.avatar.name)
         messages.success(request, 'Профиль успешно обновлён!')
         return redirect('users:profile', username=user.username)
     return render(request, 'users/edit_profile.html', {'user': request.user})
@@ -310,32 +366,22 @@ def remove_colleague(request, user_id):
 def search_users(request):
     """Поиск пользователей по username / имени."""
     query = request.GET.get('q', '').strip()
-    results = []
+    results, next_cursor = [], None
     if query:
-        results = User.objects.filter(
-            Q(username__icontains=query) |
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query)
-        ).exclude(id=request.user.id)[:20]
-
-    # Для каждого результата определяем статус
-    enriched = []
-    for u in results:
-        is_colleague = request.user.is_colleague_with(u)
-        pending_sent = request.user.get_pending_request_to(u)
-        pending_received = ColleagueRequest.objects.filter(
-            from_user=u, to_user=request.user, status='pending'
-        ).first()
-        enriched.append({
-            'user': u,
-            'is_colleague': is_colleague,
-            'pending_sent': pending_sent,
-            'pending_received': pending_received,
-        })
+        results, next_cursor = find_users(
+            query,
+            exclude_id=request.user.id,
+            cursor=parse_cursor(request.GET.get('after')),
+        )
+
+    # Статус отношений со всеми найденными - одним запросом
+    relations = request.user.get_relationships(results)
+    enriched = [{'user': u, **relations[u.id]} for u in results]
 
     return render(request, 'users/search.html', {
         'query': query,
         'results': enriched,
+        'next_cursor': next_cursor,
     })
 
 
@@ -360,10 +406,9 @@ def invite_to_project(request, project_id):
         raise PermissionDenied("У вас нет прав для приглашения участников")
 
     # Коллеги, которых ещё нет в проекте
-    all_colleagues = request.user.get_colleagues()
-    existing_ids = set(project.team_members.values_list('id', flat=True))
-    existing_ids.add(project.created_by.id)
-    available_colleagues = [u for u in all_colleagues if u.id not in existing_ids]
+    available_colleagues = request.user.get_colleagues().exclude(
+        projects=project
+    ).exclude(id=project.created_by_id)
 
     if request.method == 'POST':
         user_id = request.POST.get('user_id')
@@ -374,7 +419,7 @@ def invite_to_project(request, project_id):
         # Проверяем: пользователь должен быть коллегой
         if not request.user.is_colleague_with(invited_user) and project.created_by != request.user:
             messages.error(request, 'Можно приглашать только коллег')
-            return redirect('main:invite_to_project', project_id=project_id)
+            return redirect('users:invite_to_project', project_id=project_id)
 
         if project.team_members.filter(id=invited_user.id).exists():
             messages.error(request, f'{invited_user.username} уже в проекте!')